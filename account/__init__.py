@@ -5,14 +5,20 @@ from .account import (
     ExternalCounterparty,
     RegularAccount,
     RegularSubAccount,
+    StripeSubAccount,
     SubAccount,
 )
-from .base import Entity, Repository
+from .base import AsyncRepository, Entity, Repository
 from .card import Card
-from .repository import AccountRepository
+from .columns import TransactionColumns
+from .repository import AccountRepository, AsyncAccountRepository
 from .services import (
     AccountTransferService,
+    AsyncAccountTransferService,
+    AsyncCardPurchaseService,
+    AsyncTransactionSettlementService,
     CardPurchaseService,
+    StripeRollupService,
     TransactionSettlementService,
 )
 from .transaction import Transaction
@@ -22,6 +28,11 @@ __all__ = (
     'Account',
     'AccountRepository',
     'AccountTransferService',
+    'AsyncAccountRepository',
+    'AsyncAccountTransferService',
+    'AsyncCardPurchaseService',
+    'AsyncRepository',
+    'AsyncTransactionSettlementService',
     'AUD',
     'Card',
     'CardSubAccount',
@@ -32,7 +43,10 @@ __all__ = (
     'RegularAccount',
     'RegularSubAccount',
     'Repository',
+    'StripeRollupService',
+    'StripeSubAccount',
     'SubAccount',
     'Transaction',
+    'TransactionColumns',
     'TransactionSettlementService',
 )
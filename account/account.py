@@ -3,35 +3,95 @@ from __future__ import annotations
 
 from copy import deepcopy
 from functools import reduce
-from typing import Iterable, List
-from uuid import UUID
+from typing import AbstractSet, Dict, Iterable, Iterator, List, Set, Union
+from uuid import UUID, uuid4
 
 from .base import Entity
 from .card import Card
+from .columns import TransactionColumns
+from .lazy import LazyTransactions
 from .transaction import Transaction, TransactionStatus, TransactionType
-from .values import AUD, Balance, CardNumber
+from .values import AUD, Balance, CardNumber, ZERO
+
+
+# The transactions of a subaccount are either kept as a list of Transaction
+# objects or, more compactly, as TransactionColumns. Either may be loaded
+# lazily, behind LazyTransactions.
+Transactions = Union[List[Transaction], TransactionColumns, LazyTransactions]
 
 
 class SubAccount(Entity):
     """A subaccount of an account. Contains a group of transactions and
     potentially some additional behaviour which is provided by subclasses.
 
+    The balance is kept as a running total, which is updated as transactions
+    are added and settled, so does not need to be recalculated from the
+    transactions. If it is already known, e.g. because it was stored, it can
+    be passed in rather than calculated when the subaccount is created.
+
+    It keeps track of the transactions which have been added or settled since
+    it was last saved, so that a repository only has to write those.
+
+    If compact_transactions is set, the transactions are kept in a
+    TransactionColumns rather than a list. A TransactionColumns or
+    LazyTransactions may also be passed in as the transactions, in which case
+    it is used as is. Adding and settling transactions do not need the whole
+    history, so do not load LazyTransactions.
+
+    Settled transactions may have been compacted away into a checkpoint, in
+    which case the opening balance is the sum of the transactions which are
+    no longer kept, and the balance is the opening balance plus the sum of
+    the transactions which are.
+
     """
 
+    class BalanceMismatch(Exception):
+        """Used when verifying balances, if the running balance does not
+        match the sum of the transactions.
+
+        """
+        pass
+
+    # Determines whether or not the running balance is checked against the
+    # sum of the transactions whenever it is used.
+    verify_balances = False
+
+    # Determines whether or not transactions are kept in TransactionColumns
+    # rather than a list of Transaction objects.
+    compact_transactions = False
+
     def __init__(self,
                  id: UUID = None,
-                 transactions: Iterable[Transaction] = None) -> None:
+                 transactions: Iterable[Transaction] = None,
+                 balance: Balance = None,
+                 opening: Balance = None) -> None:
         super(SubAccount, self).__init__(id=id)
 
-        self.transactions: List[Transaction]
-        if transactions is None:
+        self._opening = opening if opening is not None else Balance()
+
+        self.transactions: Transactions
+        if isinstance(transactions, (TransactionColumns, LazyTransactions)):
+            self.transactions = transactions
+        elif self.compact_transactions:
+            self.transactions = TransactionColumns(transactions or ())
+        elif transactions is None:
             self.transactions = []
         else:
             self.transactions = list(transactions)
 
+        self._balance = balance if balance is not None else \
+            self.calculate_balance()
+
+        # The transactions which have been added or settled since the
+        # subaccount was last saved, by their IDs.
+        self._unsaved: Dict[UUID, Transaction] = {}
+
     def __copy__(self) -> SubAccount:
         new_copy = type(self)(id=self.id)
         new_copy.transactions = self.transactions
+        new_copy._opening = self._opening
+        new_copy._balance = self._balance
+        new_copy._unsaved = self._unsaved
 
         return new_copy
 
@@ -42,33 +102,148 @@ class SubAccount(Entity):
 
         new_id = deepcopy(self.id)
         new_account = type(self)(id=new_id)
-        new_account.transactions = deepcopy(self.transactions)
+        new_account.transactions = deepcopy(self.transactions, memo)
+        new_account._opening = self._opening
+        new_account._balance = self._balance
+        # The transactions were copied first, so these refer to the copies.
+        new_account._unsaved = deepcopy(self._unsaved, memo)
 
         return new_account
 
+    def calculate_balance(self) -> Balance:
+        """Calculate the balance of this subaccount from scratch, as the
+        opening balance plus the sum of the transactions.
+
+        Returns a Balance value object.
+
+        """
+
+        if isinstance(self.transactions, TransactionColumns):
+            return self._opening + self.transactions.balance()
+
+        return reduce(lambda s, t: t.adjust(s), self.transactions,
+                      self._opening)
+
+    def verify_balance(self) -> None:
+        """Check that the running balance matches the sum of the
+        transactions, raising BalanceMismatch if it does not.
+
+        """
+
+        calculated = self.calculate_balance()
+        if calculated != self._balance:
+            raise SubAccount.BalanceMismatch(
+                'Subaccount {} has a running balance of {!r} but its '
+                'transactions add up to {!r}.'
+                .format(self.id, self._balance, calculated)
+            )
+
+    @property
+    def opening(self) -> Balance:
+        """The sum of the transactions which have been compacted away."""
+
+        return self._opening
+
     @property
-    def balance(self):
-        """Calculate the balance of this subaccount. The balance is the sum of
-        the transactions.
+    def balance(self) -> Balance:
+        """The balance of this subaccount, i.e. the sum of the transactions.
 
         Returns a Balance value object.
         """
-        # Balance() is the same as Balance(available=AUD(0), pending=AUD(0)).
-        return reduce(lambda s, t: t.adjust(s), self.transactions, Balance())
+
+        if self.verify_balances:
+            self.verify_balance()
+
+        return self._balance
+
+    def add_transaction(self, transaction: Transaction) -> None:
+        """Add a transaction to this subaccount.
+
+        Takes one argument:
+        - transaction: The transaction to add.
+
+        """
+
+        self.transactions.append(transaction)
+        self._unsaved[transaction.id] = transaction
+        self._balance = transaction.adjust(self._balance)
 
     def settle(self,
-               reference: UUID) -> None:
+               reference: UUID) -> bool:
         """Settle a transaction. Fail silently if there is no transaction with
         the provided reference.
 
         Takes one argument:
         - reference: The reference of the transaction to settle.
 
+        Returns whether there was a transaction with the reference.
+
         """
 
-        for t in self.transactions:
-            if t.reference == reference:
-                t.settle()
+        found = False
+        for t in self._with_reference(reference):
+            self._settle(t)
+            found = True
+
+        return found
+
+    def settle_many(self, references: AbstractSet[UUID]) -> Set[UUID]:
+        """Settle the transactions with any of a number of references, in a
+        single pass over the transactions. Fail silently for references with
+        no transaction.
+
+        Takes one argument:
+        - references: The references of the transactions to settle.
+
+        Returns the references which had transactions.
+
+        """
+
+        found: Set[UUID] = set()
+        for t in self._with_references(references):
+            self._settle(t)
+            found.add(t.reference)
+
+        return found
+
+    def _settle(self, transaction: Transaction) -> None:
+        pending = transaction.adjust(Balance())
+        transaction.settle()
+        self._balance = transaction.adjust(self._balance - pending)
+        self._unsaved[transaction.id] = transaction
+
+    def _with_reference(self, reference: UUID) -> Iterator[Transaction]:
+        if isinstance(self.transactions, (TransactionColumns,
+                                          LazyTransactions)):
+            return self.transactions.with_reference(reference)
+
+        return (t for t in self.transactions if t.reference == reference)
+
+    def _with_references(
+            self, references: AbstractSet[UUID]) -> Iterator[Transaction]:
+        if isinstance(self.transactions, (TransactionColumns,
+                                          LazyTransactions)):
+            return self.transactions.with_references(references)
+
+        return (t for t in self.transactions if t.reference in references)
+
+    def unsaved_transactions(self) -> List[Transaction]:
+        """Find the transactions which have been added or settled since the
+        subaccount was last saved.
+
+        """
+
+        return list(self._unsaved.values())
+
+    def mark_saved(self) -> None:
+        """Record that every transaction has been saved. Called by
+        repositories once they have written the unsaved transactions.
+
+        """
+
+        self._unsaved.clear()
+        if isinstance(self.transactions, LazyTransactions):
+            self.transactions.mark_saved()
 
 
 class RegularSubAccount(SubAccount):
@@ -88,8 +263,11 @@ class CardSubAccount(SubAccount):
     def __init__(self,
                  id: UUID = None,
                  transactions: Iterable[Transaction] = None,
-                 card: Card = None) -> None:
-        super(CardSubAccount, self).__init__(id, transactions)
+                 card: Card = None,
+                 balance: Balance = None,
+                 opening: Balance = None) -> None:
+        super(CardSubAccount, self).__init__(id, transactions, balance,
+                                             opening)
 
         if card is None:
             raise ValueError("Cannot create a card account without a card.")
@@ -97,9 +275,26 @@ class CardSubAccount(SubAccount):
         self.card = card
 
 
+class StripeSubAccount(SubAccount):
+    """One of the sub-ledgers of a striped account. Credits to the account
+    are spread across its stripes, so that they do not all change the same
+    subaccount, and the stripes are periodically rolled up into the regular
+    subaccount.
+
+    """
+    pass
+
+
 class Account(Entity):
     """An Aggregate root representing multiple annotated collections of
-    transactions."""
+    transactions.
+
+    The card subaccounts are indexed by card number, so finding the one for
+    a card does not search the subaccounts. Subaccounts added after the
+    account is created must be added with add_subaccount to keep the index
+    up to date.
+
+    """
 
     class InsufficientBalance(Exception):
         """Used in situations where the account would otherwise be in arrears
@@ -125,6 +320,67 @@ class Account(Entity):
         self.subaccounts = list(subaccounts)
         self.check_subaccounts()
 
+        self._card_subaccounts: Dict[CardNumber, CardSubAccount] = {}
+        for s in self.subaccounts:
+            self._index_subaccount(s)
+
+    def _index_subaccount(self, subaccount: SubAccount) -> None:
+        if not isinstance(subaccount, CardSubAccount):
+            return
+
+        number = subaccount.card.number
+        if number is None:
+            raise ValueError('Cannot have a card subaccount for a card '
+                             'without a number.')
+
+        if number in self._card_subaccounts:
+            raise ValueError('Cannot have more than one subaccount for card '
+                             'number {}.'.format(number))
+
+        self._card_subaccounts[number] = subaccount
+
+    def add_subaccount(self, subaccount: SubAccount) -> None:
+        """Add a subaccount to this account.
+
+        Takes one argument:
+        - subaccount: The subaccount to add.
+
+        """
+
+        self.subaccounts.append(subaccount)
+        try:
+            self.check_subaccounts()
+            self._index_subaccount(subaccount)
+        except ValueError:
+            self.subaccounts.pop()
+            raise
+
+    @property
+    def card_numbers(self) -> List[CardNumber]:
+        """The numbers of the cards which have subaccounts in this
+        account.
+
+        """
+
+        return list(self._card_subaccounts)
+
+    def card_subaccount(self, card_number: CardNumber) -> CardSubAccount:
+        """Find the subaccount for a card.
+
+        Takes one argument:
+        - card_number: The number of the card.
+
+        Returns a CardSubAccount instance. Raises ValueError if the card does
+        not belong to this account.
+
+        """
+
+        try:
+            return self._card_subaccounts[card_number]
+        except KeyError:
+            raise ValueError('No subaccount matching card number {}.'
+                             .format(card_number))
+
     @property
     def balance(self) -> Balance:
         """Calculate the balance as the sum of the balances of the
@@ -179,7 +435,7 @@ class Account(Entity):
     def _add_transaction(self, subaccount, transaction):
         """Add a transaction to a particular subaccount."""
 
-        subaccount.transactions.append(transaction)
+        subaccount.add_transaction(transaction)
 
     def debit(self,
               amount: AUD = None,
@@ -216,14 +472,10 @@ class Account(Entity):
 
         """
 
-        card_account = None
-        for s in self.subaccounts:
-            if isinstance(s, CardSubAccount) and s.card.number == card_number:
-                card_account = s
+        if card_number is None:
+            raise ValueError('Cannot debit a card without a card number.')
 
-        if s is None:
-            raise ValueError('No subaccount matching card number {}.'
-                             .format(card_number))
+        card_account = self.card_subaccount(card_number)
 
         if amount is None:
             raise ValueError('Cannot debit a card without an amount.')
@@ -258,12 +510,45 @@ class Account(Entity):
         Takes one argument:
         - reference: The reference for the transaction to be settled.
 
-        Failed silently if a transaction with that reference is not found.
+        Raises RuntimeError if no subaccount has a transaction with that
+        reference, as Transaction.settle does if it has been settled. The
+        transactions of an account which have been compacted are settled, so
+        this is what settling them again raises.
 
         """
 
+        found = False
         for s in self.subaccounts:
-            s.settle(reference)
+            found = s.settle(reference) or found
+
+        if not found:
+            raise RuntimeError('Cannot settle reference {}, which has no '
+                               'pending transaction in account {}.'
+                               .format(reference, self.id))
+
+    def settle_many(self, references: AbstractSet[UUID]) -> None:
+        """Settle the transactions associated with this account which have
+        any of a number of references, in a single pass over each
+        subaccount.
+
+        Takes one argument:
+        - references: The references of the transactions to be settled.
+
+        Raises RuntimeError for references with no transaction, as settle
+        does.
+
+        """
+
+        found: Set[UUID] = set()
+        for s in self.subaccounts:
+            found |= s.settle_many(references)
+
+        missing = set(references) - found
+        if missing:
+            raise RuntimeError('Cannot settle {} references, e.g. {}, which '
+                               'have no pending transaction in account {}.'
+                               .format(len(missing), next(iter(missing)),
+                                       self.id))
 
 
 class RegularAccount(Account):
@@ -294,23 +579,111 @@ class RegularAccount(Account):
 class ExternalCounterparty(Account):
     """A tool for representing a transaction involving an account which is not
     part of our system. E.g. if a user deposits money into an account. It has
-    only a single regular subaccount, no others.
+    only a single regular subaccount, and no others unless it is striped.
+
+    A counterparty which receives a lot of credits, such as a busy merchant,
+    can be striped across a number of StripeSubAccounts. Each credit is
+    added to one of the stripes rather than to the regular subaccount, so
+    units of work which credit the counterparty at the same time usually
+    change different subaccounts and do not conflict. The balance is still
+    the sum of every subaccount, so stays exact. roll_up moves the settled
+    balances of the stripes into the regular subaccount.
 
     """
 
     can_overdraw = True
 
     def __init__(self, id: UUID = None, owner: UUID = None,
-                 subaccounts: Iterable[SubAccount] = None) -> None:
+                 subaccounts: Iterable[SubAccount] = None,
+                 stripes: int = 0) -> None:
+        if stripes and subaccounts is not None:
+            raise ValueError('Cannot create an external counterparty with '
+                             'both stripes and subaccounts.')
+
         if subaccounts is None:
             subaccounts = [RegularSubAccount()]
+            subaccounts.extend(StripeSubAccount() for _ in range(stripes))
+
+        # The stripes are kept up to date as subaccounts are indexed, which
+        # includes those added with add_subaccount.
+        self._stripes: List[StripeSubAccount] = []
 
         super(ExternalCounterparty, self).__init__(id=id,
                                                    owner=owner,
                                                    subaccounts=subaccounts)
 
+    def _index_subaccount(self, subaccount: SubAccount) -> None:
+        super(ExternalCounterparty, self)._index_subaccount(subaccount)
+        if isinstance(subaccount, StripeSubAccount):
+            self._stripes.append(subaccount)
+
+    @property
+    def stripes(self) -> List[StripeSubAccount]:
+        return list(self._stripes)
+
     def check_subaccounts(self):
-        if (len(self.subaccounts) != 1 or
-                not isinstance(self.subaccounts[0], RegularSubAccount)):
+        regular = [s for s in self.subaccounts
+                   if isinstance(s, RegularSubAccount)]
+        if (len(regular) != 1 or
+                not all(isinstance(s, (RegularSubAccount, StripeSubAccount))
+                        for s in self.subaccounts)):
             raise ValueError('An external counterparty must have only one '
-                             'regular account.')
+                             'regular account, and any number of stripes.')
+
+    def credit(self,
+               amount: AUD = None,
+               reference: UUID = None) -> None:
+        """Credit this account by a particular amount. If the account is
+        striped, the transaction is added to one of the stripes, chosen by
+        its ID.
+
+        Takes two arguments:
+        - amount: The amount by which to credit the account.
+        - reference: A reference for the transaction.
+
+        """
+
+        if not self._stripes:
+            super(ExternalCounterparty, self).credit(amount, reference)
+            return
+
+        transaction = Transaction(amount=amount,
+                                  type=TransactionType.CREDIT,
+                                  reference=reference)
+        stripe = self._stripes[transaction.id.int % len(self._stripes)]
+        self._add_transaction(stripe, transaction)
+
+    def roll_up(self) -> AUD:
+        """Move the settled balances of the stripes into the regular
+        subaccount. Each stripe is moved as a transfer of its own: a settled
+        debit from the stripe and a settled credit to the regular
+        subaccount, with a new reference, so that every reference still has
+        exactly two transactions. Pending credits stay in their stripes until
+        they have been settled and rolled up.
+
+        Returns the amount rolled up.
+
+        """
+
+        total = ZERO
+        for stripe in self._stripes:
+            available = stripe.balance.available
+            if not available:
+                continue
+
+            reference = uuid4()
+            self._add_transaction(stripe, Transaction(
+                amount=available,
+                type=TransactionType.DEBIT,
+                reference=reference,
+                status=TransactionStatus.SETTLED,
+            ))
+            self._add_transaction(self.default_subaccount, Transaction(
+                amount=available,
+                type=TransactionType.CREDIT,
+                reference=reference,
+                status=TransactionStatus.SETTLED,
+            ))
+            total += available
+
+        return total
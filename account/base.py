@@ -14,8 +14,9 @@ class Entity:
         self.id = id or uuid4()
 
     def __repr__(self) -> str:
+        # Private attributes are derived state, e.g. caches and indexes.
         properties = ['='.join((k, repr(v))) for k, v in self.__dict__.items()
-                      if k != 'id']
+                      if k != 'id' and not k.startswith('_')]
         properties.sort()
         return '{}(id={}{}{})'.format(self.__class__.__name__, self.id,
                                       ', ' if properties else '',
@@ -73,3 +74,46 @@ class Repository(Generic[E], metaclass=ABCMeta):
         """
 
         pass
+
+
+class AsyncRepository(Generic[E], metaclass=ABCMeta):
+    """The asynchronous counterpart of Repository, for repositories whose
+    storage is reached through I/O. Each method is a coroutine, so many
+    requests can wait on their storage at once on one event loop.
+
+    """
+
+    @abstractmethod
+    async def get(self, id: UUID) -> E:
+        """Find an entity by its ID.
+
+        Takes one argument:
+        - id: The ID of the entity.
+
+        Returns an instance of the entity.
+
+        """
+
+        pass
+
+    @abstractmethod
+    async def add(self, entity: E) -> None:
+        """Add a new entity.
+
+        Takes one argument:
+        - entity: The entity instance to add.
+
+        """
+
+        pass
+
+    @abstractmethod
+    async def update(self, entity: E) -> None:
+        """Update an entity with modifications.
+
+        Takes one argument:
+        - entity: The entity to add.
+
+        """
+
+        pass
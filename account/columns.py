@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+from array import array
+from typing import (
+    AbstractSet,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    overload,
+    List,
+    Sequence,
+    Union,
+)
+from uuid import UUID
+
+from .transaction import Transaction, TransactionStatus, TransactionType
+from .values import AUD, Balance
+
+
+# The width of an ID or reference in the columns.
+UUID_SIZE = 16
+
+_types: Dict[int, TransactionType] = {t.value: t for t in TransactionType}
+_statuses: Dict[int, TransactionStatus] = {s.value: s
+                                           for s in TransactionStatus}
+
+
+class TransactionColumns(Sequence[Transaction]):
+    """A compact alternative to a list of transactions. Each attribute of the
+    transactions is kept in its own typed array, so a transaction takes up 42
+    bytes rather than a Transaction object with a dictionary, two UUIDs and
+    an amount.
+
+    Indexing or iterating over the columns gives TransactionView objects,
+    which are created on demand and read and write the arrays directly.
+
+    Takes one argument:
+    - transactions: The transactions to start with.
+
+    """
+
+    def __init__(self, transactions: Iterable[Transaction] = ()) -> None:
+        self._ids = bytearray()
+        self._references = bytearray()
+        self._amounts = array('q')
+        self._types = array('B')
+        self._statuses = array('B')
+
+        self.extend(transactions)
+
+    def __len__(self) -> int:
+        return len(self._amounts)
+
+    @overload
+    def __getitem__(self, row: int) -> Transaction:
+        pass
+
+    @overload
+    def __getitem__(self, row: slice) -> List[Transaction]:
+        pass
+
+    def __getitem__(self,
+                    row: Union[int, slice]) -> Union[Transaction,
+                                                     List[Transaction]]:
+        if isinstance(row, slice):
+            return [TransactionView(self, r)
+                    for r in range(*row.indices(len(self)))]
+
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError('Transaction index out of range.')
+
+        return TransactionView(self, row)
+
+    def __setitem__(self, row: int, transaction: Transaction) -> None:
+        # Overwrites the row with the attributes of the transaction.
+        view = self[row]
+        view.id = transaction.id
+        view.reference = transaction.reference
+        view.amount = transaction.amount
+        view.type = transaction.type
+        view.status = transaction.status
+
+    def __iter__(self) -> Iterator[Transaction]:
+        for row in range(len(self)):
+            yield TransactionView(self, row)
+
+    def __repr__(self) -> str:
+        return 'TransactionColumns({!r})'.format(list(self))
+
+    def __copy__(self) -> TransactionColumns:
+        new_copy = type(self)()
+        new_copy._ids = self._ids
+        new_copy._references = self._references
+        new_copy._amounts = self._amounts
+        new_copy._types = self._types
+        new_copy._statuses = self._statuses
+
+        return new_copy
+
+    def __deepcopy__(self, memo) -> TransactionColumns:
+        self_id = id(self)
+        if self_id in memo:
+            return memo[self_id]
+
+        memo[self_id] = new_copy = type(self)()
+        new_copy._ids = bytearray(self._ids)
+        new_copy._references = bytearray(self._references)
+        new_copy._amounts = array('q', self._amounts)
+        new_copy._types = array('B', self._types)
+        new_copy._statuses = array('B', self._statuses)
+
+        return new_copy
+
+    def add(self,
+            id: UUID,
+            reference: UUID,
+            amount: int,
+            type: TransactionType,
+            status: TransactionStatus) -> None:
+        """Add a transaction from the values of its attributes, without
+        creating a Transaction object.
+
+        Takes five arguments:
+        - id: The ID of the transaction.
+        - reference: The reference of the transaction.
+        - amount: The amount of the transaction, in cents.
+        - type: The TransactionType of the transaction.
+        - status: The TransactionStatus of the transaction.
+
+        """
+
+        self._ids += id.bytes
+        self._references += reference.bytes
+        self._amounts.append(amount)
+        self._types.append(type.value)
+        self._statuses.append(status.value)
+
+    def append(self, transaction: Transaction) -> None:
+        self.add(transaction.id, transaction.reference,
+                 transaction.amount.cents, transaction.type,
+                 transaction.status)
+
+    def extend(self, transactions: Iterable[Transaction]) -> None:
+        for t in transactions:
+            self.append(t)
+
+    def rows_with_reference(self, reference: UUID) -> Iterator[int]:
+        """Find the rows of the transactions with a particular reference, by
+        searching the references directly rather than creating every
+        transaction.
+
+        """
+
+        value = reference.bytes
+        start = self._references.find(value)
+        while start != -1:
+            # A match which is not aligned to a reference spans two of them.
+            if start % UUID_SIZE == 0:
+                yield start // UUID_SIZE
+                start = self._references.find(value, start + UUID_SIZE)
+            else:
+                start = self._references.find(value, start + 1)
+
+    def with_reference(self, reference: UUID) -> Iterator[Transaction]:
+        """Find the transactions with a particular reference."""
+
+        for row in self.rows_with_reference(reference):
+            yield TransactionView(self, row)
+
+    def with_references(
+            self, references: AbstractSet[UUID]) -> Iterator[Transaction]:
+        """Find the transactions with any of a number of references."""
+
+        # Searching for each reference runs at C speed, so beats a single
+        # pass in Python unless there are many references.
+        if len(references) <= 64:
+            for reference in references:
+                yield from self.with_reference(reference)
+            return
+
+        values = {r.bytes for r in references}
+        column = self._references
+        for row in range(len(self)):
+            start = row * UUID_SIZE
+            if bytes(column[start:start + UUID_SIZE]) in values:
+                yield TransactionView(self, row)
+
+    def balance(self) -> Balance:
+        """Calculate the sum of the transactions from the arrays, without
+        creating any transactions.
+
+        Returns a Balance value object.
+
+        """
+
+        debit = TransactionType.DEBIT.value
+        pending_status = TransactionStatus.PENDING.value
+
+        available = pending = 0
+        for amount, type_code, status_code in zip(self._amounts, self._types,
+                                                  self._statuses):
+            if type_code == debit:
+                amount = -amount
+            if status_code == pending_status:
+                pending += amount
+            else:
+                available += amount
+
+        return Balance(available=AUD.from_cents(available),
+                       pending=AUD.from_cents(pending))
+
+
+class TransactionView(Transaction):
+    """A transaction which is a row of a TransactionColumns. Its attributes
+    are read from and written to the arrays, so e.g. settling it settles the
+    transaction in the columns.
+
+    Copying a view gives an ordinary Transaction, which is detached from the
+    columns.
+
+    """
+
+    def __init__(self, columns: TransactionColumns, row: int) -> None:
+        # The attributes live in the columns, so Transaction.__init__ is not
+        # called.
+        self._columns = columns
+        self._row = row
+
+    def _uuid(self, column: bytearray) -> UUID:
+        start = self._row * UUID_SIZE
+        return UUID(bytes=bytes(column[start:start + UUID_SIZE]))
+
+    def _set_uuid(self, column: bytearray, value: UUID) -> None:
+        start = self._row * UUID_SIZE
+        column[start:start + UUID_SIZE] = value.bytes
+
+    @property  # type: ignore
+    def id(self) -> UUID:  # type: ignore
+        return self._uuid(self._columns._ids)
+
+    @id.setter
+    def id(self, value: UUID) -> None:
+        self._set_uuid(self._columns._ids, value)
+
+    @property  # type: ignore
+    def reference(self) -> UUID:  # type: ignore
+        return self._uuid(self._columns._references)
+
+    @reference.setter
+    def reference(self, value: UUID) -> None:
+        self._set_uuid(self._columns._references, value)
+
+    @property  # type: ignore
+    def amount(self) -> AUD:  # type: ignore
+        return AUD.from_cents(self._columns._amounts[self._row])
+
+    @amount.setter
+    def amount(self, value: AUD) -> None:
+        self._columns._amounts[self._row] = value.cents
+
+    @property  # type: ignore
+    def type(self) -> TransactionType:  # type: ignore
+        return _types[self._columns._types[self._row]]
+
+    @type.setter
+    def type(self, value: TransactionType) -> None:
+        self._columns._types[self._row] = value.value
+
+    @property  # type: ignore
+    def status(self) -> TransactionStatus:  # type: ignore
+        return _statuses[self._columns._statuses[self._row]]
+
+    @status.setter
+    def status(self, value: TransactionStatus) -> None:
+        self._columns._statuses[self._row] = value.value
+
+    def __repr__(self) -> str:
+        return repr(self.__copy__())
+
+    def __eq__(self, other: Any) -> bool:
+        # A view is the same entity as the Transaction it was made from.
+        if not isinstance(other, Transaction):
+            return NotImplemented
+
+        return self.id == other.id
+
+    def __deepcopy__(self, memo) -> Transaction:
+        # If the columns are being copied too, the copy is a view of the new
+        # columns rather than a detached transaction.
+        columns = memo.get(id(self._columns))
+        if columns is not None:
+            return TransactionView(columns, self._row)
+
+        return self.__copy__()
+
+    def __copy__(self) -> Transaction:
+        return Transaction(id=self.id, reference=self.reference,
+                           amount=self.amount, type=self.type,
+                           status=self.status)
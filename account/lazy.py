@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+from copy import deepcopy
+from typing import (
+    AbstractSet,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    overload,
+    Sequence,
+    Union,
+)
+from uuid import UUID
+
+from .columns import TransactionColumns
+from .transaction import Transaction
+
+
+# Loaded transactions are kept in either of the containers a subaccount can
+# use.
+LoadedTransactions = Union[List[Transaction], TransactionColumns]
+
+
+class LazyTransactions(Sequence[Transaction]):
+    """A stand-in for the transactions of a subaccount which are only loaded,
+    e.g. from a store, when something needs the whole history.
+
+    Adding a transaction, or finding the transactions with a particular
+    reference, does not load the history. New transactions are kept aside
+    and added to the end of the history once it is loaded. Transactions
+    found by reference are fetched individually, and the same objects are
+    used in the history once it is loaded, so changes made to them are kept.
+
+    Takes two arguments, and one optional argument:
+    - load: Loads the whole history, as a list or a TransactionColumns.
+    - load_reference: Loads the transactions in the history with a particular
+      reference.
+    - load_references: Loads the transactions in the history with any of a
+      number of references at once. If it is not given, each reference is
+      loaded on its own.
+
+    """
+
+    def __init__(self,
+                 load: Callable[[], LoadedTransactions],
+                 load_reference: Callable[[UUID], Iterable[Transaction]],
+                 load_references: Optional[
+                     Callable[[AbstractSet[UUID]], Iterable[Transaction]]
+                 ] = None) -> None:
+        self._load = load
+        self._load_reference = load_reference
+        self._load_references = load_references
+
+        self._loaded: Optional[LoadedTransactions] = None
+        # The transactions added before the history was loaded.
+        self._added: List[Transaction] = []
+        # The transactions fetched by reference before the history was
+        # loaded, by their IDs.
+        self._fetched: Dict[UUID, Transaction] = {}
+        # The references which have already been fetched.
+        self._references: Dict[UUID, List[Transaction]] = {}
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded is not None
+
+    def _history(self) -> LoadedTransactions:
+        if self._loaded is not None:
+            return self._loaded
+
+        loaded = self._load()
+
+        if self._fetched:
+            for i, t in enumerate(loaded):
+                fetched = self._fetched.get(t.id)
+                if fetched is not None:
+                    loaded[i] = fetched
+
+        loaded.extend(self._added)
+
+        self._loaded = loaded
+        self._added = []
+        self._fetched = {}
+        self._references = {}
+
+        return loaded
+
+    def __len__(self) -> int:
+        return len(self._history())
+
+    @overload
+    def __getitem__(self, i: int) -> Transaction:
+        pass
+
+    @overload
+    def __getitem__(self, i: slice) -> List[Transaction]:
+        pass
+
+    def __getitem__(self,
+                    i: Union[int, slice]) -> Union[Transaction,
+                                                   List[Transaction]]:
+        return self._history()[i]
+
+    def __iter__(self) -> Iterator[Transaction]:
+        return iter(self._history())
+
+    def __repr__(self) -> str:
+        if self._loaded is not None:
+            return 'LazyTransactions({!r})'.format(self._loaded)
+
+        return 'LazyTransactions(<not loaded>, added={!r})'.format(
+            self._added)
+
+    def __deepcopy__(self, memo) -> LazyTransactions:
+        self_id = id(self)
+        if self_id in memo:
+            return memo[self_id]
+
+        memo[self_id] = new_copy = type(self)(self._load,
+                                              self._load_reference,
+                                              self._load_references)
+        new_copy._loaded = deepcopy(self._loaded, memo)
+        new_copy._added = deepcopy(self._added, memo)
+        new_copy._fetched = deepcopy(self._fetched, memo)
+        new_copy._references = deepcopy(self._references, memo)
+
+        return new_copy
+
+    def append(self, transaction: Transaction) -> None:
+        if self._loaded is not None:
+            self._loaded.append(transaction)
+        else:
+            self._added.append(transaction)
+
+    def extend(self, transactions: Iterable[Transaction]) -> None:
+        for t in transactions:
+            self.append(t)
+
+    def mark_saved(self) -> None:
+        """Record that the transactions added before the history was loaded
+        have been saved, so that they are part of the history which will be
+        loaded rather than being added to the end of it again. Called by
+        SubAccount.mark_saved.
+
+        """
+
+        for t in self._added:
+            self._fetched[t.id] = t
+            # References fetched before the transaction was saved did not
+            # find it.
+            fetched = self._references.get(t.reference)
+            if fetched is not None:
+                fetched.append(t)
+
+        self._added = []
+
+    def with_reference(self, reference: UUID) -> Iterator[Transaction]:
+        """Find the transactions with a particular reference, without loading
+        the whole history.
+
+        """
+
+        if self._loaded is not None:
+            if isinstance(self._loaded, TransactionColumns):
+                yield from self._loaded.with_reference(reference)
+            else:
+                yield from (t for t in self._loaded
+                            if t.reference == reference)
+            return
+
+        try:
+            fetched = self._references[reference]
+        except KeyError:
+            fetched = []
+            for t in self._load_reference(reference):
+                # Another reference may have been fetched with it already.
+                t = self._fetched.setdefault(t.id, t)
+                fetched.append(t)
+            self._references[reference] = fetched
+
+        yield from fetched
+        yield from (t for t in self._added if t.reference == reference)
+
+    def with_references(
+            self, references: AbstractSet[UUID]) -> Iterator[Transaction]:
+        """Find the transactions with any of a number of references. If the
+        history has not been loaded, the references which have not been
+        fetched yet are fetched together.
+
+        """
+
+        if self._loaded is None:
+            missing = references - self._references.keys()
+            if missing and self._load_references is not None:
+                fetched: Dict[UUID, List[Transaction]] = {
+                    r: [] for r in missing
+                }
+                for t in self._load_references(missing):
+                    t = self._fetched.setdefault(t.id, t)
+                    fetched[t.reference].append(t)
+                self._references.update(fetched)
+
+            for reference in references:
+                yield from self.with_reference(reference)
+        elif isinstance(self._loaded, TransactionColumns):
+            yield from self._loaded.with_references(references)
+        else:
+            yield from (t for t in self._loaded if t.reference in references)
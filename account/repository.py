@@ -1,10 +1,11 @@
 
+import asyncio
 from abc import abstractmethod
-from typing import Iterable
+from typing import Dict, Iterable, List, Set, Tuple
 from uuid import UUID
 
 from .account import Account
-from .base import Repository
+from .base import AsyncRepository, Repository
 from .values import CardNumber
 
 
@@ -19,6 +20,20 @@ class AccountRepository(Repository[Account]):
     def get(self, id: UUID) -> Account:
         pass
 
+    def get_many(self, ids: Iterable[UUID]) -> List[Account]:
+        """Find a number of accounts by their IDs. Implementations should
+        override this to load the accounts together, rather than one at a
+        time.
+
+        Takes one argument:
+        - ids: The IDs of the accounts.
+
+        Returns a list of Account instances, in the same order as the IDs.
+
+        """
+
+        return [self.get(id) for id in ids]
+
     @abstractmethod
     def add(self, account: Account) -> None:
         pass
@@ -40,6 +55,20 @@ class AccountRepository(Repository[Account]):
 
         pass
 
+    def find_id_by_card_number(self, card_number: CardNumber) -> UUID:
+        """Find the ID of the account associated with a card. Implementations
+        should override this to avoid loading the account, so that it can be
+        loaded together with others using get_many.
+
+        Takes one argument:
+        - card_number: The card number for the card.
+
+        Returns the ID of the account.
+
+        """
+
+        return self.find_by_card_number(card_number).id
+
     @abstractmethod
     def find_by_transaction_reference(self,
                                       reference: UUID) -> Iterable[Account]:
@@ -53,3 +82,104 @@ class AccountRepository(Repository[Account]):
 
         """
         pass
+
+    def find_by_transaction_references(
+            self,
+            references: Iterable[UUID]) -> List[Tuple[Account, Set[UUID]]]:
+        """Find the accounts containing transactions with any of a number of
+        references. Implementations should override this to look up all of
+        the references together, rather than one at a time.
+
+        Takes one argument:
+        - references: The references to search for.
+
+        Returns a list of (account, references) tuples, where references are
+        those of the references which the account has transactions for.
+
+        """
+
+        accounts: Dict[UUID, Tuple[Account, Set[UUID]]] = {}
+        for reference in references:
+            for account in self.find_by_transaction_reference(reference):
+                accounts.setdefault(account.id, (account, set()))[1].add(
+                    reference)
+
+        return list(accounts.values())
+
+
+class AsyncAccountRepository(AsyncRepository[Account]):
+    """The asynchronous counterpart of AccountRepository. The methods which
+    have defaults run their lookups concurrently, so that the waits for
+    their storage overlap.
+
+    """
+
+    DoesNotExist = AccountRepository.DoesNotExist
+
+    @abstractmethod
+    async def get(self, id: UUID) -> Account:
+        pass
+
+    async def get_many(self, ids: Iterable[UUID]) -> List[Account]:
+        """Find a number of accounts by their IDs. See
+        AccountRepository.get_many.
+
+        """
+
+        return list(await asyncio.gather(*(self.get(id) for id in ids)))
+
+    @abstractmethod
+    async def add(self, account: Account) -> None:
+        pass
+
+    @abstractmethod
+    async def update(self, account: Account) -> None:
+        pass
+
+    @abstractmethod
+    async def find_by_card_number(self, card_number: CardNumber) -> Account:
+        """Find an account by an associated card. See
+        AccountRepository.find_by_card_number.
+
+        """
+
+        pass
+
+    async def find_id_by_card_number(self, card_number: CardNumber) -> UUID:
+        """Find the ID of the account associated with a card. See
+        AccountRepository.find_id_by_card_number.
+
+        """
+
+        return (await self.find_by_card_number(card_number)).id
+
+    @abstractmethod
+    async def find_by_transaction_reference(
+            self, reference: UUID) -> Iterable[Account]:
+        """Find the accounts containing transactions with a particular
+        reference. See AccountRepository.find_by_transaction_reference.
+
+        """
+
+        pass
+
+    async def find_by_transaction_references(
+            self,
+            references: Iterable[UUID]) -> List[Tuple[Account, Set[UUID]]]:
+        """Find the accounts containing transactions with any of a number of
+        references. See AccountRepository.find_by_transaction_references.
+
+        """
+
+        references = list(references)
+        found = await asyncio.gather(*(
+            self.find_by_transaction_reference(r) for r in references
+        ))
+
+        accounts: Dict[UUID, Tuple[Account, Set[UUID]]] = {}
+        for reference, reference_accounts in zip(references, found):
+            for account in reference_accounts:
+                accounts.setdefault(account.id, (account, set()))[1].add(
+                    reference)
+
+        return list(accounts.values())
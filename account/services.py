@@ -1,9 +1,106 @@
 
+from typing import Dict, Iterable, List, Optional, Tuple
 from uuid import UUID, uuid4
 
+from .account import Account, ExternalCounterparty
 from .values import AUD, CardNumber
 
 
+# A single transfer, from a source account to a destination account.
+TransferLeg = Tuple[UUID, UUID, AUD]
+
+# The outcome of each leg of transfer_many.
+TransferResults = List[Optional[Account.InsufficientBalance]]
+
+
+# The checks and changes to the accounts are shared by the synchronous and
+# asynchronous versions of each service, which only differ in how they use
+# their repositories.
+
+def _check_transfer(source: Optional[UUID], destination: Optional[UUID],
+                    amount: Optional[AUD]) -> None:
+    if source is None:
+        raise ValueError("Cannot transfer from a source of None.")
+
+    if destination is None:
+        raise ValueError("Cannot transfer to a destination of None.")
+
+    if source == destination:
+        raise ValueError("Cannot transfer to the same account.")
+
+    if amount is None:
+        raise ValueError("Cannot transfer an amount of None.")
+
+
+def _transfer(source: Account, destination: Account, amount: AUD) -> None:
+    reference = uuid4()
+    source.debit(amount, reference)
+    destination.credit(amount, reference)
+
+    source.settle(reference)
+    destination.settle(reference)
+
+
+def _transfer_legs(
+        legs: List[TransferLeg],
+        accounts: Dict[UUID, Account],
+) -> Tuple[TransferResults, List[Account]]:
+    """Make each of a number of transfers between loaded accounts.
+
+    Returns the result for each leg, and the accounts which changed in the
+    order they first changed.
+
+    """
+
+    results: TransferResults = []
+    changed: Dict[UUID, Account] = {}
+
+    for source, destination, amount in legs:
+        try:
+            _transfer(accounts[source], accounts[destination], amount)
+        except Account.InsufficientBalance as e:
+            results.append(e)
+            continue
+
+        changed[source] = accounts[source]
+        changed[destination] = accounts[destination]
+        results.append(None)
+
+    return results, list(changed.values())
+
+
+def _check_purchase(card_number: Optional[CardNumber],
+                    merchant: Optional[UUID],
+                    amount: Optional[AUD],
+                    reference: Optional[UUID]) -> None:
+    if card_number is None:
+        raise ValueError("Cannot make a purchase on a card account of "
+                         "None.")
+
+    if merchant is None:
+        raise ValueError("Cannot make a payment to a merchant of None.")
+
+    if amount is None:
+        raise ValueError("Cannot make a purchase of an amount of None.")
+
+    if reference is None:
+        raise ValueError("Cannot make a purchase without a reference.")
+
+
+def _purchase(account: Account, merchant: Account, card_number: CardNumber,
+              amount: AUD, reference: UUID) -> None:
+    account.debit_card(card_number=card_number,
+                       amount=amount,
+                       reference=reference)
+    merchant.credit(amount=amount,
+                    reference=reference)
+
+
+def _check_references(references: Iterable[Optional[UUID]]) -> None:
+    if any(r is None for r in references):
+        raise ValueError("Cannot settle a transaction with no reference.")
+
+
 class AccountTransferService:
     """A service for transferring money between accounts."""
 
@@ -21,36 +118,54 @@ class AccountTransferService:
 
         """
 
-        if source is None:
-            raise ValueError("Cannot transfer from a source of None.")
-
-        if destination is None:
-            raise ValueError("Cannot transfer to a destination of None.")
-
-        if source == destination:
-            raise ValueError("Cannot transfer to the same account.")
-
-        if amount is None:
-            raise ValueError("Cannot transfer an amount of None.")
+        _check_transfer(source, destination, amount)
 
-        source_account = self.repository.get(source)
-        destination_account = self.repository.get(destination)
+        source_account, destination_account = \
+            self.repository.get_many([source, destination])
 
         # The AccountRepository raises an exception if it does not exist.
         # This is mainly to make the type checker happy as this never occurs.
         assert source_account is not None
         assert destination_account is not None
+        assert amount is not None
 
-        reference = uuid4()
-        source_account.debit(amount, reference)
-        destination_account.credit(amount, reference)
-
-        source_account.settle(reference)
-        destination_account.settle(reference)
+        _transfer(source_account, destination_account, amount)
 
         self.repository.update(source_account)
         self.repository.update(destination_account)
 
+    def transfer_many(self, legs: Iterable[TransferLeg]) -> TransferResults:
+        """Make a number of transfers at once. Every account involved is
+        loaded once, the transfers are made in order, and then each account
+        which changed is updated once.
+
+        A transfer which would put its source account into arrears is
+        skipped, and the rest are still made.
+
+        Takes one argument:
+        - legs: The transfers to make, as (source, destination, amount)
+          tuples of the same arguments as transfer.
+
+        Returns a list with an entry for each leg, which is None if the
+        transfer was made or the InsufficientBalance exception if it was
+        skipped.
+
+        """
+
+        legs = list(legs)
+        for source, destination, amount in legs:
+            _check_transfer(source, destination, amount)
+
+        ids = list(dict.fromkeys(i for leg in legs for i in leg[:2]))
+        accounts = dict(zip(ids, self.repository.get_many(ids)))
+
+        results, changed = _transfer_legs(legs, accounts)
+
+        for account in changed:
+            self.repository.update(account)
+
+        return results
+
 
 class CardPurchaseService:
     """A service for facilitating purchases involving cards."""
@@ -72,28 +187,20 @@ class CardPurchaseService:
 
         """
 
-        if card_number is None:
-            raise ValueError("Cannot make a purchase on a card account of "
-                             "None.")
-
-        if merchant is None:
-            raise ValueError("Cannot make a payment to a merchant of None.")
-
-        if amount is None:
-            raise ValueError("Cannot make a purchase of an amount of None.")
+        _check_purchase(card_number, merchant, amount, reference)
 
-        if reference is None:
-            raise ValueError("Cannot make a purchase without a reference.")
+        # These have just been checked. This is for the type checker.
+        assert card_number is not None
+        assert amount is not None
+        assert reference is not None
 
-        account = self.repository.find_by_card_number(card_number)
+        # The accounts are loaded together, so that a repository which locks
+        # them can lock them both at once.
+        account, merchant_account = self.repository.get_many([
+            self.repository.find_id_by_card_number(card_number), merchant,
+        ])
 
-        merchant_account = self.repository.get(merchant)
-
-        account.debit_card(card_number=card_number,
-                           amount=amount,
-                           reference=reference)
-        merchant_account.credit(amount=amount,
-                                reference=reference)
+        _purchase(account, merchant_account, card_number, amount, reference)
 
         self.repository.update(account)
         self.repository.update(merchant_account)
@@ -113,11 +220,188 @@ class TransactionSettlementService:
 
         """
 
-        if reference is None:
-            raise ValueError("Cannot settle a transaction with no reference.")
+        _check_references([reference])
 
         accounts = self.repository.find_by_transaction_reference(reference)
 
         for account in accounts:
             account.settle(reference)
             self.repository.update(account)
+
+    def settle_many(self, references: Iterable[UUID]) -> None:
+        """Settle the transactions associated with a number of references.
+        The accounts involved are found and loaded together, each one settles
+        all of its references in a single pass, and is then updated once.
+
+        Takes one argument:
+        - references: The references for the transactions to settle.
+
+        """
+
+        references = list(references)
+        _check_references(references)
+
+        found = self.repository.find_by_transaction_references(references)
+
+        for account, account_references in found:
+            account.settle_many(account_references)
+            self.repository.update(account)
+
+
+class StripeRollupService:
+    """A service for rolling up the stripes of striped external
+    counterparties into their regular subaccounts. It is intended to be run
+    periodically, e.g. on a timer.
+
+    """
+
+    def __init__(self, repository):
+        self.repository = repository
+
+    def roll_up(self, accounts: Iterable[UUID]) -> Dict[UUID, AUD]:
+        """Roll up the stripes of a number of external counterparties. See
+        ExternalCounterparty.roll_up.
+
+        Takes one argument:
+        - accounts: The IDs of the accounts.
+
+        Returns the amount rolled up for each account, by its ID.
+
+        """
+
+        rolled_up: Dict[UUID, AUD] = {}
+        for account in self.repository.get_many(accounts):
+            if not isinstance(account, ExternalCounterparty):
+                raise ValueError('Cannot roll up account {}, as it is not an '
+                                 'external counterparty.'.format(account.id))
+
+            rolled_up[account.id] = account.roll_up()
+            if rolled_up[account.id]:
+                self.repository.update(account)
+
+        return rolled_up
+
+
+class AsyncAccountTransferService:
+    """The asynchronous counterpart of AccountTransferService, for use with
+    an AsyncAccountRepository.
+
+    """
+
+    def __init__(self, repository):
+        self.repository = repository
+
+    async def transfer(self, source: UUID = None, destination: UUID = None,
+                       amount: AUD = None) -> None:
+        """Transfer money from a source account to a destination account.
+        See AccountTransferService.transfer.
+
+        """
+
+        _check_transfer(source, destination, amount)
+        assert amount is not None
+
+        source_account, destination_account = \
+            await self.repository.get_many([source, destination])
+
+        _transfer(source_account, destination_account, amount)
+
+        await self.repository.update(source_account)
+        await self.repository.update(destination_account)
+
+    async def transfer_many(self,
+                            legs: Iterable[TransferLeg]) -> TransferResults:
+        """Make a number of transfers at once. See
+        AccountTransferService.transfer_many.
+
+        """
+
+        legs = list(legs)
+        for source, destination, amount in legs:
+            _check_transfer(source, destination, amount)
+
+        ids = list(dict.fromkeys(i for leg in legs for i in leg[:2]))
+        accounts = dict(zip(ids, await self.repository.get_many(ids)))
+
+        results, changed = _transfer_legs(legs, accounts)
+
+        for account in changed:
+            await self.repository.update(account)
+
+        return results
+
+
+class AsyncCardPurchaseService:
+    """The asynchronous counterpart of CardPurchaseService, for use with an
+    AsyncAccountRepository.
+
+    """
+
+    def __init__(self, repository):
+        self.repository = repository
+
+    async def make_purchase(self, card_number: CardNumber = None,
+                            merchant: UUID = None,
+                            amount: AUD = None,
+                            reference: UUID = None) -> None:
+        """Record a purchase for a card. See CardPurchaseService.make_purchase.
+
+        """
+
+        _check_purchase(card_number, merchant, amount, reference)
+
+        # These have just been checked. This is for the type checker.
+        assert card_number is not None
+        assert amount is not None
+        assert reference is not None
+
+        account_id = await self.repository.find_id_by_card_number(card_number)
+        account, merchant_account = await self.repository.get_many([
+            account_id, merchant,
+        ])
+
+        _purchase(account, merchant_account, card_number, amount, reference)
+
+        await self.repository.update(account)
+        await self.repository.update(merchant_account)
+
+
+class AsyncTransactionSettlementService:
+    """The asynchronous counterpart of TransactionSettlementService, for use
+    with an AsyncAccountRepository.
+
+    """
+
+    def __init__(self, repository):
+        self.repository = repository
+
+    async def settle_transaction(self, reference: UUID = None) -> None:
+        """Settle the transactions associated with a particular reference.
+        See TransactionSettlementService.settle_transaction.
+
+        """
+
+        _check_references([reference])
+
+        accounts = await self.repository.find_by_transaction_reference(
+            reference,
+        )
+        for account in accounts:
+            account.settle(reference)
+            await self.repository.update(account)
+
+    async def settle_many(self, references: Iterable[UUID]) -> None:
+        """Settle the transactions associated with a number of references.
+        See TransactionSettlementService.settle_many.
+
+        """
+
+        references = list(references)
+        _check_references(references)
+
+        found = await self.repository.find_by_transaction_references(
+            references,
+        )
+        for account, account_references in found:
+            account.settle_many(account_references)
+            await self.repository.update(account)
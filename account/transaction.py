@@ -1,13 +1,11 @@
 
 from __future__ import annotations
 
-from copy import deepcopy
-
 from enum import auto, Enum
 from uuid import UUID
 
 from .base import Entity
-from .values import AUD, Balance
+from .values import AUD, Balance, ZERO
 
 
 class TransactionStatus(Enum):
@@ -46,12 +44,13 @@ class Transaction(Entity):
         if type is None:
             raise ValueError('Transaction type must be specified.')
 
-        self.amount = amount if amount is not None else AUD('0')
+        self.amount = amount if amount is not None else ZERO
         self.type = type
         self.status = status
 
     def __copy__(self) -> Transaction:  # noqa
-        return type(self)(id=self.id, amount=self.amount, type=self.type,
+        return type(self)(id=self.id, reference=self.reference,
+                          amount=self.amount, type=self.type,
                           status=self.status)
 
     def __deepcopy__(self, memo) -> Transaction: # noqa
@@ -59,14 +58,9 @@ class Transaction(Entity):
         if self_id in memo:
             return memo[self_id]
 
-        new_id = deepcopy(self.id)
-        new_amount = deepcopy(self.amount)
-        new_type = deepcopy(self.type)
-        new_reference = deepcopy(self.reference)
-        new_status = deepcopy(self.status)
-        new_transaction = type(self)(id=new_id, amount=new_amount,
-                                     type=new_type, reference=new_reference,
-                                     status=new_status)
+        # All of the attributes of a transaction are immutable values, so a
+        # shallow copy is as good as a deep one.
+        memo[self_id] = new_transaction = self.__copy__()
 
         return new_transaction
 
@@ -80,15 +74,18 @@ class Transaction(Entity):
 
         """
 
-        if self.status == TransactionStatus.PENDING:
-            adjustment = Balance(pending=self.amount)
-        else:
-            adjustment = Balance(available=self.amount)
-
+        amount = self.amount
         if self.type == TransactionType.DEBIT:
-            adjustment = -adjustment
+            amount = -amount
 
-        return balance + adjustment
+        # Only one of the available and pending balances changes, so the
+        # other is shared with the balance being adjusted.
+        if self.status == TransactionStatus.PENDING:
+            return Balance(available=balance.available,
+                           pending=balance.pending + amount)
+        else:
+            return Balance(available=balance.available + amount,
+                           pending=balance.pending)
 
     def settle(self) -> None:
         if self.status != TransactionStatus.PENDING:
@@ -1,41 +1,210 @@
 
 from __future__ import annotations
 
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation, ROUND_HALF_EVEN
+from fractions import Fraction
+from typing import Any, Optional, Tuple, Union
 
 
-class AUD(Decimal):
-    """A value object representing an amount of Australian currency."""
+class AUD:
+    """A value object representing an amount of Australian currency. It is
+    immutable, and is held as a whole number of cents so that arithmetic is
+    exact.
+
+    An amount can be created from a string or a Decimal, which must be a
+    whole number of cents, or from an int, which is a number of dollars. Use
+    AUD.round for values which need rounding to the nearest cent, and
+    AUD.from_cents for a number of cents.
+
+    """
+
+    __slots__ = ('_cents',)
+
+    _cents: int
+
+    def __init__(self, value: Union[AUD, Decimal, int, str] = 0) -> None:
+        if isinstance(value, AUD):
+            self._cents = value._cents
+        elif isinstance(value, int):
+            self._cents = value * 100
+        elif isinstance(value, (str, Decimal)):
+            try:
+                cents = _decimal_cents(Decimal(value))
+            except InvalidOperation:
+                cents = None
+
+            if cents is None:
+                raise ValueError('{!r} is not a whole number of cents.'
+                                 .format(value))
+            self._cents = cents
+        else:
+            raise TypeError('Cannot make an amount of AUD from a {}.'
+                            .format(type(value).__name__))
+
+    @classmethod
+    def from_cents(cls, cents: int) -> AUD:
+        """Create an amount from a whole number of cents."""
+
+        amount = object.__new__(cls)
+        amount._cents = cents
+        return amount
+
+    @classmethod
+    def round(cls,
+              value: Union[Decimal, str],
+              rounding: str = ROUND_HALF_EVEN) -> AUD:
+        """Create an amount from a value which may have fractions of a cent,
+        rounding it to the nearest cent.
+
+        Takes two arguments:
+        - value: The value, as a Decimal or a string.
+        - rounding: One of the decimal module's rounding modes. By default,
+          halves are rounded to the nearest even cent.
+
+        """
+
+        cents = Decimal(value).scaleb(2).to_integral_value(rounding=rounding)
+        return cls.from_cents(int(cents))
+
+    @property
+    def cents(self) -> int:
+        return self._cents
+
+    def to_decimal(self) -> Decimal:
+        return Decimal(self._cents).scaleb(-2)
+
+    def _digits(self) -> str:
+        # Trailing zeros after the decimal point are left off, so e.g. 1050
+        # cents is 10.5 and 1000 cents is 10.
+        dollars, cents = divmod(abs(self._cents), 100)
+        digits = str(dollars)
+        if cents:
+            digits += '.{:02d}'.format(cents).rstrip('0')
+        return digits
 
     def __repr__(self) -> str:
-        return "AUD({!r})".format(super(AUD, self).__str__())
+        sign = '-' if self._cents < 0 else ''
+        return "AUD('{}{}')".format(sign, self._digits())
 
     def __str__(self) -> str:
-        if self < 0:
-            return "-${}".format(-self)
+        if self._cents < 0:
+            return "-${}".format(self._digits())
         else:
-            return "${}".format(self)
+            return "${}".format(self._digits())
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        return (AUD.from_cents, (self._cents,))
+
+    def __copy__(self) -> AUD:
+        return self
 
     def __deepcopy__(self, memo=None) -> AUD:  # noqa
-        return AUD(super(AUD, self).__deepcopy__(memo))
+        # Amounts are immutable, so they can be shared.
+        return self
+
+    def __hash__(self) -> int:
+        # Equal amounts must hash the same as equal ints and Decimals.
+        dollars, cents = divmod(self._cents, 100)
+        if not cents:
+            return hash(dollars)
+        return hash(Fraction(self._cents, 100))
+
+    def __bool__(self) -> bool:
+        return self._cents != 0
+
+    def __eq__(self, other: object) -> bool:
+        cents = _cents(other)
+        if cents is None:
+            return NotImplemented
+        return self._cents == cents
+
+    def __lt__(self, other: object) -> bool:
+        cents = _cents(other)
+        if cents is None:
+            return NotImplemented
+        return self._cents < cents
+
+    def __le__(self, other: object) -> bool:
+        cents = _cents(other)
+        if cents is None:
+            return NotImplemented
+        return self._cents <= cents
+
+    def __gt__(self, other: object) -> bool:
+        cents = _cents(other)
+        if cents is None:
+            return NotImplemented
+        return self._cents > cents
+
+    def __ge__(self, other: object) -> bool:
+        cents = _cents(other)
+        if cents is None:
+            return NotImplemented
+        return self._cents >= cents
 
     def __add__(self, other: object) -> AUD:  # noqa
-        try:
-            return AUD(super(AUD, self).__add__(AUD(other)))
-        except Exception:
+        cents = _cents(other)
+        if cents is None:
             return NotImplemented
+        return AUD.from_cents(self._cents + cents)
 
     def __radd__(self, other: object) -> AUD:  # noqa
         return self.__add__(other)
 
     def __sub__(self, other: object) -> AUD:  # noqa
-        try:
-            return AUD(super(AUD, self).__sub__(AUD(other)))
-        except Exception:
+        cents = _cents(other)
+        if cents is None:
+            return NotImplemented
+        return AUD.from_cents(self._cents - cents)
+
+    def __rsub__(self, other: object) -> AUD:  # noqa
+        cents = _cents(other)
+        if cents is None:
             return NotImplemented
+        return AUD.from_cents(cents - self._cents)
 
     def __neg__(self) -> AUD:  # noqa
-        return AUD(super(AUD, self).__neg__())
+        return AUD.from_cents(-self._cents)
+
+    def __abs__(self) -> AUD:
+        return AUD.from_cents(abs(self._cents))
+
+
+def _decimal_cents(value: Decimal) -> Optional[int]:
+    """Convert a Decimal to a number of cents, if it is a whole number of
+    cents.
+
+    """
+
+    if not value.is_finite():
+        return None
+
+    cents = value.scaleb(2)
+    if cents != cents.to_integral_value():
+        return None
+
+    return int(cents)
+
+
+def _cents(value: object) -> Optional[int]:
+    """Find the number of cents in a value which can be used with AUD, or None
+    if it cannot.
+
+    """
+
+    if type(value) is AUD:
+        return value._cents  # type: ignore
+    if isinstance(value, AUD):
+        return value._cents
+    if isinstance(value, int):
+        return value * 100
+    if isinstance(value, Decimal):
+        return _decimal_cents(value)
+    return None
+
+
+# Amounts are immutable, so the default amount can be shared.
+ZERO = AUD.from_cents(0)
 
 
 class Balance:
@@ -45,15 +214,27 @@ class Balance:
 
     """
 
+    __slots__ = ('available', 'pending')
+
     def __init__(self, available: AUD = None, pending: AUD = None) -> None:
-        self.available = available if available is not None else AUD('0')
-        self.pending = pending if pending is not None else AUD('0')
-        self.total = self.available - self.pending
+        self.available = available if available is not None else ZERO
+        self.pending = pending if pending is not None else ZERO
+
+    @property
+    def total(self) -> AUD:
+        return self.available - self.pending
 
     def __repr__(self) -> str:
         return "Balance(available={!r},pending={!r})".format(self.available,
                                                              self.pending)
 
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Balance):
+            return NotImplemented
+
+        return (self.available == other.available and
+                self.pending == other.pending)
+
     def __add__(self, other: object) -> Balance:  # noqa
         if other == 0:
             return Balance(available=self.available, pending=self.pending)
@@ -79,10 +260,16 @@ class Balance:
 
 
 class CardNumber:
-    """A value object representing a card number."""
+    """A value object representing a card number. It is immutable."""
+
+    __slots__ = ('_value',)
 
     def __init__(self, value: str) -> None:
-        self.value = value
+        self._value = value
+
+    @property
+    def value(self) -> str:
+        return self._value
 
     def __repr__(self) -> str:
         return "CardNumber({!r})".format(self.value)
@@ -92,7 +279,10 @@ class CardNumber:
                         for i in range(0, len(self.value), 4))
 
     def __deepcopy__(self, memo=None) -> CardNumber:  # noqa
-        return CardNumber(self.value)
+        return self
 
     def __eq__(self, other) -> bool:
         return isinstance(other, CardNumber) and other.value == self.value
+
+    def __hash__(self) -> int:
+        return hash(self.value)
@@ -0,0 +1,119 @@
+"""Measure how many units of work per second can read a small set of hot
+accounts, or mostly read them and sometimes make transfers between them,
+with and without an AggregateCache shared between the units of work. A
+transfer invalidates the cached accounts it changes.
+
+Run from the root of the repository with:
+    python -m benchmarks.aggregate_cache
+
+"""
+
+import gc
+import random
+import time
+import uuid
+from functools import partial
+
+from account import AccountTransferService, AUD, RegularAccount
+from account.transaction import (
+    Transaction,
+    TransactionStatus,
+    TransactionType,
+)
+from infrastructure import (
+    AggregateCache,
+    InMemoryRepository,
+    MemoryStore,
+    WorkManager,
+)
+
+
+ACCOUNTS = 10000
+HOT = 100
+# The number of transactions each account starts with.
+HISTORY = 10
+UNITS = 5000
+# The share of the units of work which make a transfer in the mixed work.
+TRANSFERS = 0.1
+
+
+class LazyRepository(InMemoryRepository):
+    lazy_transactions = True
+
+
+def build_store():
+    store = MemoryStore()
+
+    accounts = []
+    for _ in range(ACCOUNTS):
+        account = RegularAccount(owner=uuid.uuid4())
+        for _ in range(HISTORY):
+            account.default_subaccount.add_transaction(Transaction(
+                reference=uuid.uuid4(),
+                amount=AUD(100),
+                type=TransactionType.CREDIT,
+                status=TransactionStatus.SETTLED,
+            ))
+        accounts.append(account)
+
+    InMemoryRepository(store).add_many(accounts)
+    return store, [a.id for a in accounts]
+
+
+def reads(work_manager, factory, pairs):
+    for account_id, _ in pairs:
+        with work_manager.scope() as unit:
+            unit.get(factory).get(account_id).balance
+
+
+def mixed(work_manager, factory, pairs):
+    random.seed(1)
+    for source, destination in pairs:
+        with work_manager.scope() as unit:
+            repository = unit.get(factory)
+            if random.random() < TRANSFERS:
+                AccountTransferService(repository).transfer(
+                    source, destination, AUD.from_cents(1),
+                )
+            else:
+                repository.get(source).balance
+
+
+def main():
+    print("{} units of work on {} hot accounts out of {}."
+          .format(UNITS, HOT, ACCOUNTS))
+    print()
+    print("{:<10} {:<10} {:<8} {:>10} {:>14} {:>10}"
+          .format('work', 'loading', 'cache', 'time (s)', 'units/sec',
+                  'hit rate'))
+
+    for name, work in (('reads', reads), ('mixed', mixed)):
+        for loading, repository in (('eager', InMemoryRepository),
+                                    ('lazy', LazyRepository)):
+            for cached in (False, True):
+                # Transfers add to the histories of the accounts, so each
+                # run starts from the same store.
+                store, ids = build_store()
+                gc.collect()
+                random.seed(0)
+                hot_ids = random.sample(ids, HOT)
+                pairs = [random.sample(hot_ids, 2) for _ in range(UNITS)]
+
+                cache = AggregateCache(store) if cached else None
+                factory = partial(repository, cache=cache)
+
+                start = time.perf_counter()
+                work(WorkManager(store), factory, pairs)
+                elapsed = time.perf_counter() - start
+
+                hit_rate = '-'
+                if cache is not None:
+                    hit_rate = '{:.2f}'.format(cache.stats().hit_rate)
+
+                print("{:<10} {:<10} {:<8} {:>10.3f} {:>14.0f} {:>10}"
+                      .format(name, loading, 'yes' if cached else 'no',
+                              elapsed, UNITS / elapsed, hit_rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Compare making many concurrent transfers from an event loop by handing
+each call to the synchronous services to a thread, against awaiting the
+asynchronous services directly, with and without a write-ahead log.
+
+Run from the root of the repository with:
+    python -m benchmarks.asyncio_services
+
+"""
+
+import asyncio
+import random
+import tempfile
+import time
+import uuid
+
+from account import (
+    AccountTransferService,
+    AsyncAccountTransferService,
+    AUD,
+    RegularAccount,
+)
+from account.transaction import (
+    Transaction,
+    TransactionStatus,
+    TransactionType,
+)
+from infrastructure import (
+    AsyncInMemoryRepository,
+    AsyncWorkManager,
+    InMemoryRepository,
+    MemoryStore,
+    SyncPolicy,
+    WorkManager,
+    WriteAheadLog,
+)
+
+
+ACCOUNTS = 1000
+REQUESTS = 2000
+
+
+def build_store(log=None):
+    store = MemoryStore(log=log)
+
+    accounts = []
+    for _ in range(ACCOUNTS):
+        account = RegularAccount(owner=uuid.uuid4())
+        account.default_subaccount.add_transaction(Transaction(
+            reference=uuid.uuid4(),
+            amount=AUD(1000),
+            type=TransactionType.CREDIT,
+            status=TransactionStatus.SETTLED,
+        ))
+        accounts.append(account)
+
+    InMemoryRepository(store).add_many(accounts)
+    return store, [a.id for a in accounts]
+
+
+def build_requests(ids):
+    random.seed(0)
+    return [(source, destination, AUD.from_cents(random.randint(1, 1000)))
+            for source, destination in (random.sample(ids, 2)
+                                        for _ in range(REQUESTS))]
+
+
+async def in_threads(store, requests):
+    work_manager = WorkManager(store)
+    loop = asyncio.get_running_loop()
+
+    def transfer(source, destination, amount):
+        def work(unit):
+            service = AccountTransferService(unit.get(InMemoryRepository))
+            service.transfer(source, destination, amount)
+
+        work_manager.run(work, attempts=100)
+
+    await asyncio.gather(*(loop.run_in_executor(None, transfer, *r)
+                           for r in requests))
+
+
+async def on_event_loop(store, requests):
+    work_manager = AsyncWorkManager(store)
+
+    async def transfer(source, destination, amount):
+        async def work(unit):
+            service = AsyncAccountTransferService(
+                unit.get(AsyncInMemoryRepository),
+            )
+            await service.transfer(source, destination, amount)
+
+        await work_manager.run(work, attempts=100)
+
+    await asyncio.gather(*(transfer(*r) for r in requests))
+
+
+def total(store, ids):
+    accounts = InMemoryRepository(store).get_many(ids)
+    return sum((a.balance.available for a in accounts), AUD(0))
+
+
+def main():
+    print("{} concurrent transfers between {} accounts."
+          .format(REQUESTS, ACCOUNTS))
+    print()
+    print("{:<8} {:<16} {:>10} {:>16}"
+          .format('log', 'method', 'time (s)', 'transfers/sec'))
+
+    for log_name in ('none', 'group'):
+        for name, method in (('thread per call', in_threads),
+                             ('asyncio', on_event_loop)):
+            with tempfile.TemporaryDirectory() as directory:
+                log = None
+                if log_name == 'group':
+                    log = WriteAheadLog(directory, sync=SyncPolicy.GROUP)
+
+                store, ids = build_store(log)
+                requests = build_requests(ids)
+                before = total(store, ids)
+
+                start = time.perf_counter()
+                asyncio.run(method(store, requests))
+                elapsed = time.perf_counter() - start
+
+                assert total(store, ids) == before, \
+                    'Money was created or lost.'
+                store.close()
+
+            print("{:<8} {:<16} {:>10.3f} {:>16.0f}"
+                  .format(log_name, name, elapsed, REQUESTS / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Compare adding accounts one at a time with bulk loading them, and measure
+how quickly pre-serialised rows can be bulk loaded.
+
+Run from the root of the repository with:
+    python -m benchmarks.bulk_load
+
+"""
+
+import json
+import random
+import time
+import uuid
+
+from account import AUD, RegularAccount
+from account.transaction import (
+    Transaction,
+    TransactionStatus,
+    TransactionType,
+)
+from infrastructure import InMemoryRepository, load_ndjson, MemoryStore
+
+
+ACCOUNTS = 1000
+TRANSACTIONS_PER_ACCOUNT = 100
+
+# The number of transaction rows to load from NDJSON.
+ROWS = 1000000
+ROW_ACCOUNTS = 10000
+
+
+def build_accounts():
+    random.seed(0)
+    accounts = []
+    for _ in range(ACCOUNTS):
+        account = RegularAccount(owner=uuid.uuid4())
+        for _ in range(TRANSACTIONS_PER_ACCOUNT):
+            account.default_subaccount.add_transaction(Transaction(
+                reference=uuid.uuid4(),
+                amount=AUD.from_cents(random.randint(1, 100000)),
+                type=TransactionType.CREDIT,
+                status=TransactionStatus.SETTLED,
+            ))
+        accounts.append(account)
+    return accounts
+
+
+def build_rows():
+    random.seed(0)
+    subaccounts = [str(uuid.uuid4()) for _ in range(ROW_ACCOUNTS)]
+    for _ in range(ROWS):
+        yield json.dumps({
+            'table': 'transaction',
+            'id': str(uuid.uuid4()),
+            'reference': str(uuid.uuid4()),
+            'amount': random.randint(1, 100000),
+            'type': 'CREDIT',
+            'account': random.choice(subaccounts),
+            'status': 'SETTLED',
+        })
+
+
+def add_one_at_a_time(accounts):
+    repository = InMemoryRepository(MemoryStore())
+    start = time.perf_counter()
+    for account in accounts:
+        repository.add(account)
+    return time.perf_counter() - start
+
+
+def add_many(accounts):
+    repository = InMemoryRepository(MemoryStore())
+    return repository.add_many(accounts).seconds
+
+
+def main():
+    accounts = build_accounts()
+    records = ACCOUNTS * (TRANSACTIONS_PER_ACCOUNT + 2)
+    print("Adding {} accounts with {} transactions each ({} records)."
+          .format(ACCOUNTS, TRANSACTIONS_PER_ACCOUNT, records))
+    print()
+    print("{:<24} {:>10} {:>14}".format('method', 'time (s)', 'rows/sec'))
+
+    for name, method in (('InMemoryRepository.add', add_one_at_a_time),
+                         ('add_many', add_many)):
+        elapsed = method(accounts)
+        print("{:<24} {:>10.3f} {:>14.0f}"
+              .format(name, elapsed, records / elapsed))
+
+    print()
+    print("Loading {} transaction rows from NDJSON.".format(ROWS))
+    rows = list(build_rows())
+
+    # Create the indexes first, so the load has to bring them up to date.
+    store = MemoryStore()
+    InMemoryRepository(store)
+    print(load_ndjson(store, rows))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Compare how long it takes a fresh process to be able to answer queries
+about a ledger when it is rebuilt with InMemoryRepository.add and when it is
+opened from a memory-mapped snapshot.
+
+Run from the root of the repository with:
+    python -m benchmarks.cold_start
+
+"""
+
+import os
+import random
+import tempfile
+import time
+import uuid
+
+from account import AUD, Card, CardNumber, ExternalCounterparty, RegularAccount
+from account.transaction import (
+    Transaction,
+    TransactionStatus,
+    TransactionType,
+)
+from infrastructure import (
+    InMemoryRepository,
+    MappedSnapshot,
+    MemoryStore,
+    RecordMode,
+    write_snapshot,
+)
+
+
+ACCOUNTS = 2000
+TRANSACTIONS_PER_ACCOUNT = 50
+
+
+def build_accounts():
+    accounts = [ExternalCounterparty(owner=uuid.uuid4())]
+    for i in range(ACCOUNTS):
+        number = CardNumber('{:016d}'.format(i))
+        account = RegularAccount(owner=uuid.uuid4(),
+                                 cards=[Card(number=number)])
+        for _ in range(TRANSACTIONS_PER_ACCOUNT):
+            account.default_subaccount.add_transaction(Transaction(
+                reference=uuid.uuid4(),
+                amount=AUD('{:.2f}'.format(random.randint(1, 10000) / 100)),
+                type=TransactionType.CREDIT,
+                status=TransactionStatus.SETTLED,
+            ))
+        accounts.append(account)
+    return accounts
+
+
+def rebuild(accounts):
+    store = MemoryStore(record_mode=RecordMode.FROZEN)
+    repository = InMemoryRepository(store)
+    for account in accounts:
+        repository.add(account)
+    return store
+
+
+def main():
+    accounts = build_accounts()
+    account_id = accounts[-1].id
+    card_number = CardNumber('{:016d}'.format(ACCOUNTS - 1))
+
+    start = time.perf_counter()
+    store = rebuild(accounts)
+    InMemoryRepository(store).get(account_id)
+    print("Rebuilding with add:          {:8.3f}s"
+          .format(time.perf_counter() - start))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'ledger.snapshot')
+        write_snapshot(store, path)
+        print("Snapshot size:                {:8.1f}MB"
+              .format(os.path.getsize(path) / 1e6))
+
+        start = time.perf_counter()
+        snapshot = MappedSnapshot(path)
+        store = MemoryStore(record_mode=RecordMode.FROZEN, base=snapshot)
+        repository = InMemoryRepository(store)
+        repository.get(account_id)
+        repository.find_by_card_number(card_number)
+        print("Opening the snapshot:         {:8.3f}s"
+              .format(time.perf_counter() - start))
+
+        snapshot.close()
+
+
+if __name__ == '__main__':
+    main()
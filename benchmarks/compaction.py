@@ -0,0 +1,93 @@
+"""Measure how long it takes to load accounts with long histories of settled
+transactions, before and after compacting them into checkpoints, and how
+long compacting takes.
+
+Run from the root of the repository with:
+    python -m benchmarks.compaction
+
+"""
+
+import time
+import uuid
+
+from account import AUD, RegularAccount
+from account.transaction import (
+    Transaction,
+    TransactionStatus,
+    TransactionType,
+)
+from infrastructure import (
+    compact_history,
+    InMemoryRepository,
+    MemoryStore,
+    WorkManager,
+)
+
+
+ACCOUNTS = 1000
+HISTORY = 200
+# The number of recent transactions which are still pending.
+PENDING = 5
+ROUNDS = 5
+
+
+def build_store():
+    store = MemoryStore()
+
+    accounts = []
+    for _ in range(ACCOUNTS):
+        account = RegularAccount(owner=uuid.uuid4())
+        for i in range(HISTORY):
+            account.default_subaccount.add_transaction(Transaction(
+                reference=uuid.uuid4(),
+                amount=AUD(10),
+                type=TransactionType.CREDIT,
+                status=(TransactionStatus.PENDING if i >= HISTORY - PENDING
+                        else TransactionStatus.SETTLED),
+            ))
+        accounts.append(account)
+
+    InMemoryRepository(store).add_many(accounts)
+    return store, [a.id for a in accounts]
+
+
+def load(work_manager, ids):
+    """Load every account in a unit of work, a number of times.
+
+    Returns the mean time taken and the balances of the accounts.
+
+    """
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        with work_manager.scope() as unit:
+            accounts = unit.get(InMemoryRepository).get_many(ids)
+    elapsed = (time.perf_counter() - start) / ROUNDS
+
+    return elapsed, [a.balance for a in accounts]
+
+
+def main():
+    print("Loading {} accounts of {} transactions, {} of them pending."
+          .format(ACCOUNTS, HISTORY, PENDING))
+    print()
+
+    store, ids = build_store()
+    work_manager = WorkManager(store)
+
+    elapsed, before = load(work_manager, ids)
+    print("{:<24} {:>10.3f}s".format('load before compacting', elapsed))
+
+    start = time.perf_counter()
+    compacted = compact_history(work_manager, ids)
+    print("{:<24} {:>10.3f}s ({} transactions)"
+          .format('compact', time.perf_counter() - start, compacted))
+
+    elapsed, after = load(work_manager, ids)
+    print("{:<24} {:>10.3f}s".format('load after compacting', elapsed))
+
+    assert after == before, 'The balances changed.'
+
+
+if __name__ == '__main__':
+    main()
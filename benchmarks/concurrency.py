@@ -0,0 +1,143 @@
+"""Make transfers and card purchases from a number of threads at once, with
+and without per-account locks, and check that no money is created or lost.
+
+Run from the root of the repository with:
+    python -m benchmarks.concurrency
+
+"""
+
+import random
+import threading
+import time
+import uuid
+
+from account import (
+    AccountTransferService,
+    AUD,
+    Card,
+    CardNumber,
+    CardPurchaseService,
+    ExternalCounterparty,
+    RegularAccount,
+)
+from account.transaction import (
+    Transaction,
+    TransactionStatus,
+    TransactionType,
+)
+from infrastructure import (
+    InMemoryRepository,
+    LockTable,
+    MemoryStore,
+    WorkManager,
+)
+
+
+CUSTOMERS = 200
+MERCHANTS = 20
+THREADS = 8
+OPERATIONS = 500
+
+
+def build_store():
+    store = MemoryStore()
+
+    customers = []
+    for i in range(CUSTOMERS):
+        customer = RegularAccount(
+            owner=uuid.uuid4(),
+            cards=[Card(number=CardNumber('{:016d}'.format(i)))],
+        )
+        customer.default_subaccount.add_transaction(Transaction(
+            reference=uuid.uuid4(),
+            amount=AUD(1000000),
+            type=TransactionType.CREDIT,
+            status=TransactionStatus.SETTLED,
+        ))
+        customers.append(customer)
+
+    merchants = [ExternalCounterparty(owner=uuid.uuid4())
+                 for _ in range(MERCHANTS)]
+
+    InMemoryRepository(store).add_many(customers + merchants)
+    return store, customers, merchants
+
+
+def totals(store, ids):
+    accounts = InMemoryRepository(store).get_many(ids)
+    return (sum((a.balance.available for a in accounts), AUD(0)),
+            sum((a.balance.pending for a in accounts), AUD(0)))
+
+
+def worker(work_manager, customers, merchants, seed, attempts):
+    generator = random.Random(seed)
+
+    def counted(work):
+        def attempt(unit):
+            attempts.append(1)
+            work(unit)
+        return attempt
+
+    for _ in range(OPERATIONS):
+        amount = AUD.from_cents(generator.randint(1, 10000))
+
+        if generator.random() < 0.5:
+            source, destination = generator.sample(customers, 2)
+
+            def transfer(unit):
+                service = AccountTransferService(unit.get(InMemoryRepository))
+                service.transfer(source.id, destination.id, amount)
+
+            work_manager.run(counted(transfer), attempts=1000)
+        else:
+            customer = generator.choice(customers)
+            merchant = generator.choice(merchants)
+            reference = uuid.uuid4()
+
+            def purchase(unit):
+                service = CardPurchaseService(unit.get(InMemoryRepository))
+                service.make_purchase(customer.card_numbers[0], merchant.id,
+                                      amount, reference)
+
+            work_manager.run(counted(purchase), attempts=1000)
+
+
+def main():
+    print("{} threads each making {} transfers and purchases between {} "
+          "customers and {} merchants."
+          .format(THREADS, OPERATIONS, CUSTOMERS, MERCHANTS))
+    print()
+    print("{:<12} {:>10} {:>16} {:>10} {:>10}"
+          .format('locking', 'time (s)', 'operations/sec', 'retries',
+                  'conserved'))
+
+    for name, locks in (('none', None), ('striped', LockTable())):
+        store, customers, merchants = build_store()
+        ids = [a.id for a in customers + merchants]
+        before = totals(store, ids)
+
+        work_manager = WorkManager(store, locks)
+        attempts = []
+        threads = [threading.Thread(target=worker,
+                                    args=(work_manager, customers, merchants,
+                                          seed, attempts))
+                   for seed in range(THREADS)]
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        operations = THREADS * OPERATIONS
+        after = totals(store, ids)
+        print("{:<12} {:>10.3f} {:>16.0f} {:>10} {:>10}"
+              .format(name, elapsed, operations / elapsed,
+                      len(attempts) - operations, str(before == after)))
+
+        assert before == after, 'Money was created or lost.'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Compare reading the latest page of an account's transactions with
+InMemoryRepository.history against loading the whole account, for accounts
+with histories of different lengths. The oldest page is also read from a
+cursor, which should take as long as the latest.
+
+Run from the root of the repository with:
+    python -m benchmarks.history
+
+"""
+
+import time
+import uuid
+
+from account import AUD, RegularAccount
+from account.transaction import (
+    Transaction,
+    TransactionStatus,
+    TransactionType,
+)
+from infrastructure import InMemoryRepository, MemoryStore, WorkManager
+
+
+HISTORIES = (100, 1000, 10000)
+PAGE = 20
+ROUNDS = 50
+
+
+def build_store(history):
+    store = MemoryStore()
+
+    account = RegularAccount(owner=uuid.uuid4())
+    for _ in range(history):
+        account.default_subaccount.add_transaction(Transaction(
+            reference=uuid.uuid4(),
+            amount=AUD(10),
+            type=TransactionType.CREDIT,
+            status=TransactionStatus.SETTLED,
+        ))
+
+    InMemoryRepository(store).add_many([account])
+    return store, account.id
+
+
+def whole_account(work_manager, account_id):
+    with work_manager.scope() as unit:
+        account = unit.get(InMemoryRepository).get(account_id)
+        return account.default_subaccount.transactions[-PAGE:]
+
+
+def history_page(work_manager, account_id, cursor=None):
+    with work_manager.scope() as unit:
+        return list(unit.get(InMemoryRepository).history(account_id,
+                                                         cursor=cursor,
+                                                         limit=PAGE))
+
+
+def last_cursor(work_manager, account_id, history):
+    """Find the cursor of the oldest page of the history."""
+
+    with work_manager.scope() as unit:
+        return unit.get(InMemoryRepository).history(
+            account_id, limit=history - PAGE,
+        ).cursor
+
+
+def main():
+    print("Reading a page of {} transactions, {} times.".format(PAGE, ROUNDS))
+    print()
+    print("{:<10} {:>16} {:>16} {:>16}".format('history', 'whole (ms)',
+                                               'page (ms)',
+                                               'oldest page (ms)'))
+
+    for history in HISTORIES:
+        store, account_id = build_store(history)
+        work_manager = WorkManager(store)
+        cursor = last_cursor(work_manager, account_id, history)
+
+        timings = []
+        for read in (whole_account,
+                     history_page,
+                     lambda w, a: history_page(w, a, cursor)):
+            start = time.perf_counter()
+            for _ in range(ROUNDS):
+                transactions = read(work_manager, account_id)
+            timings.append((time.perf_counter() - start) / ROUNDS * 1000)
+            assert len(transactions) == PAGE
+
+        print("{:<10} {:>16.2f} {:>16.2f} {:>16.2f}".format(history,
+                                                           *timings))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""Make card purchases at a single merchant from a number of units of work
+which are in progress at the same time, with the merchant's credits going
+to its regular subaccount or striped across sub-ledgers, and count the
+units of work which conflict.
+
+Then make purchases at the merchant from a number of threads which share a
+LockTable, with each unit of work waiting a little before it commits, e.g.
+for a call to a card network. External counterparties are locked by the
+subaccounts their units of work change, so the purchases only wait for each
+other when they credit the same stripe.
+
+Run from the root of the repository with:
+    python -m benchmarks.hot_accounts
+
+"""
+
+import random
+import threading
+import time
+import uuid
+
+from account import (
+    AUD,
+    Card,
+    CardNumber,
+    CardPurchaseService,
+    ExternalCounterparty,
+    RegularAccount,
+    StripeRollupService,
+    TransactionSettlementService,
+)
+from account.transaction import (
+    Transaction,
+    TransactionStatus,
+    TransactionType,
+)
+from infrastructure import (
+    InMemoryRepository,
+    LockTable,
+    MemoryStore,
+    WorkManager,
+    WriteConflict,
+)
+
+
+CUSTOMERS = 1000
+# The number of units of work in progress at once, and the number of times
+# that many are run.
+CONCURRENT = 8
+ROUNDS = 250
+STRIPES = (0, 4, 16, 64)
+
+# The threads which make purchases with locks, the purchases each makes, and
+# how long each unit of work waits before committing, in seconds.
+THREADS = 8
+PURCHASES = 50
+LATENCY = 0.002
+
+
+class LazyRepository(InMemoryRepository):
+    lazy_transactions = True
+
+
+def build_store(stripes):
+    store = MemoryStore()
+
+    customers = []
+    for i in range(CUSTOMERS):
+        customer = RegularAccount(
+            owner=uuid.uuid4(),
+            cards=[Card(number=CardNumber('{:016d}'.format(i)))],
+        )
+        customer.default_subaccount.add_transaction(Transaction(
+            reference=uuid.uuid4(),
+            amount=AUD(1000000),
+            type=TransactionType.CREDIT,
+            status=TransactionStatus.SETTLED,
+        ))
+        customers.append(customer)
+
+    merchant = ExternalCounterparty(owner=uuid.uuid4(), stripes=stripes)
+
+    InMemoryRepository(store).add_many(customers + [merchant])
+    return store, customers, merchant
+
+
+def run_rounds(work_manager, customers, merchant):
+    """Begin a number of units of work which each make a purchase, then
+    commit them in turn.
+
+    Returns the references of the purchases which were made, and the number
+    which conflicted.
+
+    """
+
+    random.seed(0)
+    references = []
+    conflicts = 0
+
+    for _ in range(ROUNDS):
+        units = []
+        for customer in random.sample(customers, CONCURRENT):
+            reference = uuid.uuid4()
+            unit = work_manager.unit()
+            unit.begin()
+            CardPurchaseService(unit.get(LazyRepository)).make_purchase(
+                customer.card_numbers[0], merchant.id,
+                AUD.from_cents(random.randint(1, 10000)), reference,
+            )
+            units.append((unit, reference))
+
+        for unit, reference in units:
+            try:
+                unit.commit()
+            except WriteConflict:
+                conflicts += 1
+            else:
+                references.append(reference)
+
+    return references, conflicts
+
+
+def locked_worker(work_manager, customers, merchant, seed, attempts):
+    generator = random.Random(seed)
+
+    for customer in generator.sample(customers, PURCHASES):
+        reference = uuid.uuid4()
+        amount = AUD.from_cents(generator.randint(1, 10000))
+
+        def purchase(unit):
+            attempts.append(1)
+            CardPurchaseService(unit.get(LazyRepository)).make_purchase(
+                customer.card_numbers[0], merchant.id, amount, reference,
+            )
+            time.sleep(LATENCY)
+
+        work_manager.run(purchase, attempts=1000)
+
+
+def run_locked(store, customers, merchant):
+    """Make purchases from a number of threads at once, with a LockTable.
+
+    Returns the time taken and the number of retries.
+
+    """
+
+    work_manager = WorkManager(store, LockTable())
+    attempts = []
+    threads = [threading.Thread(target=locked_worker,
+                                args=(work_manager, customers, merchant,
+                                      seed, attempts))
+               for seed in range(THREADS)]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return elapsed, len(attempts) - THREADS * PURCHASES
+
+
+def main():
+    print("{} rounds of {} concurrent purchases at one merchant."
+          .format(ROUNDS, CONCURRENT))
+    print()
+    print("{:<8} {:>10} {:>16} {:>10} {:>12}"
+          .format('stripes', 'time (s)', 'purchases/sec', 'conflicts',
+                  'rolled up'))
+
+    for stripes in STRIPES:
+        store, customers, merchant = build_store(stripes)
+        work_manager = WorkManager(store)
+
+        start = time.perf_counter()
+        references, conflicts = run_rounds(work_manager, customers, merchant)
+        elapsed = time.perf_counter() - start
+
+        with work_manager.scope() as unit:
+            repository = unit.get(LazyRepository)
+            TransactionSettlementService(repository).settle_many(references)
+            rolled_up = StripeRollupService(repository).roll_up(
+                [merchant.id])[merchant.id]
+
+        # Every purchase which was made was credited exactly once, whichever
+        # subaccount it went to.
+        repository = InMemoryRepository(store)
+        spent = AUD(1000000 * CUSTOMERS) - sum(
+            (a.balance.available
+             for a in repository.get_many(c.id for c in customers)),
+            AUD(0),
+        )
+        balance = repository.get(merchant.id).balance
+        assert balance.available == spent
+        assert balance.pending == AUD(0)
+
+        purchases = ROUNDS * CONCURRENT
+        print("{:<8} {:>10.3f} {:>16.0f} {:>10} {:>12}"
+              .format(stripes, elapsed, purchases / elapsed, conflicts,
+                      str(rolled_up)))
+
+    print()
+    print("{} threads each making {} purchases at one merchant with locks, "
+          "waiting {}ms in each.".format(THREADS, PURCHASES,
+                                         LATENCY * 1000))
+    print()
+    print("{:<8} {:>10} {:>16} {:>10}"
+          .format('stripes', 'time (s)', 'purchases/sec', 'retries'))
+
+    for stripes in STRIPES:
+        store, customers, merchant = build_store(stripes)
+        elapsed, retries = run_locked(store, customers, merchant)
+
+        # Every purchase is still pending, and was credited exactly once.
+        repository = InMemoryRepository(store)
+        spent = sum((a.balance.pending
+                     for a in repository.get_many(c.id for c in customers)),
+                    AUD(0))
+        assert repository.get(merchant.id).balance.pending == -spent, \
+            'Purchases were lost.'
+
+        purchases = THREADS * PURCHASES
+        print("{:<8} {:>10.3f} {:>16.0f} {:>10}"
+              .format(stripes, elapsed, purchases / elapsed, retries))
+
+
+if __name__ == '__main__':
+    main()
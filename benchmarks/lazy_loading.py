@@ -0,0 +1,110 @@
+"""Compare the services on a long-lived merchant account when the repository
+loads transaction histories eagerly and when it loads them lazily.
+
+Run from the root of the repository with:
+    python -m benchmarks.lazy_loading
+
+"""
+
+import time
+import uuid
+
+from account import (
+    AccountTransferService,
+    AUD,
+    Card,
+    CardNumber,
+    CardPurchaseService,
+    ExternalCounterparty,
+    RegularAccount,
+    TransactionSettlementService,
+)
+from account.transaction import (
+    Transaction,
+    TransactionStatus,
+    TransactionType,
+)
+from infrastructure import InMemoryRepository, MemoryStore, WorkManager
+
+
+HISTORY = 50000
+REPEATS = 5
+
+
+class LazyRepository(InMemoryRepository):
+    lazy_transactions = True
+
+
+def build_store():
+    store = MemoryStore()
+
+    card = Card(number=CardNumber('4' * 16))
+    customer = RegularAccount(owner=uuid.uuid4(), cards=[card])
+    customer.default_subaccount.add_transaction(Transaction(
+        reference=uuid.uuid4(),
+        amount=AUD(1000),
+        type=TransactionType.CREDIT,
+        status=TransactionStatus.SETTLED,
+    ))
+
+    merchant = ExternalCounterparty(owner=uuid.uuid4())
+    for _ in range(HISTORY):
+        merchant.default_subaccount.add_transaction(Transaction(
+            reference=uuid.uuid4(),
+            amount=AUD(1),
+            type=TransactionType.CREDIT,
+            status=TransactionStatus.SETTLED,
+        ))
+
+    InMemoryRepository(store).add_many([customer, merchant])
+    return store, card.number, customer.id, merchant.id
+
+
+def timed(function):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        function()
+    return (time.perf_counter() - start) / REPEATS
+
+
+def main():
+    store, card_number, customer, merchant = build_store()
+    work_manager = WorkManager(store)
+
+    print("A merchant with a history of {} transactions.".format(HISTORY))
+    print()
+    print("{:<20} {:<12} {:>10}".format('repository', 'operation',
+                                         'time (ms)'))
+
+    for repository_class in (InMemoryRepository, LazyRepository):
+        references = []
+
+        def transfer():
+            with work_manager.scope() as unit:
+                service = AccountTransferService(unit.get(repository_class))
+                service.transfer(customer, merchant, AUD(1))
+
+        def purchase():
+            references.append(uuid.uuid4())
+            with work_manager.scope() as unit:
+                service = CardPurchaseService(unit.get(repository_class))
+                service.make_purchase(card_number, merchant, AUD(1),
+                                      references[-1])
+
+        def settle():
+            with work_manager.scope() as unit:
+                service = TransactionSettlementService(
+                    unit.get(repository_class),
+                )
+                service.settle_transaction(references.pop())
+
+        for name, operation in (('transfer', transfer),
+                                ('purchase', purchase),
+                                ('settle', settle)):
+            print("{:<20} {:<12} {:>10.3f}"
+                  .format(repository_class.__name__, name,
+                          timed(operation) * 1000))
+
+
+if __name__ == '__main__':
+    main()
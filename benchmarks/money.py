@@ -0,0 +1,128 @@
+"""Compare folding a balance over a large number of transactions with the
+integer-cents AUD against the Decimal subclass it replaced.
+
+Run from the root of the repository with:
+    python -m benchmarks.money
+
+"""
+
+import random
+import time
+import uuid
+from decimal import Decimal
+from functools import reduce
+
+from account import AUD
+from account.transaction import (
+    Transaction,
+    TransactionStatus,
+    TransactionType,
+)
+from account.values import Balance
+
+
+TRANSACTIONS = 1000000
+
+
+class DecimalAUD(Decimal):
+    """The Decimal subclass which AUD used to be, kept for comparison."""
+
+    def __add__(self, other):
+        try:
+            return DecimalAUD(super(DecimalAUD, self).__add__(
+                DecimalAUD(other)))
+        except Exception:
+            return NotImplemented
+
+    def __sub__(self, other):
+        try:
+            return DecimalAUD(super(DecimalAUD, self).__sub__(
+                DecimalAUD(other)))
+        except Exception:
+            return NotImplemented
+
+    def __neg__(self):
+        return DecimalAUD(super(DecimalAUD, self).__neg__())
+
+
+class DecimalBalance:
+    """The Balance which went with DecimalAUD, kept for comparison."""
+
+    def __init__(self, available=None, pending=None):
+        self.available = (available if available is not None
+                          else DecimalAUD('0'))
+        self.pending = pending if pending is not None else DecimalAUD('0')
+        self.total = self.available - self.pending
+
+    def __add__(self, other):
+        return DecimalBalance(available=self.available + other.available,
+                              pending=self.pending + other.pending)
+
+    def __neg__(self):
+        return DecimalBalance(available=-self.available,
+                              pending=-self.pending)
+
+
+def decimal_adjust(transaction, balance):
+    """Transaction.adjust as it was with DecimalAUD."""
+
+    if transaction.status == TransactionStatus.PENDING:
+        adjustment = DecimalBalance(pending=transaction.amount)
+    else:
+        adjustment = DecimalBalance(available=transaction.amount)
+
+    if transaction.type == TransactionType.DEBIT:
+        adjustment = -adjustment
+
+    return balance + adjustment
+
+
+def build_transactions(amount_type):
+    random.seed(0)
+    transactions = []
+    for _ in range(TRANSACTIONS):
+        cents = random.randint(1, 100000)
+        transactions.append(Transaction(
+            reference=uuid.uuid4(),
+            amount=amount_type('{}.{:02d}'.format(*divmod(cents, 100))),
+            type=random.choice(list(TransactionType)),
+            status=random.choice(list(TransactionStatus)),
+        ))
+    return transactions
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def main():
+    print("Folding a balance over {} transactions.".format(TRANSACTIONS))
+    print()
+    print("{:<12} {:>10} {:>14}".format('amount', 'time (s)', 'ns/transaction'))
+
+    decimal_transactions = build_transactions(DecimalAUD)
+    decimal_balance, decimal_time = timed(lambda: reduce(
+        lambda b, t: decimal_adjust(t, b), decimal_transactions,
+        DecimalBalance(),
+    ))
+    print("{:<12} {:>10.3f} {:>14.0f}"
+          .format('Decimal', decimal_time,
+                  decimal_time / TRANSACTIONS * 1e9))
+    del decimal_transactions
+
+    cents_transactions = build_transactions(AUD)
+    cents_balance, cents_time = timed(lambda: reduce(
+        lambda b, t: t.adjust(b), cents_transactions, Balance(),
+    ))
+    print("{:<12} {:>10.3f} {:>14.0f}"
+          .format('cents', cents_time, cents_time / TRANSACTIONS * 1e9))
+
+    # Both representations must arrive at exactly the same balance.
+    assert cents_balance.available == decimal_balance.available
+    assert cents_balance.pending == decimal_balance.pending
+
+
+if __name__ == '__main__':
+    main()
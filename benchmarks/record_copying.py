@@ -0,0 +1,97 @@
+"""Compare the cost of reading from a MemoryStore which deep copies its
+records with one which hands out frozen records.
+
+Run from the root of the repository with:
+    python -m benchmarks.record_copying
+
+"""
+
+import gc
+import time
+import tracemalloc
+import uuid
+
+from account import AUD, Card, CardNumber, RegularAccount
+from account.transaction import (
+    Transaction,
+    TransactionStatus,
+    TransactionType,
+)
+from infrastructure import InMemoryRepository, MemoryStore, RecordMode
+
+
+TRANSACTIONS = 1000
+REPEATS = 50
+
+
+def build_store(record_mode):
+    store = MemoryStore(record_mode=record_mode)
+    repository = InMemoryRepository(store)
+
+    account = RegularAccount(owner=uuid.uuid4(),
+                             cards=[Card(number=CardNumber('4' * 16))])
+    for i in range(TRANSACTIONS):
+        account.default_subaccount.add_transaction(Transaction(
+            reference=uuid.uuid4(),
+            amount=AUD(i % 100) + AUD('0.25'),
+            type=TransactionType.CREDIT,
+            status=TransactionStatus.SETTLED,
+        ))
+    repository.add(account)
+
+    transaction_id = account.default_subaccount.transactions[0].id
+    return store, account.id, transaction_id
+
+
+def allocations(function):
+    """Count the memory blocks allocated by a call which are still alive
+    afterwards, and the peak memory used during it.
+
+    """
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = function()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    blocks = sum(s.count_diff for s in after.compare_to(before, 'filename'))
+    del result
+    return blocks, peak
+
+
+def timed(function):
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        function()
+    return (time.perf_counter() - start) / REPEATS
+
+
+def main():
+    print("Reading a record and an account with {} transactions."
+          .format(TRANSACTIONS))
+    print()
+    print("{:<8} {:<24} {:>8} {:>12} {:>12}"
+          .format('mode', 'operation', 'blocks', 'peak bytes', 'time (ms)'))
+
+    for record_mode in (RecordMode.COPY, RecordMode.FROZEN):
+        store, account_id, transaction_id = build_store(record_mode)
+
+        operations = (
+            ('MemoryStore.get',
+             lambda: store.get('transaction', transaction_id)),
+            ('InMemoryRepository.get',
+             lambda: InMemoryRepository(store).get(account_id)),
+        )
+
+        for name, operation in operations:
+            blocks, peak = allocations(operation)
+            print("{:<8} {:<24} {:>8} {:>12} {:>12.3f}"
+                  .format(record_mode.name, name, blocks, peak,
+                          timed(operation) * 1000))
+
+
+if __name__ == '__main__':
+    main()
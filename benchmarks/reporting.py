@@ -0,0 +1,116 @@
+"""Compare calculating the balance of every account from its transactions by
+loading the accounts one by one, with exporting the transactions into NumPy
+arrays and summing them up with report_balances.
+
+A store of 10 million transactions takes well over 8GB of memory, so this
+uses a tenth of that by default. Change TRANSACTIONS to try others.
+
+Run from the root of the repository with:
+    python -m benchmarks.reporting
+
+"""
+
+import gc
+import random
+import time
+import uuid
+
+from account import AUD, RegularAccount
+from account.transaction import (
+    Transaction,
+    TransactionStatus,
+    TransactionType,
+)
+from account.values import Balance
+from infrastructure import (
+    export_transactions,
+    InMemoryRepository,
+    MemoryStore,
+    WorkManager,
+)
+
+
+ACCOUNTS = 10000
+TRANSACTIONS = 1000000
+# The accounts are loaded in batches of this many per unit of work.
+BATCH = 1000
+
+
+def build_store():
+    store = MemoryStore()
+    random.seed(0)
+
+    accounts = []
+    for _ in range(ACCOUNTS):
+        account = RegularAccount(owner=uuid.uuid4())
+        for _ in range(TRANSACTIONS // ACCOUNTS):
+            account.default_subaccount.add_transaction(Transaction(
+                reference=uuid.uuid4(),
+                amount=AUD.from_cents(random.randint(1, 100000)),
+                type=random.choice((TransactionType.CREDIT,
+                                    TransactionType.DEBIT)),
+                status=random.choice((TransactionStatus.PENDING,
+                                      TransactionStatus.SETTLED)),
+            ))
+        accounts.append(account)
+
+        # Loading a batch at a time keeps the Transaction objects from
+        # piling up.
+        if len(accounts) == BATCH:
+            InMemoryRepository(store).add_many(accounts)
+            accounts = []
+
+    InMemoryRepository(store).add_many(accounts)
+    return store
+
+
+def per_account(store):
+    """Load every account, and add up the transactions of its subaccounts."""
+
+    ids, = store.find_columns('account', ('id',))
+    work_manager = WorkManager(store)
+
+    balances = {}
+    for start in range(0, len(ids), BATCH):
+        with work_manager.scope() as unit:
+            accounts = unit.get(InMemoryRepository).get_many(
+                ids[start:start + BATCH],
+            )
+            for account in accounts:
+                balances[account.id] = sum(
+                    (s.calculate_balance() for s in account.subaccounts),
+                    Balance(),
+                )
+
+    return balances
+
+
+def main():
+    print("Calculating the balances of {} accounts from {} transactions."
+          .format(ACCOUNTS, TRANSACTIONS))
+    print()
+
+    store = build_store()
+    gc.collect()
+
+    start = time.perf_counter()
+    expected = per_account(store)
+    print("{:<24} {:>10.3f}s".format('per account',
+                                     time.perf_counter() - start))
+
+    start = time.perf_counter()
+    arrays = export_transactions(store)
+    exported = time.perf_counter()
+    report = arrays.balances()
+    finished = time.perf_counter()
+
+    print("{:<24} {:>10.3f}s".format('export to arrays', exported - start))
+    print("{:<24} {:>10.3f}s".format('vectorised balances',
+                                     finished - exported))
+    print("{:<24} {:>10.3f}s".format('report_balances', finished - start))
+
+    assert dict(report.items()) == expected, 'The balances differ.'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""Compare running a queue of transfers and purchases one at a time, on a
+pool of threads as they come, and in waves of operations on disjoint
+accounts with TransferScheduler.
+
+Run from the root of the repository with:
+    python -m benchmarks.scheduler
+
+"""
+
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from account import (
+    AccountTransferService,
+    AUD,
+    Card,
+    CardNumber,
+    CardPurchaseService,
+    ExternalCounterparty,
+    RegularAccount,
+)
+from account.transaction import (
+    Transaction,
+    TransactionStatus,
+    TransactionType,
+)
+from infrastructure import (
+    InMemoryRepository,
+    MemoryStore,
+    TransferScheduler,
+    WorkManager,
+)
+
+
+CUSTOMERS = 1000
+MERCHANTS = 50
+OPERATIONS = 5000
+WORKERS = 8
+
+
+def build_store():
+    store = MemoryStore()
+
+    customers = []
+    for i in range(CUSTOMERS):
+        customer = RegularAccount(
+            owner=uuid.uuid4(),
+            cards=[Card(number=CardNumber('{:016d}'.format(i)))],
+        )
+        customer.default_subaccount.add_transaction(Transaction(
+            reference=uuid.uuid4(),
+            amount=AUD(1000000),
+            type=TransactionType.CREDIT,
+            status=TransactionStatus.SETTLED,
+        ))
+        customers.append(customer)
+
+    merchants = [ExternalCounterparty(owner=uuid.uuid4())
+                 for _ in range(MERCHANTS)]
+
+    InMemoryRepository(store).add_many(customers + merchants)
+    return store, customers, merchants
+
+
+def build_operations(customers, merchants):
+    random.seed(0)
+    operations = []
+    for _ in range(OPERATIONS):
+        amount = AUD.from_cents(random.randint(1, 10000))
+        if random.random() < 0.5:
+            source, destination = random.sample(customers, 2)
+            operations.append(('transfer', source.id, destination.id,
+                               amount))
+        else:
+            operations.append(('purchase', random.choice(customers)
+                               .card_numbers[0],
+                               random.choice(merchants).id, amount,
+                               uuid.uuid4()))
+    return operations
+
+
+def work_for(operation):
+    kind, *arguments = operation
+
+    def work(unit):
+        repository = unit.get(InMemoryRepository)
+        if kind == 'transfer':
+            AccountTransferService(repository).transfer(*arguments)
+        else:
+            CardPurchaseService(repository).make_purchase(*arguments)
+
+    return work
+
+
+def one_at_a_time(work_manager, operations):
+    for operation in operations:
+        with work_manager.scope() as unit:
+            work_for(operation)(unit)
+
+
+def thread_pool(work_manager, operations):
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        futures = [executor.submit(work_manager.run, work_for(o), 1000)
+                   for o in operations]
+    for future in futures:
+        future.result()
+
+
+def waves(work_manager, operations):
+    with TransferScheduler(work_manager, workers=WORKERS) as scheduler:
+        futures = []
+        for kind, *arguments in operations:
+            if kind == 'transfer':
+                futures.append(scheduler.transfer(*arguments))
+            else:
+                futures.append(scheduler.purchase(*arguments))
+        scheduler.drain()
+        stats = scheduler.stats()
+
+    for future in futures:
+        future.result()
+
+    return stats
+
+
+def totals(store, ids):
+    accounts = InMemoryRepository(store).get_many(ids)
+    return (sum((a.balance.available for a in accounts), AUD(0)),
+            sum((a.balance.pending for a in accounts), AUD(0)))
+
+
+def main():
+    print("{} transfers and purchases between {} customers and {} merchants."
+          .format(OPERATIONS, CUSTOMERS, MERCHANTS))
+    print()
+    print("{:<16} {:>10} {:>16}".format('method', 'time (s)',
+                                         'operations/sec'))
+
+    for name, method in (('one at a time', one_at_a_time),
+                         ('thread pool', thread_pool),
+                         ('waves', waves)):
+        store, customers, merchants = build_store()
+        operations = build_operations(customers, merchants)
+        ids = [a.id for a in customers + merchants]
+        before = totals(store, ids)
+
+        start = time.perf_counter()
+        stats = method(WorkManager(store), operations)
+        elapsed = time.perf_counter() - start
+
+        assert totals(store, ids) == before, 'Money was created or lost.'
+        print("{:<16} {:>10.3f} {:>16.0f}"
+              .format(name, elapsed, OPERATIONS / elapsed))
+
+    print()
+    print("Waves: {} of mean size {:.1f} and at most {}."
+          .format(stats.waves, stats.mean_wave_size, stats.max_wave_size))
+    print("Latency: p50 {:.3f}s, p99 {:.3f}s."
+          .format(stats.latency(50), stats.latency(99)))
+
+
+if __name__ == '__main__':
+    main()
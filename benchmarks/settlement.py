@@ -0,0 +1,103 @@
+"""Compare settling card purchases one reference at a time with
+TransactionSettlementService.settle_many.
+
+Run from the root of the repository with:
+    python -m benchmarks.settlement
+
+"""
+
+import random
+import time
+import uuid
+
+from account import (
+    AUD,
+    Card,
+    CardNumber,
+    ExternalCounterparty,
+    RegularAccount,
+    TransactionSettlementService,
+)
+from account.transaction import (
+    Transaction,
+    TransactionStatus,
+    TransactionType,
+)
+from infrastructure import InMemoryRepository, MemoryStore, WorkManager
+
+
+CUSTOMERS = 10000
+MERCHANTS = 100
+REFERENCES = 100000
+
+# Settling one reference at a time is slow, so is only timed for a sample.
+SAMPLE = 1000
+
+
+def build_store():
+    random.seed(0)
+
+    customers = []
+    for i in range(CUSTOMERS):
+        customer = RegularAccount(
+            owner=uuid.uuid4(),
+            cards=[Card(number=CardNumber('{:016d}'.format(i)))],
+        )
+        customer.default_subaccount.add_transaction(Transaction(
+            reference=uuid.uuid4(),
+            amount=AUD(1000000),
+            type=TransactionType.CREDIT,
+            status=TransactionStatus.SETTLED,
+        ))
+        customers.append(customer)
+
+    merchants = [ExternalCounterparty(owner=uuid.uuid4())
+                 for _ in range(MERCHANTS)]
+
+    references = []
+    for _ in range(REFERENCES):
+        reference = uuid.uuid4()
+        customer = random.choice(customers)
+        amount = AUD.from_cents(random.randint(1, 10000))
+        customer.debit_card(card_number=customer.card_numbers[0],
+                            amount=amount, reference=reference)
+        random.choice(merchants).credit(amount=amount, reference=reference)
+        references.append(reference)
+
+    store = MemoryStore()
+    InMemoryRepository(store).add_many(customers + merchants)
+    return store, references
+
+
+def main():
+    print("Settling purchases by {} customers at {} merchants."
+          .format(CUSTOMERS, MERCHANTS))
+    print()
+    print("{:<20} {:>12} {:>10} {:>16}"
+          .format('method', 'references', 'time (s)', 'references/sec'))
+
+    store, references = build_store()
+    work_manager = WorkManager(store)
+
+    start = time.perf_counter()
+    with work_manager.scope() as unit:
+        service = TransactionSettlementService(unit.get(InMemoryRepository))
+        for reference in references[:SAMPLE]:
+            service.settle_transaction(reference)
+    elapsed = time.perf_counter() - start
+    print("{:<20} {:>12} {:>10.3f} {:>16.0f}"
+          .format('settle_transaction', SAMPLE, elapsed, SAMPLE / elapsed))
+
+    remaining = references[SAMPLE:]
+    start = time.perf_counter()
+    with work_manager.scope() as unit:
+        service = TransactionSettlementService(unit.get(InMemoryRepository))
+        service.settle_many(remaining)
+    elapsed = time.perf_counter() - start
+    print("{:<20} {:>12} {:>10.3f} {:>16.0f}"
+          .format('settle_many', len(remaining), elapsed,
+                  len(remaining) / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Measure how many transfers per second can be made in batches across
+accounts sharded over different numbers of worker processes, against a
+single store in this process. Scaling depends on there being a core for
+each worker.
+
+Run from the root of the repository with:
+    python -m benchmarks.sharding
+
+"""
+
+import os
+import random
+import time
+import uuid
+
+from account import AccountTransferService, AUD, RegularAccount
+from account.transaction import (
+    Transaction,
+    TransactionStatus,
+    TransactionType,
+)
+from infrastructure import (
+    AccountShards,
+    InMemoryRepository,
+    MemoryStore,
+    WorkManager,
+)
+
+
+ACCOUNTS = 10000
+LEGS = 10000
+BATCH = 1000
+WORKER_COUNTS = (1, 2, 4, 8)
+
+
+def build_accounts():
+    accounts = []
+    for _ in range(ACCOUNTS):
+        account = RegularAccount(owner=uuid.uuid4())
+        account.default_subaccount.add_transaction(Transaction(
+            reference=uuid.uuid4(),
+            amount=AUD(1000),
+            type=TransactionType.CREDIT,
+            status=TransactionStatus.SETTLED,
+        ))
+        accounts.append(account)
+    return accounts
+
+
+def build_batches(ids):
+    random.seed(0)
+    legs = [(source, destination, AUD.from_cents(random.randint(1, 1000)))
+            for source, destination in (random.sample(ids, 2)
+                                        for _ in range(LEGS))]
+    return [legs[i:i + BATCH] for i in range(0, LEGS, BATCH)]
+
+
+def total(accounts):
+    return sum((a.balance.available for a in accounts), AUD(0))
+
+
+def in_process(accounts, batches):
+    store = MemoryStore()
+    InMemoryRepository(store).add_many(accounts)
+    work_manager = WorkManager(store)
+
+    start = time.perf_counter()
+    for batch in batches:
+        with work_manager.scope() as unit:
+            service = AccountTransferService(unit.get(InMemoryRepository))
+            service.transfer_many(batch)
+    elapsed = time.perf_counter() - start
+
+    after = InMemoryRepository(store).get_many(a.id for a in accounts)
+    return elapsed, total(after)
+
+
+def sharded(workers, accounts, batches):
+    with AccountShards(workers) as shards:
+        shards.add_many(accounts)
+
+        start = time.perf_counter()
+        for batch in batches:
+            shards.transfer_many(batch)
+        elapsed = time.perf_counter() - start
+
+        after = shards.get_many(a.id for a in accounts)
+
+    return elapsed, total(after)
+
+
+def main():
+    print("{} transfers between {} accounts in batches of {}, with {} cores."
+          .format(LEGS, ACCOUNTS, BATCH, os.cpu_count()))
+    print()
+    print("{:<16} {:>10} {:>16}".format('workers', 'time (s)',
+                                         'transfers/sec'))
+
+    accounts = build_accounts()
+    batches = build_batches([a.id for a in accounts])
+    before = total(accounts)
+
+    elapsed, after = in_process(accounts, batches)
+    assert after == before, 'Money was created or lost.'
+    print("{:<16} {:>10.3f} {:>16.0f}"
+          .format('none (1 store)', elapsed, LEGS / elapsed))
+
+    for workers in WORKER_COUNTS:
+        elapsed, after = sharded(workers, accounts, batches)
+        assert after == before, 'Money was created or lost.'
+        print("{:<16} {:>10.3f} {:>16.0f}"
+              .format(workers, elapsed, LEGS / elapsed))
+
+
+if __name__ == '__main__':
+    main()
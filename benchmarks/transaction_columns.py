@@ -0,0 +1,82 @@
+"""Compare the memory used by a subaccount which keeps its transactions as a
+list of Transaction objects with one which keeps them in TransactionColumns,
+and the time taken to calculate their balances.
+
+Run from the root of the repository with:
+    python -m benchmarks.transaction_columns
+
+"""
+
+import gc
+import random
+import time
+import tracemalloc
+import uuid
+
+from account import AUD, RegularSubAccount
+from account.transaction import (
+    Transaction,
+    TransactionStatus,
+    TransactionType,
+)
+
+
+TRANSACTIONS = 100000
+
+
+class CompactSubAccount(RegularSubAccount):
+    compact_transactions = True
+
+
+def add_transactions(subaccount):
+    random.seed(0)
+    for _ in range(TRANSACTIONS):
+        subaccount.add_transaction(Transaction(
+            reference=uuid.uuid4(),
+            amount=AUD.from_cents(random.randint(1, 100000)),
+            type=random.choice(list(TransactionType)),
+            status=random.choice(list(TransactionStatus)),
+        ))
+    return subaccount
+
+
+def memory(subaccount_class):
+    """Measure the memory still in use after building a subaccount."""
+
+    gc.collect()
+    tracemalloc.start()
+    subaccount = add_transactions(subaccount_class())
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return subaccount, current
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def main():
+    print("A subaccount with {} transactions.".format(TRANSACTIONS))
+    print()
+    print("{:<10} {:>12} {:>18} {:>18}"
+          .format('storage', 'bytes', 'bytes/transaction', 'balance (ms)'))
+
+    balances = []
+    for name, subaccount_class in (('list', RegularSubAccount),
+                                   ('columns', CompactSubAccount)):
+        subaccount, used = memory(subaccount_class)
+        balance, elapsed = timed(subaccount.calculate_balance)
+        balances.append(balance)
+
+        print("{:<10} {:>12} {:>18.1f} {:>18.1f}"
+              .format(name, used, used / TRANSACTIONS, elapsed * 1000))
+        del subaccount
+
+    assert balances[0] == balances[1]
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Compare making a batch of transfers with a loop of
+AccountTransferService.transfer calls against a single transfer_many call.
+
+Run from the root of the repository with:
+    python -m benchmarks.transfers
+
+"""
+
+import random
+import time
+import uuid
+
+from account import AccountTransferService, AUD, RegularAccount
+from account.transaction import (
+    Transaction,
+    TransactionStatus,
+    TransactionType,
+)
+from infrastructure import InMemoryRepository, MemoryStore, WorkManager
+
+
+ACCOUNTS = 1000
+LEGS = 5000
+
+
+def build_store():
+    store = MemoryStore()
+
+    accounts = []
+    for _ in range(ACCOUNTS):
+        account = RegularAccount(owner=uuid.uuid4())
+        account.default_subaccount.add_transaction(Transaction(
+            reference=uuid.uuid4(),
+            amount=AUD(1000),
+            type=TransactionType.CREDIT,
+            status=TransactionStatus.SETTLED,
+        ))
+        accounts.append(account)
+
+    InMemoryRepository(store).add_many(accounts)
+    return store, [a.id for a in accounts]
+
+
+def build_legs(ids):
+    random.seed(0)
+    return [(source, destination, AUD.from_cents(random.randint(1, 10000)))
+            for source, destination in (random.sample(ids, 2)
+                                        for _ in range(LEGS))]
+
+
+def loop_in_one_unit(work_manager, legs):
+    with work_manager.scope() as unit:
+        service = AccountTransferService(unit.get(InMemoryRepository))
+        for source, destination, amount in legs:
+            service.transfer(source, destination, amount)
+    return unit.writes
+
+
+def loop_in_separate_units(work_manager, legs):
+    writes = 0
+    for source, destination, amount in legs:
+        with work_manager.scope() as unit:
+            service = AccountTransferService(unit.get(InMemoryRepository))
+            service.transfer(source, destination, amount)
+        writes += unit.writes
+    return writes
+
+
+def transfer_many(work_manager, legs):
+    with work_manager.scope() as unit:
+        service = AccountTransferService(unit.get(InMemoryRepository))
+        service.transfer_many(legs)
+    return unit.writes
+
+
+def main():
+    print("{} transfers between {} accounts.".format(LEGS, ACCOUNTS))
+    print()
+    print("{:<24} {:>10} {:>16} {:>10}"
+          .format('method', 'time (s)', 'transfers/sec', 'writes'))
+
+    for name, method in (('transfer, one unit', loop_in_one_unit),
+                         ('transfer, unit each', loop_in_separate_units),
+                         ('transfer_many', transfer_many)):
+        store, ids = build_store()
+        legs = build_legs(ids)
+
+        start = time.perf_counter()
+        writes = method(WorkManager(store), legs)
+        elapsed = time.perf_counter() - start
+
+        print("{:<24} {:>10.3f} {:>16.0f} {:>10}"
+              .format(name, elapsed, LEGS / elapsed, writes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Measure how many commits per second a MemoryStore with a write-ahead log
+can make under each sync policy, with different numbers of threads
+committing at once.
+
+Run from the root of the repository with:
+    python -m benchmarks.write_ahead_log
+
+"""
+
+import tempfile
+import threading
+import time
+import uuid
+
+from infrastructure import MemoryStore, RecordMode, SyncPolicy, WriteAheadLog
+
+
+COMMITS_PER_THREAD = 200
+THREAD_COUNTS = (1, 4, 16)
+
+
+def run(sync, threads):
+    with tempfile.TemporaryDirectory() as directory:
+        store = MemoryStore(record_mode=RecordMode.FROZEN,
+                            log=WriteAheadLog(directory, sync=sync))
+
+        def work():
+            session = store.session()
+            for _ in range(COMMITS_PER_THREAD):
+                key = uuid.uuid4()
+                session.begin()
+                session.add('record', key, {'id': key, 'value': 1})
+                session.commit()
+
+        workers = [threading.Thread(target=work) for _ in range(threads)]
+        start = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - start
+
+        store.close()
+
+    return threads * COMMITS_PER_THREAD / elapsed
+
+
+def main():
+    print("{:<8} {:>8} {:>14}".format('sync', 'threads', 'commits/sec'))
+    for sync in (SyncPolicy.NEVER, SyncPolicy.GROUP, SyncPolicy.ALWAYS):
+        for threads in THREAD_COUNTS:
+            print("{:<8} {:>8} {:>14.0f}"
+                  .format(sync.name, threads, run(sync, threads)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,58 @@
 
-from .memory_repository import InMemoryRepository
-from .memory_store import MemoryStore
-from .unit_of_work import WorkManager
+from .aggregate_cache import AggregateCache, CacheStats
+from .compaction import compact_history
+from .ingest import load_csv, load_ndjson
+from .locking import LockTable, WouldDeadlock
+from .memory_repository import (
+    AsyncInMemoryRepository,
+    InMemoryRepository,
+    TransactionPage,
+)
+from .memory_store import LoadReport, MemoryStore, RecordMode, WriteConflict
+from .query import And, Eq, In, Range
+from .reporting import (
+    BalanceReport,
+    export_transactions,
+    report_balances,
+    TransactionArrays,
+)
+from .scheduler import SchedulerStats, TransferScheduler
+from .sharding import AccountShards
+from .snapshot import MappedSnapshot, write_snapshot
+from .unit_of_work import AsyncWorkManager, WorkManager
+from .write_ahead_log import SyncPolicy, WriteAheadLog
 
 
 __all__ = (
+    'AccountShards',
+    'AggregateCache',
+    'And',
+    'AsyncInMemoryRepository',
+    'AsyncWorkManager',
+    'BalanceReport',
+    'CacheStats',
+    'compact_history',
+    'Eq',
+    'export_transactions',
+    'In',
     'InMemoryRepository',
+    'load_csv',
+    'load_ndjson',
+    'LoadReport',
+    'LockTable',
+    'MappedSnapshot',
     'MemoryStore',
+    'Range',
+    'report_balances',
+    'RecordMode',
+    'SchedulerStats',
+    'SyncPolicy',
+    'TransactionArrays',
+    'TransactionPage',
+    'TransferScheduler',
     'WorkManager',
+    'WouldDeadlock',
+    'write_snapshot',
+    'WriteAheadLog',
+    'WriteConflict',
 )
@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import sys
+import threading
+from collections import OrderedDict
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    Iterable,
+    Optional,
+    Set,
+    TypeVar,
+)
+from uuid import UUID
+
+from .memory_store import MemoryStore, Store, StorageRecord
+
+
+T = TypeVar('T')
+
+
+def estimate_size(records: Iterable[StorageRecord]) -> int:
+    """Estimate the number of bytes taken up by a number of records, from the
+    sizes of the records and of their values. Values shared with other
+    records are counted each time, so this is an overestimate.
+
+    """
+
+    return sum(sys.getsizeof(r) + sum(sys.getsizeof(v) for v in r.values())
+               for r in records)
+
+
+class _Entry(Generic[T]):
+    """A cached aggregate, with the keys of the records it was read from."""
+
+    __slots__ = ('value', 'keys', 'size', 'read_at')
+
+    def __init__(self, value: T, keys: Set[UUID], size: int,
+                 read_at: int) -> None:
+        self.value = value
+        self.keys = keys
+        self.size = size
+        # The timestamp of the snapshot the records were read at.
+        self.read_at = read_at
+
+
+class CacheStats:
+    """A snapshot of the counters of an AggregateCache."""
+
+    def __init__(self, entries: int, size: int, hits: int, misses: int,
+                 evictions: int, invalidations: int) -> None:
+        # The number of aggregates cached, and their estimated size in bytes
+        # if the cache has a limit on it.
+        self.entries = entries
+        self.size = size
+        # The number of lookups which found, and did not find, an aggregate.
+        self.hits = hits
+        self.misses = misses
+        # The number of aggregates dropped to make room for others.
+        self.evictions = evictions
+        # The number of aggregates dropped because a commit changed them.
+        self.invalidations = invalidations
+
+    def __repr__(self) -> str:
+        return ('CacheStats(entries={}, size={}, hits={}, misses={}, '
+                'evictions={}, invalidations={}, hit_rate={:.2f})'
+                .format(self.entries, self.size, self.hits, self.misses,
+                        self.evictions, self.invalidations, self.hit_rate))
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class AggregateCache(Generic[T]):
+    """A cache of aggregates read from a MemoryStore, shared by every unit of
+    work on the store, so that the aggregates which are used most do not
+    have to be read from the store again by each one. See
+    InMemoryRepository.
+
+    Each aggregate is cached with the keys of the records it was read from,
+    and the timestamp of the snapshot they were read at. The cache watches
+    the store's commits, and drops an aggregate as soon as a commit writes
+    one of its records, or a record whose link field holds one of their
+    keys, such as a new transaction of one of its subaccounts. An aggregate
+    is only found for a snapshot at or after the one it was read at, so
+    every unit of work sees it as of its own snapshot.
+
+    Aggregates must only be put in the cache as they were committed, never
+    with changes made by a unit of work which has not committed. They are
+    not put in the cache if anything has been committed since they were
+    read, in case it changed them.
+
+    The least recently used aggregates are evicted once the cache holds more
+    than either of its limits. The cache is thread-safe.
+
+    Takes one argument, and three optional arguments:
+    - store: The MemoryStore to cache aggregates from.
+    - max_entries: The most aggregates to keep, or None for no limit.
+    - max_bytes: The most bytes of records to keep, as estimated by
+      estimate_size, or None for no limit. Estimating sizes takes time, so
+      they are only counted if this is set.
+    - link_field: The field of a record which holds the key of the record
+      it belongs to, if any.
+
+    """
+
+    def __init__(self, store: MemoryStore,
+                 max_entries: Optional[int] = 10000,
+                 max_bytes: Optional[int] = None,
+                 link_field: str = 'account') -> None:
+        if max_entries is not None and max_entries < 1:
+            raise ValueError('Cannot cache less than one aggregate.')
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._link_field = link_field
+
+        # The aggregates by their IDs, least recently used first.
+        self._entries: OrderedDict[UUID, _Entry[T]] = OrderedDict()
+        # The IDs of the aggregates by the keys of their records.
+        self._owners: Dict[UUID, UUID] = {}
+        self._size = 0
+        # Guards everything, as commits invalidate aggregates while other
+        # threads read them.
+        self._lock = threading.Lock()
+        # The timestamp of the most recent commit seen.
+        self._timestamp = store.timestamp
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+        store.watch(self._invalidate)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, aggregate_id: UUID, snapshot: int,
+            accept: Optional[Callable[[T], bool]] = None) -> Optional[T]:
+        """Find an aggregate as of a snapshot.
+
+        Takes two arguments, and one optional argument:
+        - aggregate_id: The ID of the aggregate.
+        - snapshot: The timestamp of the snapshot the caller reads at.
+        - accept: A function which says whether the cached aggregate will
+          do, e.g. whether it holds everything the caller needs.
+
+        Returns the aggregate, or None if it is not cached, was read after
+        the snapshot or is not accepted.
+
+        """
+
+        with self._lock:
+            entry = self._entries.get(aggregate_id)
+            if entry is None or entry.read_at > snapshot or \
+                    (accept is not None and not accept(entry.value)):
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(aggregate_id)
+            self._hits += 1
+            return entry.value
+
+    def put(self, aggregate_id: UUID, value: T, keys: Iterable[UUID],
+            read_at: int, size: int = 0) -> bool:
+        """Cache an aggregate, evicting others if the cache is full.
+
+        Takes four arguments, and one optional argument:
+        - aggregate_id: The ID of the aggregate.
+        - value: The aggregate, which must not be changed once it is cached.
+        - keys: The keys of the records it was read from.
+        - read_at: The timestamp of the snapshot it was read at.
+        - size: An estimate of its size in bytes. Only needed if the cache
+          has max_bytes.
+
+        Returns whether it was cached.
+
+        """
+
+        with self._lock:
+            if read_at < self._timestamp:
+                return False
+
+            self._remove(aggregate_id)
+            entry = _Entry(value, set(keys), size, read_at)
+            entry.keys.add(aggregate_id)
+
+            self._entries[aggregate_id] = entry
+            for key in entry.keys:
+                self._owners[key] = aggregate_id
+            self._size += size
+
+            self._evict()
+            return True
+
+    def _remove(self, aggregate_id: UUID) -> bool:
+        entry = self._entries.pop(aggregate_id, None)
+        if entry is None:
+            return False
+
+        for key in entry.keys:
+            if self._owners.get(key) == aggregate_id:
+                del self._owners[key]
+        self._size -= entry.size
+        return True
+
+    def _evict(self) -> None:
+        while self._entries and (
+                (self.max_entries is not None and
+                 len(self._entries) > self.max_entries) or
+                (self.max_bytes is not None and self._size > self.max_bytes)
+        ):
+            aggregate_id = next(iter(self._entries))
+            self._remove(aggregate_id)
+            self._evictions += 1
+
+    def _owner(self, key: Any) -> Optional[UUID]:
+        if key in self._entries:
+            return key
+        return self._owners.get(key)
+
+    def _invalidate(self, changes: Optional[Store], timestamp: int) -> None:
+        """Drop the aggregates which a commit changed. Called by the store
+        as it commits.
+
+        """
+
+        with self._lock:
+            self._timestamp = timestamp
+
+            if changes is None:
+                self._invalidations += len(self._entries)
+                self._entries.clear()
+                self._owners.clear()
+                self._size = 0
+                return
+
+            changed: Set[UUID] = set()
+            for records in changes.values():
+                for key, record in records.items():
+                    owner = self._owner(key)
+                    if owner is None and record is not None:
+                        owner = self._owner(record.get(self._link_field))
+                    if owner is not None:
+                        changed.add(owner)
+
+            for aggregate_id in changed:
+                if self._remove(aggregate_id):
+                    self._invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._owners.clear()
+            self._size = 0
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                entries=len(self._entries),
+                size=self._size,
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                invalidations=self._invalidations,
+            )
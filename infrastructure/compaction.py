@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+from itertools import islice
+from typing import Any, Iterable, Optional
+from uuid import UUID
+
+from .memory_repository import InMemoryRepository
+from .unit_of_work import RepositoryFactory, UnitOfWork, WorkManager
+
+
+def compact_history(work_manager: WorkManager,
+                    account_ids: Iterable[UUID],
+                    before: Optional[int] = None,
+                    batch_size: int = 1000,
+                    repository_factory: RepositoryFactory = InMemoryRepository
+                    ) -> int:
+    """Compact the settled transactions of a number of accounts, a batch of
+    accounts per unit of work, so that loading them only reads their
+    checkpoints and the transactions since. See InMemoryRepository.compact.
+
+    A batch which conflicts with another unit of work is tried again, so
+    this can run alongside other work, e.g. periodically with a cutoff of
+    the store's timestamp at the previous run:
+
+    >>> cutoff = store.timestamp
+    >>> ...
+    >>> compact_history(work_manager, account_ids, before=cutoff)
+
+    Takes two arguments, and three optional arguments:
+    - work_manager: The WorkManager to compact the accounts with.
+    - account_ids: The IDs of the accounts to compact, which may be a
+      stream of any length.
+    - before: Only compact transactions settled at or before this timestamp
+      of the store. If None, every settled transaction is compacted.
+    - batch_size: The number of accounts to compact in each unit of work.
+    - repository_factory: The repository to compact the accounts with. It
+      must have a compact method, like InMemoryRepository.
+
+    Returns the number of transactions compacted.
+
+    """
+
+    if batch_size < 1:
+        raise ValueError('Cannot compact less than one account at a time.')
+
+    ids = iter(account_ids)
+    compacted = 0
+    while True:
+        batch = list(islice(ids, batch_size))
+        if not batch:
+            return compacted
+
+        def work(unit: UnitOfWork) -> int:
+            repository: Any = unit.get(repository_factory)
+            return repository.compact(batch, before)
+
+        compacted += work_manager.run(work)
@@ -0,0 +1,188 @@
+import csv
+import json
+from enum import Enum
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Type
+from uuid import UUID
+
+from account import CardNumber
+from account.transaction import TransactionStatus, TransactionType
+
+from .memory_repository import (
+    ACCOUNT_MODEL,
+    AccountType,
+    CARD_MODEL,
+    next_sequence,
+    SUBACCOUNT_MODEL,
+    SubAccountType,
+    TRANSACTION_MODEL,
+)
+from .memory_store import LoadReport, Storage, StorageRecord
+
+
+# Rows are read from NDJSON or CSV, where every value is either a string or a
+# JSON number. Enums are given by name, and amounts as whole numbers of
+# cents.
+Decoder = Callable[[Any], Any]
+
+
+def _optional_uuid(value: Any) -> Optional[UUID]:
+    return UUID(value) if value else None
+
+
+def _enum(enum_type: Type[Enum]) -> Decoder:
+    return lambda name: enum_type[name]
+
+
+# The fields of each table, and how to decode them.
+FIELDS: Dict[str, Dict[str, Decoder]] = {
+    ACCOUNT_MODEL: {
+        'id': UUID,
+        'owner': _optional_uuid,
+        'type': _enum(AccountType),
+    },
+    SUBACCOUNT_MODEL: {
+        'id': UUID,
+        'account': UUID,
+        'type': _enum(SubAccountType),
+        'available': int,
+        'pending': int,
+    },
+    TRANSACTION_MODEL: {
+        'id': UUID,
+        'reference': UUID,
+        'amount': int,
+        'type': _enum(TransactionType),
+        'account': UUID,
+        'status': _enum(TransactionStatus),
+        'sequence': int,
+    },
+    CARD_MODEL: {
+        'id': UUID,
+        'number': CardNumber,
+        'account': UUID,
+    },
+}
+
+
+# Fields which rows may leave out, and how to find their values instead.
+# Transactions without a sequence are given the next, so are in the order of
+# the file.
+DEFAULTS: Dict[str, Dict[str, Callable[[], Any]]] = {
+    TRANSACTION_MODEL: {
+        'sequence': next_sequence,
+    },
+}
+
+
+# Fields which refer to another record, so have the same value in many rows.
+# Each of their values is only decoded once per load, and then shared.
+SHARED_FIELDS = frozenset(('account', 'owner'))
+SharedValues = Dict[str, Dict[Any, Any]]
+
+
+def decode_row(record_type: str,
+               row: Dict[str, Any],
+               shared: Optional[SharedValues] = None) -> StorageRecord:
+    """Convert a row read from a file into a store record, ignoring any
+    fields which the table does not have. Fields in DEFAULTS which the row
+    does not have, or are empty, are filled in.
+
+    Takes three arguments:
+    - record_type: The table the row belongs to.
+    - row: The row, as read from the file.
+    - shared: If given, the decoded values of SHARED_FIELDS are kept in it
+      and reused for later rows.
+
+    """
+
+    try:
+        fields = FIELDS[record_type]
+    except KeyError:
+        raise ValueError('Cannot load rows into unknown table {!r}.'
+                         .format(record_type))
+
+    defaults = DEFAULTS.get(record_type, {})
+
+    record = {}
+    for field, decode in fields.items():
+        if field in defaults and row.get(field) in (None, ''):
+            record[field] = defaults[field]()
+            continue
+
+        value = row[field]
+        if shared is not None and field in SHARED_FIELDS:
+            values = shared.setdefault(field, {})
+            try:
+                record[field] = values[value]
+            except KeyError:
+                record[field] = values[value] = decode(value)
+        else:
+            record[field] = decode(value)
+
+    return record
+
+
+def read_ndjson(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Read rows from newline-delimited JSON, one object per line. Blank
+    lines are skipped.
+
+    """
+
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def load_ndjson(store: Storage,
+                lines: Iterable[str],
+                batch_size: int = 100000) -> LoadReport:
+    """Bulk load rows from newline-delimited JSON. Each row names its table
+    in a 'table' field, so one file may hold rows for all of the tables.
+
+    Takes three arguments:
+    - store: The store or session to load the rows into.
+    - lines: The lines of the file.
+    - batch_size: The number of records in each entry of the store's log,
+      if it has one.
+
+    Returns a LoadReport.
+
+    """
+
+    shared: SharedValues = {}
+    with store.bulk_load(batch_size) as load:
+        for row in read_ndjson(lines):
+            record_type = row['table']
+            record = decode_row(record_type, row, shared)
+            load.add(record_type, record['id'], record)
+
+    assert load.report is not None
+    return load.report
+
+
+def load_csv(store: Storage,
+             record_type: str,
+             lines: Iterable[str],
+             batch_size: int = 100000) -> LoadReport:
+    """Bulk load the rows of one table from CSV with a header row naming
+    the fields.
+
+    Takes four arguments:
+    - store: The store or session to load the rows into.
+    - record_type: The table the rows belong to.
+    - lines: The lines of the file.
+    - batch_size: The number of records in each entry of the store's log,
+      if it has one.
+
+    Returns a LoadReport.
+
+    """
+
+    shared: SharedValues = {}
+    with store.bulk_load(batch_size) as load:
+        for row in csv.DictReader(lines):
+            record = decode_row(record_type, row, shared)
+            load.add(record_type, record['id'], record)
+
+    assert load.report is not None
+    return load.report
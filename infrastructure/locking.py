@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import threading
+from typing import Hashable, Iterable, List, Set
+
+from .memory_store import WriteConflict
+
+
+class WouldDeadlock(WriteConflict):
+    """Raised when a unit of work needs a lock which comes before one it
+    already holds, and another unit of work holds it. Waiting for it could
+    deadlock, so the unit of work should be rolled back and tried again.
+
+    """
+    pass
+
+
+class LockTable:
+    """A fixed number of locks which keys are striped across, so that any
+    number of keys can be locked with a bounded amount of memory. Keys which
+    share a stripe are locked together, which only costs some parallelism.
+
+    Locks are taken through a HeldLocks, created with holder, which keeps
+    track of the stripes held by a single unit of work. Stripes are always
+    waited for in order of their index, so units of work which lock all of
+    their keys at once can never deadlock.
+
+    Takes one optional argument:
+    - stripes: The number of locks.
+
+    """
+
+    def __init__(self, stripes: int = 1024) -> None:
+        if stripes < 1:
+            raise ValueError('A lock table needs at least one stripe.')
+
+        self._locks: List[threading.Lock] = [threading.Lock()
+                                             for _ in range(stripes)]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    def stripe(self, key: Hashable) -> int:
+        """Find the index of the lock which covers a key."""
+
+        return hash(key) % len(self._locks)
+
+    def holder(self) -> HeldLocks:
+        """Create a holder for the locks of a new unit of work."""
+
+        return HeldLocks(self)
+
+
+class HeldLocks:
+    """The stripes of a LockTable held by a single unit of work. They are
+    kept until release is called, normally once the unit of work has
+    committed or rolled back.
+
+    A HeldLocks is not itself thread-safe.
+
+    """
+
+    def __init__(self, table: LockTable) -> None:
+        self._table = table
+        self._held: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._held)
+
+    def acquire(self, keys: Iterable[Hashable]) -> bool:
+        """Lock a number of keys, waiting for other units of work to release
+        them. Stripes which come after every stripe already held are waited
+        for in order. Stripes which come before one already held are only
+        taken if they are free, as waiting for them could deadlock.
+
+        Takes one argument:
+        - keys: The keys to lock.
+
+        Returns whether any new stripes were locked.
+
+        Raises WouldDeadlock if an earlier stripe is held by another unit of
+        work. The stripes which were locked are kept until release.
+
+        """
+
+        stripe = self._table.stripe
+        wanted = sorted({stripe(k) for k in keys} - self._held)
+        if not wanted:
+            return False
+
+        locks = self._table._locks
+        highest = max(self._held, default=-1)
+        for i in wanted:
+            if i < highest:
+                if not locks[i].acquire(blocking=False):
+                    raise WouldDeadlock('Cannot wait for lock {} while '
+                                        'holding lock {}.'.format(i, highest))
+            else:
+                locks[i].acquire()
+
+            self._held.add(i)
+
+        return True
+
+    def release(self) -> None:
+        """Release every stripe held."""
+
+        locks = self._table._locks
+        for i in self._held:
+            locks[i].release()
+
+        self._held = set()
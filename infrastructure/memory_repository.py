@@ -1,6 +1,23 @@
 
+import base64
+import heapq
+import struct
+import threading
+import time
 from enum import auto, Enum
-from typing import Dict, List, Iterable, Type
+from typing import (
+    AbstractSet,
+    Any,
+    Dict,
+    List,
+    Iterable,
+    Iterator,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
 from uuid import UUID
 
 from account import (
@@ -11,17 +28,90 @@ from account import (
     ExternalCounterparty,
     RegularAccount,
     RegularSubAccount,
+    StripeSubAccount,
     SubAccount,
     Transaction,
+    TransactionColumns,
 )
-from account.repository import AccountRepository
+from account.lazy import LazyTransactions
+from account.repository import AccountRepository, AsyncAccountRepository
+from account.transaction import TransactionStatus, TransactionType
+from account.values import AUD, Balance
 
-from .memory_store import MemoryStore, StorageRecord
+from .aggregate_cache import AggregateCache, estimate_size
+from .memory_store import (
+    LoadReport,
+    NotFound,
+    OrderedEntry,
+    register_immutable,
+    Storage,
+    StorageRecord,
+)
+from .query import And, Eq, In, Query
 
 
 AccountCache = Dict[UUID, Account]
 
 
+class AggregateRecords:
+    """The records which an account is built from, as kept in an
+    AggregateCache. They are shared by every repository which uses the
+    cache, so must never be modified.
+
+    """
+
+    __slots__ = ('account', 'subaccounts', 'transactions', 'cards',
+                 'checkpoints')
+
+    def __init__(self,
+                 account: StorageRecord,
+                 subaccounts: List[StorageRecord],
+                 transactions: Optional[Dict[UUID, List[StorageRecord]]],
+                 cards: Dict[UUID, List[StorageRecord]],
+                 checkpoints: Dict[UUID, StorageRecord]) -> None:
+        self.account = account
+        self.subaccounts = subaccounts
+        # The transactions of each subaccount, by its ID, or None if they are
+        # loaded lazily.
+        self.transactions = transactions
+        # The card of each card subaccount, by its ID.
+        self.cards = cards
+        # The checkpoints of the subaccounts which have been compacted, by
+        # their IDs.
+        self.checkpoints = checkpoints
+
+    def all(self) -> Iterator[StorageRecord]:
+        yield self.account
+        yield from self.subaccounts
+        for group in (self.transactions or {}).values():
+            yield from group
+        for group in self.cards.values():
+            yield from group
+        yield from self.checkpoints.values()
+
+    def keys(self) -> Iterator[UUID]:
+        """The keys of the records, apart from the account's."""
+
+        for record in self.all():
+            if record is not self.account:
+                yield record['id']
+
+    def tables(self) -> Iterator[Tuple[str, List[StorageRecord]]]:
+        """The records, grouped by the tables they were read from."""
+
+        yield ACCOUNT_MODEL, [self.account]
+        yield SUBACCOUNT_MODEL, self.subaccounts
+        yield TRANSACTION_MODEL, [t for group in
+                                  (self.transactions or {}).values()
+                                  for t in group]
+        yield CARD_MODEL, [c for group in self.cards.values() for c in group]
+        yield CHECKPOINT_MODEL, list(self.checkpoints.values())
+
+
+# Card numbers are immutable value objects, so may be kept in frozen records.
+register_immutable(CardNumber)
+
+
 class AccountType(Enum):
     """An enum for representing the type of an account in the store."""
 
@@ -35,6 +125,7 @@ class SubAccountType(Enum):
 
     REGULAR = auto()
     CARD = auto()
+    STRIPE = auto()
 
 
 # Map account types to their enum type.
@@ -48,14 +139,96 @@ account_types: Dict[Type[Account], AccountType] = {
 subaccount_types: Dict[Type[SubAccount], SubAccountType] = {
     CardSubAccount: SubAccountType.CARD,
     RegularSubAccount: SubAccountType.REGULAR,
+    StripeSubAccount: SubAccountType.STRIPE,
 }
 
 
-# Essentially table names for the store.
+# Essentially table names for the store. Amounts of money are stored as whole
+# numbers of cents. Compacted transactions are moved to the archive, and
+# summed up in a checkpoint of their subaccount, with the same key as it.
 ACCOUNT_MODEL = 'account'
 SUBACCOUNT_MODEL = 'subaccount'
 TRANSACTION_MODEL = 'transaction'
 CARD_MODEL = 'card'
+CHECKPOINT_MODEL = 'checkpoint'
+ARCHIVE_MODEL = 'transaction_archive'
+
+
+# A cursor into the history of an account is the position of the last
+# transaction returned: its sequence, and its ID.
+CURSOR = struct.Struct('>Q16s')
+
+
+# Every transaction is given a sequence when it is first written, which never
+# changes, so that histories stay in the order the transactions were added.
+# Sequences are the time in nanoseconds, but always increase, so they also
+# increase across restarts as long as the clock does.
+_sequence_lock = threading.Lock()
+_last_sequence = 0
+
+
+def next_sequences(count: int) -> range:
+    """Find the sequences of a number of new transactions, in the order they
+    are added, which are greater than any found before.
+
+    """
+
+    global _last_sequence
+    with _sequence_lock:
+        first = max(_last_sequence + 1, time.time_ns())
+        _last_sequence = first + count - 1
+        return range(first, first + count)
+
+
+def next_sequence() -> int:
+    """Find the sequence of a new transaction."""
+
+    return next_sequences(1)[0]
+
+
+# The fields which the repository looks records up by. These are declared as
+# secondary indexes on the store so that the lookups do not scan the tables.
+INDEXES = (
+    (SUBACCOUNT_MODEL, 'account'),
+    (TRANSACTION_MODEL, 'account'),
+    (TRANSACTION_MODEL, 'reference'),
+    (CARD_MODEL, 'account'),
+    (CARD_MODEL, 'number'),
+    (ARCHIVE_MODEL, 'account'),
+    (ARCHIVE_MODEL, 'reference'),
+)
+
+# The fields which the repository finds records in order of, with the fields
+# they are grouped by. These are declared as ordered indexes on the store, so
+# that a page of a history only reads the entries on it.
+ORDERED_INDEXES = (
+    (TRANSACTION_MODEL, 'account', 'sequence'),
+    (ARCHIVE_MODEL, 'account', 'sequence'),
+)
+
+
+class TransactionPage:
+    """A page of the history of an account or subaccount, found by
+    InMemoryRepository.history. Iterating over it reads the transactions
+    from the store one at a time.
+
+    """
+
+    def __init__(self,
+                 repository: 'InMemoryRepository',
+                 keys: List[Tuple[str, UUID]],
+                 cursor: Optional[str]) -> None:
+        self._repository = repository
+        # The table and key of each transaction, newest first.
+        self._keys = keys
+        # The cursor for the next page, or None if this is the last.
+        self.cursor = cursor
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __iter__(self) -> Iterator[Transaction]:
+        return self._repository._page_transactions(self._keys)
 
 
 class InMemoryRepository(AccountRepository):
@@ -65,11 +238,67 @@ class InMemoryRepository(AccountRepository):
     It caches account instances during its lifespan to return references to the
     same object.
 
+    It also remembers the records it last read or wrote for each account, so
+    that updating an account only writes the records which have changed:
+    the account and subaccount records if they differ, and the transactions
+    which the subaccounts report as unsaved. Accounts which the repository
+    has not seen before are written in full.
+
+    Settled transactions can be compacted with compact, which sums them up
+    in a checkpoint of their subaccount and moves them to an archive, so
+    that accounts are loaded from their checkpoints and the transactions
+    since.
+
+    If lazy_transactions is set, the transactions of each subaccount are
+    LazyTransactions, which are read from the store when they are first
+    needed, through the store or session the repository was given.
+
+    Accounts are locked through the session as they are loaded, so that
+    units of work given a LockTable take turns to change them. Accounts with
+    stripes are busy, and each credit to one only touches one of its
+    stripes, so they are not locked as they are loaded. The subaccounts
+    which an update writes are locked instead, and the commit raises
+    WriteConflict if they have changed since they were read.
+
+    Repositories may share an AggregateCache of the records of the accounts
+    they have read, kept between units of work. The cache should be shared
+    by repositories which agree on lazy_transactions, as one which loads
+    transactions eagerly cannot build accounts from records read lazily.
+    The factory for a unit of work can pass it in, e.g. with
+    functools.partial(InMemoryRepository, cache=cache).
+
+    Takes one argument, and one optional argument:
+    - memory_store: The store, or the session on one, to use.
+    - cache: An AggregateCache on the same store.
+
     """
 
-    def __init__(self, memory_store: MemoryStore) -> None:
+    # Determines whether or not the transactions of the accounts are only
+    # loaded from the store when they are needed. Adding and settling
+    # transactions never need them, as the balances are stored.
+    lazy_transactions = False
+
+    def __init__(self, memory_store: Storage,
+                 cache: Optional[AggregateCache[AggregateRecords]] = None
+                 ) -> None:
         self._store = memory_store
         self._cache: AccountCache = {}
+        self._aggregate_cache = cache
+        # The account and subaccount records as of the last read or write, by
+        # their IDs.
+        self._saved: Dict[UUID, StorageRecord] = {}
+        # The IDs of the cached accounts, by the numbers of their cards.
+        self._card_accounts: Dict[CardNumber, UUID] = {}
+        # The IDs of the accounts which this repository has compacted.
+        self._compacted: Set[UUID] = set()
+        # The IDs of the striped accounts, which are loaded without locking
+        # them.
+        self._unlocked: Set[UUID] = set()
+
+        for record_type, field in INDEXES:
+            memory_store.create_index(record_type, field)
+        for record_type, field, order in ORDERED_INDEXES:
+            memory_store.create_ordered_index(record_type, field, order)
 
     def _account_to_record(self, account: Account) -> StorageRecord:
         return {
@@ -81,22 +310,27 @@ class InMemoryRepository(AccountRepository):
     def _subaccount_to_record(self,
                               subaccount: SubAccount,
                               account: Account) -> StorageRecord:
+        balance = subaccount.balance
         return {
             'id': subaccount.id,
             'account': account.id,
-            'type': subaccount_types[type(subaccount)]
+            'type': subaccount_types[type(subaccount)],
+            'available': balance.available.cents,
+            'pending': balance.pending.cents,
         }
 
     def _transaction_to_record(self,
                                transaction: Transaction,
-                               account: SubAccount) -> StorageRecord:
+                               account: SubAccount,
+                               sequence: int) -> StorageRecord:
         return {
             'id': transaction.id,
             'reference': transaction.reference,
-            'amount': transaction.amount,
+            'amount': transaction.amount.cents,
             'type': transaction.type,
             'account': account.id,
             'status': transaction.status,
+            'sequence': sequence,
         }
 
     def _card_to_record(self,
@@ -108,38 +342,236 @@ class InMemoryRepository(AccountRepository):
             'account': account.id,
         }
 
+    def _record_to_transaction(self,
+                               record: StorageRecord) -> Transaction:
+        return Transaction(
+            id=record['id'],
+            reference=record['reference'],
+            amount=AUD.from_cents(record['amount']),
+            type=record['type'],
+            status=record['status'],
+        )
+
+    def _records_to_columns(
+            self, records: Iterable[StorageRecord]) -> TransactionColumns:
+        # The records are copied straight into the columns, without creating
+        # a Transaction for each of them.
+        columns = TransactionColumns()
+        for r in records:
+            columns.add(r['id'], r['reference'], r['amount'], r['type'],
+                        r['status'])
+        return columns
+
+    def _records_to_transactions(
+            self,
+            records: Iterable[StorageRecord],
+            compact: bool) -> Union[List[Transaction], TransactionColumns]:
+        if compact:
+            return self._records_to_columns(records)
+
+        return [self._record_to_transaction(t) for t in records]
+
+    def _lazy_transactions(self,
+                           subaccount_id: UUID,
+                           compact: bool) -> LazyTransactions:
+        def load() -> Union[List[Transaction], TransactionColumns]:
+            return self._records_to_transactions(self._store.find(
+                TRANSACTION_MODEL, Eq('account', subaccount_id),
+            ), compact)
+
+        def load_reference(reference: UUID) -> List[Transaction]:
+            # The reference index narrows this down to a couple of records.
+            return [self._record_to_transaction(t) for t in self._store.find(
+                TRANSACTION_MODEL,
+                Eq('reference', reference) & Eq('account', subaccount_id),
+            )]
+
+        def load_references(
+                references: AbstractSet[UUID]) -> List[Transaction]:
+            return [self._record_to_transaction(t) for t in self._store.find(
+                TRANSACTION_MODEL,
+                In('reference', references) & Eq('account', subaccount_id),
+            )]
+
+        return LazyTransactions(load, load_reference, load_references)
+
+    def _record_to_balance(self, record: StorageRecord) -> Optional[Balance]:
+        # Subaccounts stored before running balances were kept do not have
+        # one, so it has to be calculated from the transactions.
+        if 'available' not in record:
+            return None
+
+        return Balance(available=AUD.from_cents(record['available']),
+                       pending=AUD.from_cents(record['pending']))
+
+    def _record_to_card(self, record: StorageRecord) -> Card:
+        return Card(id=record['id'], number=record['number'])
+
     def get(self, account_id: UUID) -> Account:
-        try:
-            return self._cache[account_id]
-        except KeyError:
-            pass
+        return self.get_many([account_id])[0]
 
-        try:
-            record = self._store.get(ACCOUNT_MODEL, account_id)
-        except Exception:
-            raise AccountRepository.DoesNotExist
+    def get_many(self, ids: Iterable[UUID]) -> List[Account]:
+        ids = list(ids)
+        missing = {i for i in ids if i not in self._cache}
+
+        if missing:
+            self._load(missing)
+
+        return [self._cache[i] for i in ids]
+
+    def _group(self,
+               records: Iterable[StorageRecord],
+               field: str) -> Dict[UUID, List[StorageRecord]]:
+        groups: Dict[UUID, List[StorageRecord]] = {}
+        for r in records:
+            groups.setdefault(r[field], []).append(r)
+        return groups
+
+    def _load(self, account_ids: Set[UUID]) -> None:
+        """Load a number of accounts into the cache. Each table is read
+        once for all of the accounts, rather than once per account.
+
+        The accounts are locked before they are read, if the session the
+        repository was given has locks, apart from accounts with stripes,
+        which are locked by subaccount when they are updated. Accounts which
+        are in the shared AggregateCache, if the repository has one, are
+        built from its records instead of reading them again.
+
+        """
+
+        striped: Set[UUID] = set()
+        if self._store.locking:
+            ids, types = self._store.find_columns(SUBACCOUNT_MODEL,
+                                                  ('account', 'type'),
+                                                  In('account', account_ids))
+            striped = {i for i, t in zip(ids, types)
+                       if t == SubAccountType.STRIPE}
+
+        self._store.lock(account_ids - striped)
+        self._unlocked |= striped
+
+        cache = self._aggregate_cache
+        # Once the session has written records, it reads its own changes,
+        # which the shared cache must neither hide nor be given.
+        if cache is None or self._store.has_changes:
+            aggregates = self._read(account_ids)
+        else:
+            snapshot = self._store.snapshot
+            aggregates = {}
+            for account_id in account_ids:
+                found = cache.get(account_id, snapshot, self._usable)
+                if found is not None:
+                    aggregates[account_id] = found
+
+                    # The cached records are those at the snapshot, so the
+                    # session checks writes to them as if it read them.
+                    for record_type, table in found.tables():
+                        self._store.record_reads(record_type,
+                                                 (r['id'] for r in table))
+
+            missing = account_ids - aggregates.keys()
+            if missing:
+                read = self._read(missing)
+                for account_id, records in read.items():
+                    size = 0
+                    if cache.max_bytes is not None:
+                        size = estimate_size(records.all())
+                    cache.put(account_id, records, records.keys(), snapshot,
+                              size)
+                aggregates.update(read)
 
+        for records in aggregates.values():
+            self._build(records)
+
+    def _usable(self, records: AggregateRecords) -> bool:
+        # Accounts read lazily have no transaction records to build eager
+        # transactions from.
+        return self.lazy_transactions or records.transactions is not None
+
+    def _read(self,
+              account_ids: Set[UUID]) -> Dict[UUID, AggregateRecords]:
+        """Read the records of a number of accounts from the store.
+
+        Returns the records of each account by its ID.
+
+        """
+
+        account_records = list(self._store.find(
+            ACCOUNT_MODEL, In('id', account_ids),
+        ))
+        if len(account_records) != len(account_ids):
+            found = {r['id'] for r in account_records}
+            raise AccountRepository.DoesNotExist(
+                'Could not find accounts with IDs {}.'
+                .format(', '.join(str(i) for i in account_ids - found))
+            )
+
+        subaccount_records = self._group(self._store.find(
+            SUBACCOUNT_MODEL, In('account', account_ids),
+        ), 'account')
+
+        transaction_records: Optional[Dict[UUID, List[StorageRecord]]] = None
+        if not self.lazy_transactions:
+            subaccount_ids = [s['id']
+                              for records in subaccount_records.values()
+                              for s in records]
+            transaction_records = self._group(self._store.find(
+                TRANSACTION_MODEL, In('account', subaccount_ids),
+            ), 'account')
+
+        card_subaccount_ids = [s['id']
+                               for records in subaccount_records.values()
+                               for s in records
+                               if s['type'] == SubAccountType.CARD]
+        card_records = self._group(self._store.find(
+            CARD_MODEL, In('account', card_subaccount_ids),
+        ), 'account')
+
+        checkpoint_records = {c['id']: c for c in self._store.find(
+            CHECKPOINT_MODEL,
+            In('id', [s['id']
+                      for records in subaccount_records.values()
+                      for s in records]),
+        )}
+
+        aggregates: Dict[UUID, AggregateRecords] = {}
+        for record in account_records:
+            subaccounts = subaccount_records.get(record['id'], [])
+            ids = [s['id'] for s in subaccounts]
+
+            transactions = None
+            if transaction_records is not None:
+                transactions = {i: transaction_records.get(i, [])
+                                for i in ids}
+
+            aggregates[record['id']] = AggregateRecords(
+                record, subaccounts, transactions,
+                {i: card_records[i] for i in ids if i in card_records},
+                {i: checkpoint_records[i] for i in ids
+                 if i in checkpoint_records},
+            )
+
+        return aggregates
+
+    def _build(self, records: AggregateRecords) -> None:
+        """Build an account from its records, and cache it."""
+
+        record = records.account
+        account_id = record['id']
         account_class = None
-        record_type = record.pop('type')
+        record_type = record['type']
         for c, account_type in account_types.items():
             if record_type == account_type:
                 account_class = c
 
         if account_class is None:
-            raise ValueError('Encountered account record with unknown account'
-                             ' type {}'.format(record_type))
+            raise ValueError('Encountered account record with unknown '
+                             'account type {}'.format(record_type))
 
         subaccounts: List[SubAccount] = []
-        subaccount_records = list(self._store.find(
-            SUBACCOUNT_MODEL,
-            lambda r: r['account'] == account_id,
-        ))
-        # print(subaccount_records)
-        for subaccount_record in subaccount_records:
-            # print("Got subaccount.")
+        for subaccount_record in records.subaccounts:
             subaccount_class = None
-            record_type = subaccount_record.pop('type')
-            subaccount_record.pop('account')
+            record_type = subaccount_record['type']
             subaccount_id = subaccount_record['id']
 
             for class_, subaccount_type in subaccount_types.items():
@@ -151,41 +583,74 @@ class InMemoryRepository(AccountRepository):
                                  'account {}. Type was {}.'
                                  .format(account_id, record_type))
 
-            transaction_records = self._store.find(
-                TRANSACTION_MODEL,
-                lambda r: r['account'] == subaccount_id,
-            )
+            transactions: Iterable[Transaction]
+            if self.lazy_transactions:
+                transactions = self._lazy_transactions(
+                    subaccount_id, subaccount_class.compact_transactions,
+                )
+            else:
+                assert records.transactions is not None
+                transactions = self._records_to_transactions(
+                    records.transactions[subaccount_id],
+                    subaccount_class.compact_transactions,
+                )
 
-            transactions: List[Transaction] = []
-            for t in transaction_records:
-                t.pop('account')
-                transactions.append(Transaction(**t))
+            subaccount_arguments: Dict[str, Any] = {
+                'id': subaccount_id,
+                'transactions': transactions,
+                'balance': self._record_to_balance(subaccount_record),
+            }
 
-            subaccount_record['transactions'] = transactions
+            checkpoint = records.checkpoints.get(subaccount_id)
+            if checkpoint is not None:
+                subaccount_arguments['opening'] = \
+                    self._record_to_balance(checkpoint)
 
             if subaccount_class == CardSubAccount:
-                card_records = list(self._store.find(
-                    CARD_MODEL,
-                    lambda c: c['account'] == subaccount_id,
-                ))
-                if len(card_records) != 1:
+                cards = records.cards.get(subaccount_id, [])
+                if len(cards) != 1:
                     raise ValueError('Encountered a card sub account {}'
                                      'with no associated card.'
                                      .format(subaccount_id))
-                card_record = card_records[0]
-                card_record.pop('account')
-                subaccount_record['card'] = Card(**card_record)
+                subaccount_arguments['card'] = \
+                    self._record_to_card(cards[0])
+
+            subaccounts.append(subaccount_class(**subaccount_arguments))
 
-            subaccounts.append(subaccount_class(**subaccount_record))
+        self._cache[account_id] = instance = account_class(
+            id=account_id,
+            owner=record['owner'],
+            subaccounts=subaccounts,
+        )
+        self._remember(instance)
 
-        record['subaccounts'] = subaccounts
-        self._cache[account_id] = instance = account_class(**record)
-        return instance
+    def _remember(self, account: Account) -> None:
+        """Record that an account is saved as it is now."""
+
+        self._saved[account.id] = self._account_to_record(account)
+        for number in account.card_numbers:
+            self._card_accounts[number] = account.id
+        for s in account.subaccounts:
+            self._saved[s.id] = self._subaccount_to_record(s, account)
+            s.mark_saved()
 
     def add(self, account: Account) -> None:
+        self._add(account, False)
+
+    def _add(self, account: Account, saved: bool) -> None:
+        """Write every record of an account.
+
+        Takes two arguments:
+        - account: The account to write.
+        - saved: Whether the account may already have been saved, e.g. by
+          another repository, so its transactions may have sequences.
+
+        """
+
         record = self._account_to_record(account)
         self._store.add(ACCOUNT_MODEL, account.id, record)
 
+        transactions: List[Tuple[Transaction, SubAccount]] = []
         for s in account.subaccounts:
             record = self._subaccount_to_record(s, account)
             self._store.add(SUBACCOUNT_MODEL, s.id, record)
@@ -194,34 +659,364 @@ class InMemoryRepository(AccountRepository):
                 record = self._card_to_record(s.card, s)
                 self._store.add(CARD_MODEL, s.card.id, record)
 
-            for t in s.transactions:
-                record = self._transaction_to_record(t, s)
-                self._store.add(TRANSACTION_MODEL, t.id, record)
+            transactions.extend((t, s) for t in s.transactions)
+
+        self._write_transactions(transactions, saved)
 
         self._cache[account.id] = account
+        self._remember(account)
+
+    def _write_transactions(
+            self,
+            transactions: List[Tuple[Transaction, SubAccount]],
+            saved: bool) -> None:
+        """Write a number of transactions, with the subaccounts they belong
+        to. Transactions which have already been saved keep the sequence they
+        were added with, and new ones are given the next.
+
+        """
+
+        sequences: Dict[UUID, int] = {}
+        if saved and transactions:
+            sequences = dict(self._store.find_keys(
+                TRANSACTION_MODEL, In('id', [t.id for t, _ in transactions]),
+                'sequence',
+            ))
+
+        new = iter(next_sequences(len(transactions) - len(sequences)))
+        for t, s in transactions:
+            sequence = sequences.get(t.id)
+            if sequence is None:
+                sequence = next(new)
+            record = self._transaction_to_record(t, s, sequence)
+            self._store.update(TRANSACTION_MODEL, t.id, record)
+
+    def add_many(self,
+                 accounts: Iterable[Account],
+                 batch_size: int = 100000) -> LoadReport:
+        """Add a large number of new accounts as a single bulk load, rather
+        than writing their records one at a time. Unlike add, the accounts
+        are not cached, so the iterable may be a stream of any length.
+
+        Takes two arguments:
+        - accounts: The accounts to add.
+        - batch_size: The number of records in each entry of the store's log,
+          if it has one.
+
+        Returns a LoadReport with the number of records written.
+
+        """
+
+        with self._store.bulk_load(batch_size) as load:
+            for account in accounts:
+                load.add(ACCOUNT_MODEL, account.id,
+                         self._account_to_record(account))
+
+                for s in account.subaccounts:
+                    load.add(SUBACCOUNT_MODEL, s.id,
+                             self._subaccount_to_record(s, account))
+
+                    if isinstance(s, CardSubAccount):
+                        load.add(CARD_MODEL, s.card.id,
+                                 self._card_to_record(s.card, s))
+
+                    transactions = s.transactions
+                    for t, sequence in zip(
+                            transactions, next_sequences(len(transactions))):
+                        load.add(TRANSACTION_MODEL, t.id,
+                                 self._transaction_to_record(t, s, sequence))
+
+                    s.mark_saved()
+
+        assert load.report is not None
+        return load.report
 
     def update(self, account: Account) -> None:
+        # An account loaded before it was compacted still has the compacted
+        # transactions, and would write them again.
+        if account.id in self._compacted and \
+                self._cache.get(account.id) is not account:
+            raise ValueError('Account {} has been compacted since it was '
+                             'loaded, so must be loaded again before it is '
+                             'updated.'.format(account.id))
+
+        if account.id not in self._saved:
+            # Nothing is known about what has been saved, so write it all.
+            self._add(account, True)
+            return
+
+        if account.id in self._unlocked:
+            self._lock_changes(account)
+
         record = self._account_to_record(account)
-        self._store.update(ACCOUNT_MODEL, account.id, record)
+        if record != self._saved[account.id]:
+            self._store.update(ACCOUNT_MODEL, account.id, record)
 
+        unsaved: List[Tuple[Transaction, SubAccount]] = []
         for s in account.subaccounts:
+            saved = self._saved.get(s.id)
             record = self._subaccount_to_record(s, account)
-            self._store.update(SUBACCOUNT_MODEL, s.id, record)
+            if record != saved:
+                self._store.update(SUBACCOUNT_MODEL, s.id, record)
 
-            if isinstance(s, CardSubAccount):
-                record = self._card_to_record(s.card, s)
-                self._store.update(CARD_MODEL, s.card.id, record)
+            # Cards never change, and the transactions of a subaccount are
+            # only tracked once it has been saved, so new subaccounts are
+            # written in full.
+            transactions: Iterable[Transaction]
+            if saved is None:
+                if isinstance(s, CardSubAccount):
+                    record = self._card_to_record(s.card, s)
+                    self._store.update(CARD_MODEL, s.card.id, record)
+                transactions = s.transactions
+            else:
+                transactions = s.unsaved_transactions()
+
+            unsaved.extend((t, s) for t in transactions)
 
-            for t in s.transactions:
-                record = self._transaction_to_record(t, s)
-                self._store.update(TRANSACTION_MODEL, t.id, record)
+        self._write_transactions(unsaved, True)
 
         self._cache[account.id] = account
+        self._remember(account)
+
+    def _lock_changes(self, account: Account) -> None:
+        """Lock the records of an account which was loaded without locking
+        it that an update is about to write: the account and subaccounts
+        which have changed. The session checks them against the snapshot
+        they were read at, so the commit raises WriteConflict if another
+        unit of work has changed them since.
+
+        """
+
+        keys: List[UUID] = []
+        if self._account_to_record(account) != self._saved[account.id]:
+            keys.append(account.id)
+
+        for s in account.subaccounts:
+            if (s.id in self._saved and s.unsaved_transactions()) or \
+                    self._subaccount_to_record(s, account) != \
+                    self._saved.get(s.id):
+                keys.append(s.id)
+
+        if keys:
+            self._store.lock(keys)
+
+    def compact(self,
+                account_ids: Iterable[UUID],
+                before: Optional[int] = None) -> int:
+        """Compact the settled transactions of a number of accounts. The
+        transactions of each subaccount are added to its checkpoint, along
+        with their number and the ID of the last of them, and are moved to
+        the archive. Pending transactions are kept, so can still be
+        settled.
+
+        Accounts which this repository has already loaded are forgotten, and
+        must be loaded again before they are changed; updating them raises
+        ValueError. The subaccounts which are compacted are written again,
+        so that other units of work which loaded them before the compaction
+        get a WriteConflict if they change them.
+
+        Takes one argument, and one optional argument:
+        - account_ids: The IDs of the accounts to compact.
+        - before: Only compact transactions which were settled by a commit
+          at or before this timestamp of the store, e.g. one taken from
+          MemoryStore.timestamp a while ago. If None, every settled
+          transaction is compacted.
+
+        Returns the number of transactions compacted.
+
+        """
+
+        account_ids = set(account_ids)
+        self._store.lock(account_ids)
+        # External counterparties are locked by subaccount, so the
+        # subaccounts are locked too.
+        self._store.lock(k for k, _ in self._store.find_keys(
+            SUBACCOUNT_MODEL, In('account', account_ids),
+        ))
+
+        subaccounts = {s['id']: s for s in self._store.find(
+            SUBACCOUNT_MODEL, In('account', account_ids),
+        )}
+        subaccount_ids = list(subaccounts)
+        checkpoints = {c['id']: c for c in self._store.find(
+            CHECKPOINT_MODEL, In('id', subaccount_ids),
+        )}
+        settled = self._group(self._store.find(
+            TRANSACTION_MODEL,
+            In('account', subaccount_ids) &
+            Eq('status', TransactionStatus.SETTLED),
+        ), 'account')
+
+        compacted = 0
+        for subaccount_id, records in settled.items():
+            old: List[StorageRecord] = []
+            for r in records:
+                committed_at = self._store.committed_at(TRANSACTION_MODEL,
+                                                        r['id'])
+                if committed_at is None:
+                    continue
+                if before is None or committed_at <= before:
+                    old.append(r)
+
+            if not old:
+                continue
+            old.sort(key=lambda r: r['sequence'])
+
+            checkpoint = checkpoints.get(subaccount_id)
+            available = checkpoint['available'] if checkpoint else 0
+            for r in old:
+                if r['type'] == TransactionType.DEBIT:
+                    available -= r['amount']
+                else:
+                    available += r['amount']
+
+                # The archive keeps the sequence of the transaction, so that
+                # histories stay in order.
+                self._store.add(ARCHIVE_MODEL, r['id'], r)
+                self._store.delete(TRANSACTION_MODEL, r['id'])
+
+            self._store.update(CHECKPOINT_MODEL, subaccount_id, {
+                'id': subaccount_id,
+                'available': available,
+                'pending': checkpoint['pending'] if checkpoint else 0,
+                'count': (checkpoint['count'] if checkpoint else 0) +
+                len(old),
+                'last': old[-1]['id'],
+            })
+            self._store.update(SUBACCOUNT_MODEL, subaccount_id,
+                               subaccounts[subaccount_id])
+            compacted += len(old)
+
+        for account_id in account_ids:
+            self._compacted.add(account_id)
+            account = self._cache.pop(account_id, None)
+            if account is not None:
+                self._saved.pop(account_id, None)
+                for s in account.subaccounts:
+                    self._saved.pop(s.id, None)
+
+        return compacted
+
+    def history(self,
+                account_id: UUID = None,
+                subaccount_id: UUID = None,
+                cursor: str = None,
+                limit: int = 50,
+                status: TransactionStatus = None,
+                type: TransactionType = None) -> TransactionPage:
+        """Find a page of the transactions of an account or a subaccount,
+        newest first, without loading the account. Transactions are ordered
+        by when they were added, which settling them does not change, and
+        compacted transactions are included from the archive.
+
+        The page is found from the ordered index of the transactions of each
+        subaccount, starting at the cursor, so only the entries on the page
+        are read however far into the history it is. Its transactions are
+        only read as it is iterated over.
+
+        Each page has a cursor for the next, which carries on from the
+        transaction it ended at, so is good for later units of work. The
+        transactions which have been added since the first page are newer
+        than the cursor, so are not on later pages.
+
+        Takes one of the first two arguments, and four optional arguments:
+        - account_id: The ID of the account.
+        - subaccount_id: The ID of the subaccount.
+        - cursor: The cursor of the previous page, or None for the first.
+        - limit: The most transactions to put on the page.
+        - status: Only include transactions with this status.
+        - type: Only include transactions of this type.
+
+        Returns a TransactionPage.
+
+        """
+
+        if (account_id is None) == (subaccount_id is None):
+            raise ValueError('Must find the history of either an account or '
+                             'a subaccount.')
+
+        if limit < 1:
+            raise ValueError('Cannot find a page of less than one '
+                             'transaction.')
+
+        if account_id is not None:
+            subaccount_ids = [s['id'] for s in self._store.find(
+                SUBACCOUNT_MODEL, Eq('account', account_id),
+            )]
+            if not subaccount_ids:
+                raise AccountRepository.DoesNotExist(
+                    'Could not find an account with ID {}.'
+                    .format(account_id))
+        else:
+            subaccount_ids = [subaccount_id]
+
+        filters: List[Query] = []
+        if status is not None:
+            filters.append(Eq('status', status))
+        if type is not None:
+            filters.append(Eq('type', type))
+        query = And(*filters) if filters else None
+
+        after: Optional[OrderedEntry] = None
+        if cursor is not None:
+            after = self._decode_cursor(cursor)
+
+        # The position of each transaction in the history. One more than the
+        # page is found, to tell whether there is another page.
+        found: List[Tuple[int, UUID, str]] = []
+        for record_type in (TRANSACTION_MODEL, ARCHIVE_MODEL):
+            for s in subaccount_ids:
+                found.extend(
+                    (sequence, key, record_type)
+                    for sequence, key in self._store.find_ordered(
+                        record_type, 'account', s, 'sequence', after,
+                        limit + 1, query,
+                    )
+                )
+
+        page = heapq.nlargest(limit + 1, found)
+
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            sequence, key, _ = page[-1]
+            next_cursor = base64.urlsafe_b64encode(
+                CURSOR.pack(sequence, key.bytes)).decode('ascii')
+
+        return TransactionPage(self, [(t, k) for _, k, t in page],
+                               next_cursor)
+
+    def _decode_cursor(self, cursor: str) -> OrderedEntry:
+        try:
+            sequence, key = CURSOR.unpack(
+                base64.urlsafe_b64decode(cursor.encode('ascii')))
+        except (ValueError, struct.error):
+            raise ValueError('Invalid history cursor {!r}.'.format(cursor))
+
+        return sequence, UUID(bytes=key)
+
+    def _page_transactions(
+            self, keys: List[Tuple[str, UUID]]) -> Iterator[Transaction]:
+        for record_type, key in keys:
+            try:
+                record = self._store.get(record_type, key)
+            except NotFound:
+                # It has been compacted or deleted since the page was found.
+                continue
+
+            yield self._record_to_transaction(record)
 
     def find_by_card_number(self, card_number: CardNumber) -> Account:
+        return self.get(self.find_id_by_card_number(card_number))
+
+    def find_id_by_card_number(self, card_number: CardNumber) -> UUID:
+        # Accounts which have already been loaded know their own cards.
+        account_id = self._card_accounts.get(card_number)
+        if account_id is not None:
+            return account_id
+
         card_records = list(self._store.find(
-            CARD_MODEL,
-            lambda c: c['number'] == card_number,
+            CARD_MODEL, Eq('number', card_number),
         ))
 
         if len(card_records) != 1:
@@ -237,15 +1032,21 @@ class InMemoryRepository(AccountRepository):
                                                  'with ID {}.'
                                                  .format(subaccount_id))
 
-        return self.get(subaccount['account'])
+        return subaccount['account']
 
     def find_by_transaction_reference(self,
                                       reference: UUID) -> Iterable[Account]:
         transaction_records = list(self._store.find(
-            TRANSACTION_MODEL,
-            lambda t: t['reference'] == reference,
+            TRANSACTION_MODEL, Eq('reference', reference),
         ))
 
+        # Transactions which have been compacted are in the archive. They
+        # have been settled, so settling them again raises RuntimeError.
+        if len(transaction_records) != 2:
+            transaction_records.extend(self._store.find(
+                ARCHIVE_MODEL, Eq('reference', reference),
+            ))
+
         if len(transaction_records) != 2:
             raise ValueError('Did not get two transactions for a particular '
                              'reference.')
@@ -253,7 +1054,101 @@ class InMemoryRepository(AccountRepository):
         transaction_subaccounts = [t['account'] for t in transaction_records]
         subaccounts = self._store.find(
             SUBACCOUNT_MODEL,
-            lambda s: s['id'] in transaction_subaccounts,
+            In('id', transaction_subaccounts),
         )
 
-        return (self.get(s['account']) for s in subaccounts)
+        return self.get_many({s['account'] for s in subaccounts})
+
+    def find_by_transaction_references(
+            self,
+            references: Iterable[UUID]) -> List[Tuple[Account, Set[UUID]]]:
+        references = set(references)
+        transaction_records = list(self._store.find(
+            TRANSACTION_MODEL, In('reference', references),
+        ))
+
+        # Every reference is for a transfer, so must have two transactions.
+        counts: Dict[UUID, int] = dict.fromkeys(references, 0)
+        for t in transaction_records:
+            counts[t['reference']] += 1
+
+        # Transactions which have been compacted are in the archive.
+        short = [r for r, count in counts.items() if count != 2]
+        if short:
+            for t in self._store.find(ARCHIVE_MODEL, In('reference', short)):
+                counts[t['reference']] += 1
+                transaction_records.append(t)
+
+        subaccount_references: Dict[UUID, Set[UUID]] = {}
+        for t in transaction_records:
+            subaccount_references.setdefault(t['account'], set()).add(
+                t['reference'])
+
+        wrong = [r for r, count in counts.items() if count != 2]
+        if wrong:
+            raise ValueError('Did not get two transactions for {} of the '
+                             'references, e.g. {}.'
+                             .format(len(wrong), wrong[0]))
+
+        account_references: Dict[UUID, Set[UUID]] = {}
+        for s in self._store.find(SUBACCOUNT_MODEL,
+                                  In('id', subaccount_references)):
+            account_references.setdefault(s['account'], set()).update(
+                subaccount_references[s['id']])
+
+        accounts = self.get_many(account_references)
+        return list(zip(accounts, account_references.values()))
+
+
+class AsyncInMemoryRepository(AsyncAccountRepository):
+    """An implementation of the AsyncAccountRepository type using an
+    in-memory store, by wrapping an InMemoryRepository. Reading and writing
+    the store never waits, so none of the methods yield to the event loop.
+
+    """
+
+    # The synchronous repository which does the work. A subclass may be used
+    # to change how it behaves, e.g. to load transactions lazily.
+    repository_class: Type[InMemoryRepository] = InMemoryRepository
+
+    def __init__(self, memory_store: Storage,
+                 cache: Optional[AggregateCache[AggregateRecords]] = None
+                 ) -> None:
+        self._repository = self.repository_class(memory_store, cache)
+
+    async def get(self, account_id: UUID) -> Account:
+        return self._repository.get(account_id)
+
+    async def get_many(self, ids: Iterable[UUID]) -> List[Account]:
+        return self._repository.get_many(ids)
+
+    async def add(self, account: Account) -> None:
+        self._repository.add(account)
+
+    async def update(self, account: Account) -> None:
+        self._repository.update(account)
+
+    async def find_by_card_number(self, card_number: CardNumber) -> Account:
+        return self._repository.find_by_card_number(card_number)
+
+    async def history(self,
+                      account_id: UUID = None,
+                      subaccount_id: UUID = None,
+                      cursor: str = None,
+                      limit: int = 50,
+                      status: TransactionStatus = None,
+                      type: TransactionType = None) -> TransactionPage:
+        return self._repository.history(account_id, subaccount_id, cursor,
+                                        limit, status, type)
+
+    async def find_id_by_card_number(self, card_number: CardNumber) -> UUID:
+        return self._repository.find_id_by_card_number(card_number)
+
+    async def find_by_transaction_reference(
+            self, reference: UUID) -> Iterable[Account]:
+        return self._repository.find_by_transaction_reference(reference)
+
+    async def find_by_transaction_references(
+            self,
+            references: Iterable[UUID]) -> List[Tuple[Account, Set[UUID]]]:
+        return self._repository.find_by_transaction_references(references)
@@ -1,14 +1,93 @@
+from __future__ import annotations
 
 import copy
-from typing import Any, Callable, Dict, Iterator, Optional
+import gc
+import heapq
+import threading
+import time
+from abc import ABCMeta, abstractmethod
+from bisect import bisect_left, bisect_right
+from collections import deque
+from contextlib import contextmanager
+from decimal import Decimal
+from enum import auto, Enum
+from typing import (
+    Any,
+    Callable,
+    ContextManager,
+    Deque,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    MutableMapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    TYPE_CHECKING,
+    Union,
+)
 from uuid import UUID
 
+from .query import (
+    AccessPath,
+    And,
+    Eq,
+    In,
+    Plan,
+    Predicate,
+    Query,
+    Range,
+)
+from .write_ahead_log import WriteAheadLog
+
+if TYPE_CHECKING:
+    from .locking import HeldLocks, LockTable
+
 
 # Define some types.
-StorageRecord = Dict[str, Any]
-Table = Dict[UUID, StorageRecord]
+StorageRecord = MutableMapping[str, Any]
+# A record of None marks a deleted record.
+Table = Dict[UUID, Optional[StorageRecord]]
 Store = Dict[str, Table]
-SearchPredicate = Callable[[StorageRecord], bool]
+SearchPredicate = Callable[[Mapping[str, Any]], bool]
+Search = Union[Query, SearchPredicate]
+
+# A secondary index maps a field value to the keys of the records with that
+# value. Indexes are grouped by table and then by field.
+Index = Dict[Any, Set[UUID]]
+TableIndexes = Dict[str, Index]
+StoreIndexes = Dict[str, TableIndexes]
+
+# An ordered index maps a value of one field to (order, key) entries for the
+# records with that value, sorted by the value of another field and then by
+# key. Ordered indexes are grouped by table and then by the two fields.
+OrderedEntry = Tuple[Any, UUID]
+OrderedIndex = Dict[Any, List[OrderedEntry]]
+TableOrderedIndexes = Dict[Tuple[str, str], OrderedIndex]
+StoreOrderedIndexes = Dict[str, TableOrderedIndexes]
+
+# A key which sorts after every other in the entries of an ordered index
+# with the same order, to find the end of a range. It is not a valid UUID4,
+# so is never the key of a record.
+_LAST_KEY = UUID(int=(1 << 128) - 1)
+
+# A version of a record, tagged with the timestamp of the commit which wrote
+# it. Versions are kept oldest first.
+Version = Tuple[int, Optional[StorageRecord]]
+VersionChain = List[Version]
+VersionedTable = Dict[UUID, VersionChain]
+
+# The timestamps of the snapshots which a session read records at, by their
+# tables and keys.
+ReadTimestamps = Dict[Tuple[str, UUID], int]
+
+# A function told about each commit, with its changes and its timestamp.
+Watcher = Callable[[Optional[Store], int], None]
 
 
 class NotFound(Exception):
@@ -16,72 +95,1923 @@ class NotFound(Exception):
     pass
 
 
+class WriteConflict(Exception):
+    """Raised when committing changes to records which another unit of work
+    has committed changes to since this one began.
+
+    """
+    pass
+
+
+class RecordMode(Enum):
+    """An enum representing how a store isolates its records from callers."""
+
+    # Records are copied on the way in and on the way out, deeply if they
+    # hold mutable values.
+    COPY = auto()
+    # Records are frozen when written and handed out by reference. Callers
+    # get a copy-on-write view, so only records which are modified get
+    # copied.
+    FROZEN = auto()
+
+
+# Types whose instances can never be modified, so may be shared between a
+# frozen record and its readers.
+_immutable_types: Set[Type] = {
+    bool, bytes, Decimal, float, frozenset, int, str, type(None), UUID,
+}
+
+
+def register_immutable(value_type: Type) -> None:
+    """Allow the values of a type to be stored in frozen records. The type
+    must not allow its instances to be modified.
+
+    """
+
+    _immutable_types.add(value_type)
+
+
+def _is_immutable(value: Any) -> bool:
+    value_type = type(value)
+    if value_type in _immutable_types or isinstance(value, Enum):
+        return True
+
+    if value_type is tuple:
+        return all(_is_immutable(v) for v in value)
+
+    return any(issubclass(value_type, t) for t in _immutable_types)
+
+
+def _copy(record: StorageRecord) -> StorageRecord:
+    """Copy a record so that changes to the copy cannot reach the original.
+    Most records only hold immutable values, so only need a shallow copy,
+    which is much cheaper than a deep one.
+
+    """
+
+    for value in record.values():
+        if not _is_immutable(value):
+            return copy.deepcopy(record)
+
+    return dict(record)
+
+
+def _check_frozen(record: StorageRecord) -> None:
+    for field, value in record.items():
+        if not _is_immutable(value):
+            raise TypeError('Cannot store a {} in field {!r} of a frozen '
+                            'record.'.format(type(value).__name__, field))
+
+
+def _freeze(record: StorageRecord) -> StorageRecord:
+    _check_frozen(record)
+    return dict(record)
+
+
+class CopyOnWriteRecord(MutableMapping):
+    """A view of a frozen record which is shared until it is modified. The
+    first modification copies the record, leaving the stored version alone.
+
+    """
+
+    __slots__ = ('_record', '_owned')
+
+    def __init__(self, record: StorageRecord) -> None:
+        self._record = record
+        self._owned = False
+
+    def __repr__(self) -> str:
+        return repr(self._record)
+
+    def _own(self) -> None:
+        if not self._owned:
+            self._record = dict(self._record)
+            self._owned = True
+
+    def __getitem__(self, field: str) -> Any:
+        return self._record[field]
+
+    def __setitem__(self, field: str, value: Any) -> None:
+        self._own()
+        self._record[field] = value
+
+    def __delitem__(self, field: str) -> None:
+        self._own()
+        del self._record[field]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._record)
+
+    def __len__(self) -> int:
+        return len(self._record)
+
+
+def _index_record(indexes: TableIndexes,
+                  key: UUID,
+                  record: StorageRecord) -> None:
+    for field, index in indexes.items():
+        index.setdefault(record[field], set()).add(key)
+
+
+def _unindex_record(indexes: TableIndexes,
+                    key: UUID,
+                    record: StorageRecord) -> None:
+    for field, index in indexes.items():
+        value = record[field]
+        keys = index.get(value)
+        if keys is None:
+            continue
+
+        keys.discard(key)
+        if not keys:
+            del index[value]
+
+
+def _order_record(indexes: TableOrderedIndexes,
+                  key: UUID,
+                  record: StorageRecord) -> None:
+    for (field, order), index in indexes.items():
+        entries = index.setdefault(record[field], [])
+        entry = (record[order], key)
+
+        # Records are mostly written in order, so this is usually an append.
+        if not entries or entries[-1] < entry:
+            entries.append(entry)
+            continue
+
+        i = bisect_left(entries, entry)
+        if i == len(entries) or entries[i] != entry:
+            entries.insert(i, entry)
+
+
+def _unorder_entry(index: OrderedIndex,
+                   value: Any,
+                   entry: OrderedEntry) -> None:
+    entries = index.get(value)
+    if not entries:
+        return
+
+    i = bisect_left(entries, entry)
+    if i < len(entries) and entries[i] == entry:
+        del entries[i]
+        if not entries:
+            del index[value]
+
+
+def _unorder_record(indexes: TableOrderedIndexes,
+                    key: UUID,
+                    record: StorageRecord) -> None:
+    for (field, order), index in indexes.items():
+        _unorder_entry(index, record[field], (record[order], key))
+
+
+def _sort_entries(entries: List[OrderedEntry]) -> None:
+    """Sort the entries of an ordered index for a value in place, dropping
+    any duplicates.
+
+    """
+
+    entries.sort()
+    unique = [e for i, e in enumerate(entries)
+              if i == 0 or e != entries[i - 1]]
+    if len(unique) != len(entries):
+        entries[:] = unique
+
+
+def _put(store: Store,
+         indexes: StoreIndexes,
+         record_type: str,
+         key: UUID,
+         record: Optional[StorageRecord]) -> None:
+    """Write a record into a store, keeping its secondary indexes in sync.
+    A record of None deletes it.
+
+    """
+
+    table = store.setdefault(record_type, {})
+    table_indexes = indexes.get(record_type)
+
+    if table_indexes:
+        previous = table.get(key)
+        if previous is not None:
+            _unindex_record(table_indexes, key, previous)
+        if record is not None:
+            _index_record(table_indexes, key, record)
+
+    table[key] = record
+
+
+def _visible(chain: VersionChain, timestamp: int) -> Optional[Version]:
+    """Find the version of a record which a snapshot taken at a timestamp can
+    see, if there is one.
+
+    """
+
+    for version in reversed(chain):
+        if version[0] <= timestamp:
+            return version
+
+    return None
+
+
+class BaseRecords(metaclass=ABCMeta):
+    """A read-only set of records which a MemoryStore is layered on top of,
+    such as a snapshot on disk. Every snapshot of the store sees them, unless
+    they have been overwritten in the store.
+
+    """
+
+    @abstractmethod
+    def record_types(self) -> Iterable[str]:
+        """List the tables which there are records for."""
+        pass
+
+    @abstractmethod
+    def get(self, record_type: str, key: UUID) -> Optional[StorageRecord]:
+        """Find a record by its key, returning None if there is none."""
+        pass
+
+    @abstractmethod
+    def scan(self, record_type: str) -> Iterator[Tuple[UUID, StorageRecord]]:
+        """Iterate over the keys and records of a table."""
+        pass
+
+    @abstractmethod
+    def size(self, record_type: str) -> int:
+        """Count the records in a table."""
+        pass
+
+    @abstractmethod
+    def has_index(self, record_type: str, field: str) -> bool:
+        pass
+
+    @abstractmethod
+    def keys(self, record_type: str, field: str, value: Any) -> List[UUID]:
+        """Find the keys of the records with a particular value for an
+        indexed field.
+
+        """
+        pass
+
+    def ordered(self,
+                record_type: str,
+                field: str,
+                value: Any,
+                order: str,
+                before: Optional[OrderedEntry] = None
+                ) -> Iterator[OrderedEntry]:
+        """Iterate over the (order, key) entries of the records with a
+        particular value for a field, in descending order of another field
+        and then of their keys, starting below an entry if one is given.
+
+        This sorts the whole table, so should be overridden where the
+        records are already sorted.
+
+        """
+
+        entries = sorted(((r[order], key)
+                          for key, r in self.scan(record_type)
+                          if r[field] == value), reverse=True)
+        for entry in entries:
+            if before is None or entry < before:
+                yield entry
+
+
 class MemoryStore:
-    """A simple implementation of an in-memory store with very simple
-    transactions.
+    """A simple implementation of an in-memory store with snapshot isolation.
+
+    The store keeps multiple versions of each record, each tagged with the
+    timestamp of the commit which wrote it. Work is done through a
+    StoreSession, created with session. Between begin and commit, a session
+    reads from a snapshot of the store as it was when it began, and keeps its
+    own writes private. Readers never block writers, or vice versa.
+
+    When a session commits, the store checks that none of the records it
+    wrote have been committed by another session since it began. If any have,
+    WriteConflict is raised and the session's writes are discarded. The
+    versions which no open snapshot can see any more are dropped as records
+    are written. Deleted records are dropped, along with their index entries,
+    once no open snapshot can see them.
+
+    The store can also be used directly, through a session of its own, for
+    code which does not need units of work to run concurrently.
+
+    Sessions may also be given a LockTable to lock the records they are
+    about to change, so that sessions which change the same records wait
+    for each other instead of conflicting.
+
+    Secondary indexes may be declared on a field of a table using
+    create_index. They are kept up to date as records are written, and allow
+    lookup to find records by the value of that field without scanning the
+    whole table.
+
+    Ordered indexes may be declared on a pair of fields using
+    create_ordered_index. They keep the records with each value of one field
+    sorted by the other, so find_ordered can page through them from any
+    point without reading the records before it.
+
+    Records may be searched for with a Query, which the store inspects to
+    choose between a key lookup, an index lookup and a scan. The plan chosen
+    for a query can be seen with explain.
+
+    By default, records are copied whenever they are written or read so that
+    callers can never modify the stored version. Records which hold mutable
+    values are deep copied. In RecordMode.FROZEN the values of records must
+    be immutable, and records are only copied if a caller modifies one.
+
+    If the store is given a WriteAheadLog, every commit is appended to it
+    before it becomes visible, and the store recovers the records in the log
+    when it is created. A commit does not return until the log says it is
+    durable. Other sessions may already see it by then, but anything they
+    commit is logged after it, so cannot survive a crash that it does not.
+
+    Functions registered with watch are told about every commit before it
+    becomes visible, e.g. to invalidate a cache of the records.
+
+    Large amounts of data can be loaded with bulk_load, which commits the
+    records at once without copying them or updating indexes one at a time.
+
+    The store may also be layered on top of a read-only set of BaseRecords,
+    such as a MappedSnapshot, which are read lazily when a record has not been
+    written since.
+
+    Takes four optional arguments:
+    - key_field: The field of each record which holds its key. Queries on
+      this field are answered by fetching the records directly.
+    - record_mode: A RecordMode describing how records are isolated.
+    - log: A WriteAheadLog to make commits durable with.
+    - base: BaseRecords to layer the store on top of.
 
     """
 
-    def __init__(self):
-        self._records: Store = {}
-        self._changed: Optional[Store] = None
+    def __init__(self, key_field: str = 'id',
+                 record_mode: RecordMode = RecordMode.COPY,
+                 log: Optional[WriteAheadLog] = None,
+                 base: Optional[BaseRecords] = None):
+        self._key_field = key_field
+        self._record_mode = record_mode
+        self._tables: Dict[str, VersionedTable] = {}
+        # The indexes cover every version of a record that is still kept, so
+        # they may return keys whose visible version no longer matches.
+        self._indexes: StoreIndexes = {}
+        self._ordered: StoreOrderedIndexes = {}
+        # The timestamp of the most recent commit.
+        self._timestamp = 0
+        # The number of open snapshots at each timestamp.
+        self._snapshots: Dict[int, int] = {}
+        # The records which have been deleted, with the timestamps of the
+        # deletions, oldest first, until no snapshot can see them.
+        self._deleted: Deque[Tuple[int, str, UUID]] = deque()
+        # Serialises commits and the opening and closing of snapshots. Reads
+        # do not take it; they rely on the individual operations on the
+        # tables and indexes being atomic.
+        self._lock = threading.Lock()
+        self._default = StoreSession(self)
+        self._base = base
+        self._watchers: List[Watcher] = []
+
+        self._log = log
+        if log is not None:
+            for changes in log.recover():
+                self._timestamp += 1
+                self._apply(changes, self._timestamp, self._timestamp)
+
+    def session(self, locks: Optional[LockTable] = None) -> StoreSession:
+        """Create a new session for a unit of work, which may take locks
+        from a LockTable. See StoreSession.lock.
+
+        """
+
+        return StoreSession(self, locks)
+
+    def create_index(self, record_type: str, field: str) -> None:
+        """Declare a secondary index on a field of a table. Does nothing if
+        the index already exists.
+
+        Takes two arguments:
+        - record_type: The table to index.
+        - field: The name of the field to index. Its values must be hashable.
+
+        """
+
+        with self._lock:
+            table_indexes = self._indexes.setdefault(record_type, {})
+            if field in table_indexes:
+                return
+
+            index: Index = {}
+            for key, chain in self._tables.get(record_type, {}).items():
+                for _, record in chain:
+                    if record is not None:
+                        index.setdefault(record[field], set()).add(key)
+            table_indexes[field] = index
+
+    def has_index(self, record_type: str, field: str) -> bool:
+        return field in self._indexes.get(record_type, {})
+
+    def create_ordered_index(self,
+                             record_type: str,
+                             field: str,
+                             order: str) -> None:
+        """Declare an index of the records of a table with each value of a
+        field, sorted by another field, for find_ordered. Does nothing if the
+        index already exists.
+
+        Takes three arguments:
+        - record_type: The table to index.
+        - field: The name of the field to group the records by. Its values
+          must be hashable.
+        - order: The name of the field to sort the records by. Its values
+          must be comparable with each other.
+
+        """
+
+        with self._lock:
+            table_indexes = self._ordered.setdefault(record_type, {})
+            if (field, order) in table_indexes:
+                return
+
+            index: OrderedIndex = {}
+            for key, chain in self._tables.get(record_type, {}).items():
+                for _, record in chain:
+                    if record is not None:
+                        index.setdefault(record[field], []).append(
+                            (record[order], key),
+                        )
+            for entries in index.values():
+                _sort_entries(entries)
+            table_indexes[(field, order)] = index
+
+    def has_ordered_index(self,
+                          record_type: str,
+                          field: str,
+                          order: str) -> bool:
+        return (field, order) in self._ordered.get(record_type, {})
+
+    def watch(self, watcher: Watcher) -> None:
+        """Register a function to be called with the changed records and the
+        timestamp of every commit. It is called holding the store's lock,
+        before any snapshot can see the commit, so must be quick and must not
+        use the store. It must not modify the records either.
+
+        The changes are None for a bulk load, as the records it wrote are
+        not gathered up.
+
+        """
+
+        with self._lock:
+            self._watchers.append(watcher)
+
+    @property
+    def timestamp(self) -> int:
+        """The timestamp of the most recent commit."""
+
+        return self._timestamp
+
+    @property
+    def durable(self) -> bool:
+        """Whether commits wait for a WriteAheadLog to make them durable."""
+
+        return self._log is not None
+
+    def _hand_out(self, record: StorageRecord) -> StorageRecord:
+        if self._record_mode == RecordMode.FROZEN:
+            return CopyOnWriteRecord(record)
+
+        return _copy(record)
+
+    def _take(self, record: StorageRecord) -> StorageRecord:
+        if self._record_mode == RecordMode.FROZEN:
+            return _freeze(record)
+
+        return _copy(record)
+
+    def _open_snapshot(self) -> int:
+        with self._lock:
+            timestamp = self._timestamp
+            self._snapshots[timestamp] = self._snapshots.get(timestamp, 0) + 1
+            if self._deleted:
+                self._vacuum(self._horizon())
+
+        return timestamp
+
+    def _close_snapshot(self, timestamp: int) -> None:
+        with self._lock:
+            remaining = self._snapshots[timestamp] - 1
+            if remaining:
+                self._snapshots[timestamp] = remaining
+            else:
+                del self._snapshots[timestamp]
+                if self._deleted:
+                    self._vacuum(self._horizon())
+
+    def _horizon(self) -> int:
+        """The oldest timestamp which an open snapshot may read at."""
+
+        return min(self._snapshots, default=self._timestamp)
+
+    def _read(self,
+              record_type: str,
+              key: UUID,
+              timestamp: int) -> StorageRecord:
+        chain = self._tables.get(record_type, {}).get(key)
+        if chain:
+            version = _visible(chain, timestamp)
+            if version is not None:
+                if version[1] is None:
+                    raise NotFound
+                return version[1]
+
+        if self._base is not None:
+            record = self._base.get(record_type, key)
+            if record is not None:
+                return record
+
+        raise NotFound
+
+    def _version(self,
+                 record_type: str,
+                 key: UUID,
+                 timestamp: int) -> Tuple[int, StorageRecord]:
+        """Find the version of a record which a snapshot can see, along with
+        the timestamp of the commit which wrote it. Records in the base were
+        written before any commit, at 0.
+
+        """
+
+        chain = self._tables.get(record_type, {}).get(key)
+        if chain:
+            version = _visible(chain, timestamp)
+            if version is not None:
+                if version[1] is None:
+                    raise NotFound
+                return version[0], version[1]
+
+        if self._base is not None:
+            record = self._base.get(record_type, key)
+            if record is not None:
+                return 0, record
+
+        raise NotFound
+
+    def _scan(self,
+              record_type: str,
+              timestamp: int) -> Iterator[Tuple[UUID, StorageRecord]]:
+        """Iterate over the keys and records of a table which are visible to
+        a snapshot.
+
+        """
+
+        for key, _, record in self._scan_versions(record_type, timestamp):
+            yield key, record
+
+    def _scan_versions(
+            self,
+            record_type: str,
+            timestamp: int) -> Iterator[Tuple[UUID, int, StorageRecord]]:
+        """Iterate over the keys of a table, and the versions of the records
+        which are visible to a snapshot with their timestamps.
+
+        """
+
+        # Copying a dict is atomic, so this is safe while others commit.
+        versions = dict(self._tables.get(record_type, {}))
+
+        for key, chain in versions.items():
+            version = _visible(chain, timestamp)
+            if version is not None and version[1] is not None:
+                yield key, version[0], version[1]
+
+        if self._base is not None:
+            for key, record in self._base.scan(record_type):
+                shadow = versions.get(key)
+                if shadow is None or _visible(shadow, timestamp) is None:
+                    yield key, 0, record
+
+    def _table_size(self, record_type: str) -> int:
+        size = len(self._tables.get(record_type, {}))
+        if self._base is not None:
+            size += self._base.size(record_type)
+        return size
+
+    def _index_size(self, record_type: str, field: str, value: Any) -> int:
+        size = len(self._indexes[record_type][field].get(value, ()))
+        if self._base is not None:
+            if self._base.has_index(record_type, field):
+                size += len(self._base.keys(record_type, field, value))
+            else:
+                size += self._base.size(record_type)
+        return size
+
+    def _index_keys(self,
+                    record_type: str,
+                    field: str,
+                    values: Iterable[Any]) -> Set[UUID]:
+        index = self._indexes[record_type][field]
+
+        keys: Set[UUID] = set()
+        for value in values:
+            keys.update(index.get(value, ()))
+
+        base = self._base
+        if base is not None:
+            if base.has_index(record_type, field):
+                for value in values:
+                    keys.update(base.keys(record_type, field, value))
+            else:
+                keys.update(k for k, r in base.scan(record_type)
+                            if r[field] in values)
+
+        return keys
+
+    def _ordered_entries(self,
+                         record_type: str,
+                         field: str,
+                         value: Any,
+                         order: str,
+                         before: Optional[OrderedEntry]
+                         ) -> Iterator[OrderedEntry]:
+        """Iterate over the entries of an ordered index, and of the base, for
+        a value, in descending order and starting below an entry if one is
+        given. Like the other indexes, they cover every version kept.
+
+        """
+
+        index = self._ordered[record_type][(field, order)]
+        entries = self._descend(index, value, before)
+
+        if self._base is None:
+            return entries
+
+        return heapq.merge(entries,
+                           self._base.ordered(record_type, field, value,
+                                              order, before),
+                           reverse=True)
+
+    def _ordered_range(self,
+                       record_type: str,
+                       field: str,
+                       value: Any,
+                       order: str,
+                       bounds: Range) -> List[OrderedEntry]:
+        """Find the entries of an ordered index, and of the base, for a value
+        whose order lies within a range. Like the other indexes, they cover
+        every version kept.
+
+        """
+
+        lower, upper = bounds.lower, bounds.upper
+        last = None if upper is None else (upper, _LAST_KEY)
+
+        index = self._ordered[record_type][(field, order)]
+        with self._lock:
+            entries = index.get(value, [])
+            start = 0 if lower is None else bisect_left(entries, (lower,))
+            end = len(entries) if last is None else \
+                bisect_right(entries, last)
+            found = entries[start:end]
+
+        if self._base is not None:
+            for entry in self._base.ordered(record_type, field, value, order,
+                                            last):
+                if lower is not None and entry[0] < lower:
+                    break
+                found.append(entry)
+
+        return found
+
+    def _descend(self,
+                 index: OrderedIndex,
+                 value: Any,
+                 before: Optional[OrderedEntry]) -> Iterator[OrderedEntry]:
+        # Commits insert entries as they go, so a window of the entries is
+        # copied at a time, holding the lock. The windows grow, so reading a
+        # page only copies a little more than the page.
+        size = 32
+        while True:
+            with self._lock:
+                entries = index.get(value, [])
+                end = len(entries) if before is None else \
+                    bisect_left(entries, before)
+                window = entries[max(0, end - size):end]
+
+            yield from reversed(window)
+
+            if end <= size:
+                return
+            before = window[0]
+            size = min(size * 2, 1024)
+
+    def _prune(self,
+               table: VersionedTable,
+               table_indexes: TableIndexes,
+               table_ordered: TableOrderedIndexes,
+               key: UUID,
+               horizon: int) -> None:
+        """Drop the versions of a record which no open snapshot can see."""
+
+        chain = table[key]
+
+        # Keep the newest version visible at the horizon, and everything
+        # after it.
+        i = len(chain) - 1
+        while i > 0 and chain[i][0] > horizon:
+            i -= 1
+
+        if i == 0:
+            return
+
+        # Readers may be walking the old chain, so replace it rather than
+        # modifying it.
+        table[key] = kept = chain[i:]
+
+        for _, record in chain[:i]:
+            if record is None:
+                continue
+
+            for field, index in table_indexes.items():
+                value = record[field]
+                if any(r is not None and r[field] == value for _, r in kept):
+                    continue
+
+                keys = index.get(value)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del index[value]
+
+            for (field, order), ordered in table_ordered.items():
+                value, entry = record[field], (record[order], key)
+                if any(r is not None and r[field] == value and
+                       r[order] == entry[0] for _, r in kept):
+                    continue
+
+                _unorder_entry(ordered, value, entry)
+
+    def _commit(self,
+                changes: Store,
+                snapshot: Optional[int],
+                read_at: Optional[ReadTimestamps] = None) -> int:
+        """Write a set of changed records as a new version.
+
+        Takes two arguments, and one optional argument:
+        - changes: The changed records, by table and then by key.
+        - snapshot: The timestamp of the snapshot the changes were based on.
+          If any of the records have been committed since then, the commit is
+          refused. If None, the changes are written regardless.
+        - read_at: The timestamps of later snapshots which some of the
+          records were read at, which they are checked against instead.
+
+        Returns the timestamp of the commit.
+
+        """
+
+        with self._lock:
+            if snapshot is not None:
+                conflicts = []
+                for record_type, records in changes.items():
+                    table = self._tables.get(record_type, {})
+                    for key in records:
+                        chain = table.get(key)
+                        if not chain:
+                            continue
+
+                        based_on = snapshot
+                        if read_at:
+                            based_on = read_at.get((record_type, key),
+                                                   snapshot)
+                        if chain[-1][0] > based_on:
+                            conflicts.append((record_type, key))
+
+                if conflicts:
+                    raise WriteConflict('{} records have been changed by '
+                                        'another unit of work, e.g. {} {}.'
+                                        .format(len(conflicts),
+                                                *conflicts[0]))
+
+            timestamp = self._timestamp + 1
+
+            lsn = None
+            if self._log is not None:
+                lsn = self._log.append(changes)
+
+            horizon = self._horizon()
+            self._apply(changes, timestamp, horizon)
+            self._vacuum(horizon)
+            for watcher in self._watchers:
+                watcher(changes, timestamp)
+
+            # Only now can new snapshots see the commit, so they never see
+            # part of one.
+            self._timestamp = timestamp
+
+        if self._log is not None:
+            assert lsn is not None
+            self._log.sync(lsn)
+
+            if self._log.needs_checkpoint():
+                self.checkpoint()
+
+        return timestamp
+
+    def _apply(self, changes: Store, timestamp: int, horizon: int) -> None:
+        for record_type, records in changes.items():
+            table = self._tables.setdefault(record_type, {})
+            table_indexes = self._indexes.get(record_type, {})
+            table_ordered = self._ordered.get(record_type, {})
+
+            for key, record in records.items():
+                chain = table.get(key)
+                if chain is None:
+                    table[key] = [(timestamp, record)]
+                else:
+                    chain.append((timestamp, record))
+                    self._prune(table, table_indexes, table_ordered, key,
+                                horizon)
+
+                if record is not None:
+                    _index_record(table_indexes, key, record)
+                    _order_record(table_ordered, key, record)
+                else:
+                    self._deleted.append((timestamp, record_type, key))
+
+    def _vacuum(self, horizon: int) -> None:
+        """Drop the records which were deleted at or before the horizon, so
+        no open snapshot can see them, along with their index entries. A
+        deletion is kept if the record is in the base, to hide it.
+
+        """
+
+        deleted = self._deleted
+        while deleted and deleted[0][0] <= horizon:
+            timestamp, record_type, key = deleted.popleft()
+            table = self._tables[record_type]
+            chain = table.get(key)
+            # The record may have been written again since.
+            if not chain or chain[-1] != (timestamp, None):
+                continue
+
+            table_indexes = self._indexes.get(record_type, {})
+            table_ordered = self._ordered.get(record_type, {})
+            for _, record in chain:
+                if record is not None:
+                    _unindex_record(table_indexes, key, record)
+                    _unorder_record(table_ordered, key, record)
+
+            if self._base is not None and \
+                    self._base.get(record_type, key) is not None:
+                table[key] = [chain[-1]]
+            else:
+                del table[key]
+
+    @contextmanager
+    def _bulk_load(self, batch_size: int) -> Iterator[BulkLoad]:
+        """Stage the records of a bulk load without holding the lock, then
+        commit them all at once. See StoreSession.bulk_load.
+
+        """
+
+        started = time.perf_counter()
+
+        load = BulkLoad(self)
+        try:
+            yield load
+        except BaseException:
+            load._discard()
+            raise
+
+        # Publishing the records creates a lot of objects which are never
+        # garbage, so the cyclic garbage collector would only waste time
+        # looking at them.
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            with self._lock:
+                timestamp = self._timestamp + 1
+                lsn = load._finish(timestamp, self._horizon(), batch_size)
+                for watcher in self._watchers:
+                    watcher(None, timestamp)
+                self._timestamp = timestamp
+        finally:
+            if collecting:
+                gc.enable()
+
+        if self._log is not None and lsn is not None:
+            self._log.sync(lsn)
+
+            if self._log.needs_checkpoint():
+                self.checkpoint()
+
+        load.report = LoadReport(load.rows, time.perf_counter() - started)
+
+    def checkpoint(self) -> None:
+        """Write every committed record to the log's checkpoint, so that the
+        log can be truncated. Commits wait while this happens.
+
+        """
+
+        if self._log is None:
+            raise RuntimeError('Cannot checkpoint a store without a log.')
+
+        with self._lock:
+            records: Store = {}
+            record_types = set(self._tables)
+            if self._base is not None:
+                record_types.update(self._base.record_types())
+
+            for record_type in record_types:
+                records[record_type] = dict(self._scan(record_type,
+                                                       self._timestamp))
+
+            self._log.checkpoint(records)
+
+    def close(self) -> None:
+        """Make sure everything committed is on disk and close the log."""
+
+        if self._log is not None:
+            with self._lock:
+                self._log.close()
+
+    # The rest of the interface goes through the store's own session.
+
+    @property
+    def writes(self) -> int:
+        return self._default.writes
+
+    @property
+    def snapshot(self) -> int:
+        return self._default.snapshot
+
+    @property
+    def has_changes(self) -> bool:
+        return self._default.has_changes
+
+    @property
+    def locking(self) -> bool:
+        return self._default.locking
 
     def get(self, record_type: str, key: UUID) -> StorageRecord:
+        return self._default.get(record_type, key)
+
+    def committed_at(self, record_type: str, key: UUID) -> Optional[int]:
+        return self._default.committed_at(record_type, key)
+
+    def record_reads(self, record_type: str, keys: Iterable[UUID]) -> None:
+        self._default.record_reads(record_type, keys)
+
+    def find_keys(self,
+                  record_type: str,
+                  query: Search,
+                  field: Optional[str] = None) -> List[Tuple[UUID, Any]]:
+        return self._default.find_keys(record_type, query, field)
+
+    def find_columns(self,
+                     record_type: str,
+                     fields: Sequence[str],
+                     query: Optional[Search] = None) -> List[List[Any]]:
+        return self._default.find_columns(record_type, fields, query)
+
+    def explain(self, record_type: str, query: Search) -> Plan:
+        return self._default.explain(record_type, query)
+
+    def find(self,
+             record_type: str,
+             query: Search) -> Iterator[StorageRecord]:
+        return self._default.find(record_type, query)
+
+    def find_ordered(self,
+                     record_type: str,
+                     field: str,
+                     value: Any,
+                     order: str,
+                     before: Optional[OrderedEntry] = None,
+                     limit: Optional[int] = None,
+                     query: Optional[Search] = None) -> List[OrderedEntry]:
+        return self._default.find_ordered(record_type, field, value, order,
+                                          before, limit, query)
+
+    def lookup(self,
+               record_type: str,
+               field: str,
+               value: Any) -> Iterator[StorageRecord]:
+        return self._default.lookup(record_type, field, value)
+
+    def add(self,
+            record_type: str,
+            key: UUID,
+            record: StorageRecord) -> None:
+        self._default.add(record_type, key, record)
+
+    def update(self,
+               record_type: str,
+               key: UUID,
+               record: StorageRecord) -> None:
+        self._default.update(record_type, key, record)
+
+    def delete(self, record_type: str, key: UUID) -> None:
+        self._default.delete(record_type, key)
+
+    def lock(self, keys: Iterable[Hashable]) -> None:
+        self._default.lock(keys)
+
+    def bulk_load(self,
+                  batch_size: int = 100000) -> ContextManager[BulkLoad]:
+        return self._default.bulk_load(batch_size)
+
+    def begin(self) -> None:
+        self._default.begin()
+
+    def rollback(self) -> None:
+        self._default.rollback()
+
+    def commit(self) -> None:
+        self._default.commit()
+
+
+class StoreSession:
+    """A session on a MemoryStore, used by a single unit of work.
+
+    Outside of a transaction, each read sees the latest committed records and
+    each write is committed immediately. Between begin and commit, reads see
+    the snapshot of the store taken by begin along with the session's own
+    writes, which are only made visible to other sessions by commit.
+
+    A session is not itself thread-safe, but any number of sessions may be
+    used concurrently on the same store.
+
+    A session given a LockTable can lock the keys of the records it is
+    about to read, so that sessions which change the same records take
+    turns rather than failing to commit. See lock.
+
+    Takes one optional argument:
+    - locks: A LockTable shared by the sessions which should take turns.
+
+    """
+
+    def __init__(self, store: MemoryStore,
+                 locks: Optional[LockTable] = None) -> None:
+        self._store = store
+        self._locks: Optional[HeldLocks] = None
+        if locks is not None:
+            self._locks = locks.holder()
+        self._snapshot: Optional[int] = None
+        # The timestamp of the snapshot the transaction began with, and once
+        # lock has moved the snapshot forward, the timestamps of the
+        # snapshots which records have since been read at.
+        self._began: Optional[int] = None
+        self._read_at: Optional[ReadTimestamps] = None
+        self._changed: Optional[Store] = None
+        self._changed_indexes: StoreIndexes = {}
+
+        # The number of records written through this session, whether or not
+        # they were committed. Useful for checking how much work an
+        # operation does.
+        self.writes = 0
+
+    def create_index(self, record_type: str, field: str) -> None:
+        self._store.create_index(record_type, field)
+
+    def has_index(self, record_type: str, field: str) -> bool:
+        return self._store.has_index(record_type, field)
+
+    def create_ordered_index(self,
+                             record_type: str,
+                             field: str,
+                             order: str) -> None:
+        self._store.create_ordered_index(record_type, field, order)
+
+    def has_ordered_index(self,
+                          record_type: str,
+                          field: str,
+                          order: str) -> bool:
+        return self._store.has_ordered_index(record_type, field, order)
+
+    @property
+    def snapshot(self) -> int:
+        """The timestamp the session reads at: that of its snapshot in a
+        transaction, or otherwise of the most recent commit.
+
+        """
+
+        if self._snapshot is not None:
+            return self._snapshot
+
+        return self._store.timestamp
+
+    @property
+    def has_changes(self) -> bool:
+        """Whether the session has written records which it has not yet
+        committed, so that it reads records no other session can see.
+
+        """
+
+        return bool(self._changed)
+
+    @property
+    def locking(self) -> bool:
+        """Whether lock takes locks, i.e. the session has a LockTable and is
+        in a transaction.
+
+        """
+
+        return self._locks is not None and self._snapshot is not None
+
+    @contextmanager
+    def _reading(self) -> Iterator[int]:
+        """Find the timestamp to read at, holding a snapshot open for the
+        duration of the read if the session does not already have one.
+
+        """
+
+        if self._snapshot is not None:
+            yield self._snapshot
+            return
+
+        snapshot = self._store._open_snapshot()
+        try:
+            yield snapshot
+        finally:
+            self._store._close_snapshot(snapshot)
+
+    def _current(self,
+                 record_type: str,
+                 key: UUID,
+                 snapshot: int) -> StorageRecord:
         if self._changed:
             try:
-                return copy.deepcopy(self._changed[record_type][key])
+                record = self._changed[record_type][key]
             except KeyError:
                 pass
+            else:
+                if record is None:
+                    raise NotFound
+                return record
+
+        return self._store._read(record_type, key, snapshot)
+
+    def _changed_index(self, record_type: str, field: str) -> Index:
+        """Find the index of a field over this session's changed records,
+        building it if it has not been needed yet.
 
+        """
+
+        table_indexes = self._changed_indexes.setdefault(record_type, {})
         try:
-            return copy.deepcopy(self._records[record_type][key])
+            return table_indexes[field]
         except KeyError:
-            raise NotFound
+            pass
+
+        index: Index = {}
+        if self._changed is not None:
+            for key, record in self._changed.get(record_type, {}).items():
+                if record is not None:
+                    index.setdefault(record[field], set()).add(key)
+        table_indexes[field] = index
+
+        return index
+
+    def get(self, record_type: str, key: UUID) -> StorageRecord:
+        with self._reading() as snapshot:
+            record = self._current(record_type, key, snapshot)
+            if self._read_at is not None:
+                self._read_at[(record_type, key)] = snapshot
+            return self._store._hand_out(record)
+
+    def committed_at(self, record_type: str, key: UUID) -> Optional[int]:
+        """Find the timestamp of the commit which wrote the version of a
+        record which the session reads. Records in the store's base were
+        written before any commit, at 0. Raises NotFound if there is no such
+        record.
+
+        Returns the timestamp, or None if the session has written the record
+        itself and not yet committed it.
+
+        """
+
+        if self._changed and key in self._changed.get(record_type, {}):
+            if self._changed[record_type][key] is None:
+                raise NotFound
+            return None
+
+        with self._reading() as snapshot:
+            committed_at = self._store._version(record_type, key, snapshot)[0]
+            if self._read_at is not None:
+                self._read_at[(record_type, key)] = snapshot
+            return committed_at
+
+    def record_reads(self, record_type: str, keys: Iterable[UUID]) -> None:
+        """Note that the session has read records as of its snapshot
+        without reading them from the store, e.g. from an AggregateCache
+        which holds them as they are at the snapshot. Its writes to them are
+        then checked for conflicts as if it had read them itself. See lock.
+
+        """
+
+        if self._read_at is not None:
+            snapshot = self.snapshot
+            for key in keys:
+                self._read_at[(record_type, key)] = snapshot
+
+    def _table_size(self, record_type: str) -> int:
+        size = self._store._table_size(record_type)
+        if self._changed is not None:
+            size += len(self._changed.get(record_type, {}))
+        return size
+
+    def _index_estimate(self, record_type: str, field: str,
+                        values: Iterable[Any]) -> int:
+        estimate = 0
+        changed_index = self._changed_index(record_type, field) \
+            if self._changed else {}
+        for v in values:
+            estimate += self._store._index_size(record_type, field, v)
+            estimate += len(changed_index.get(v, ()))
+
+        return estimate
+
+    def _plan_ranges(self,
+                     record_type: str,
+                     terms: Sequence[Query]) -> Iterator[Tuple[Plan, Query]]:
+        """Find the ways to answer the ranges in the terms of a query with
+        ordered indexes, which need an Eq or In term on the field the index
+        groups by. The range is left in the residual.
+
+        Returns an iterator of (plan, term) tuples, where the term is the one
+        the plan answers.
+
+        """
+
+        ranges = [t for t in terms if isinstance(t, Range)]
+        if not ranges:
+            return
+
+        for term in terms:
+            if isinstance(term, Eq):
+                field, values = term.field, frozenset((term.value,))
+            elif isinstance(term, In):
+                field, values = term.field, term.values
+            else:
+                continue
+
+            for bounds in ranges:
+                if not self.has_ordered_index(record_type, field,
+                                              bounds.field):
+                    continue
+
+                estimate = sum(
+                    len(self._store._ordered_range(record_type, field, v,
+                                                   bounds.field, bounds))
+                    for v in values
+                )
+                if self._changed:
+                    changed_index = self._changed_index(record_type, field)
+                    estimate += sum(len(changed_index.get(v, ()))
+                                    for v in values)
+
+                yield Plan(record_type, AccessPath.RANGE_LOOKUP, field,
+                           values, estimate=estimate, bounds=bounds), term
+
+    def _plan_term(self, record_type: str, term: Query) -> Optional[Plan]:
+        """Find a cheaper access path than a scan for a single term of a
+        query, if there is one.
+
+        """
+
+        if isinstance(term, Eq):
+            field, values = term.field, frozenset((term.value,))
+        elif isinstance(term, In):
+            field, values = term.field, term.values
+        else:
+            return None
+
+        if field == self._store._key_field:
+            return Plan(record_type, AccessPath.KEY_LOOKUP, field, values,
+                        estimate=len(values))
+
+        if self.has_index(record_type, field):
+            return Plan(record_type, AccessPath.INDEX_LOOKUP, field, values,
+                        estimate=self._index_estimate(record_type, field,
+                                                      values))
+
+        return None
+
+    def explain(self, record_type: str, query: Search) -> Plan:
+        """Choose how to answer a query. Of the terms which can be answered
+        using the keys or an index, the one expected to produce the fewest
+        records is used and the rest of the query is applied as a filter.
+        A Range on the field an ordered index sorts by, along with an Eq or
+        In on the field it groups by, can be answered with the ordered index.
+
+        Takes two arguments:
+        - record_type: The table to search.
+        - query: A Query, or a predicate function.
+
+        Returns a Plan.
+
+        """
+
+        if not isinstance(query, Query):
+            query = Predicate(query)
+
+        terms = query.queries if isinstance(query, And) else (query,)
+
+        best: Optional[Plan] = None
+        best_term: Optional[Query] = None
+        for term in terms:
+            plan = self._plan_term(record_type, term)
+            if plan is None:
+                continue
+
+            if best is None or plan.estimate < best.estimate:
+                best, best_term = plan, term
+
+        for plan, term in self._plan_ranges(record_type, terms):
+            if best is None or plan.estimate < best.estimate:
+                best, best_term = plan, term
+
+        if best is None:
+            return Plan(record_type, AccessPath.SCAN, residual=query,
+                        estimate=self._table_size(record_type))
+
+        rest = [t for t in terms if t is not best_term]
+        if len(rest) == 1:
+            best.residual = rest[0]
+        elif rest:
+            best.residual = And(*rest)
+
+        return best
+
+    def _candidate_keys(self, plan: Plan) -> Iterable[UUID]:
+        if plan.access == AccessPath.KEY_LOOKUP:
+            return plan.values
+
+        assert plan.field is not None
+        if plan.access == AccessPath.RANGE_LOOKUP:
+            assert plan.bounds is not None
+            keys = {key for v in plan.values
+                    for _, key in self._store._ordered_range(
+                        plan.record_type, plan.field, v, plan.bounds.field,
+                        plan.bounds)}
+            if self._changed:
+                changed_index = self._changed_index(plan.record_type,
+                                                    plan.field)
+                for value in plan.values:
+                    keys.update(changed_index.get(value, ()))
+            return keys
+
+        keys = self._store._index_keys(plan.record_type, plan.field,
+                                       plan.values)
+        if self._changed:
+            changed_index = self._changed_index(plan.record_type, plan.field)
+            for value in plan.values:
+                keys.update(changed_index.get(value, ()))
+
+        return keys
+
+    def _matching(
+            self, plan: Plan,
+            snapshot: int) -> Iterator[Tuple[UUID, Optional[int],
+                                             StorageRecord]]:
+        """Find the records which satisfy a plan, as they are kept, so they
+        must not be handed out without copying.
+
+        Returns an iterator of (key, timestamp, record) tuples, where the
+        timestamp is that of the commit which wrote the record, or None for
+        records written by this session.
+
+        """
+
+        residual = plan.residual
+        record_type = plan.record_type
+        read_at = self._read_at
 
-    def find(self,
-             record_type: str,
-             predicate: SearchPredicate) -> Iterator[StorageRecord]:
         changed_records: Table = {}
         if self._changed is not None:
             changed_records = self._changed.get(record_type, {})
-        existing_records = self._records.get(record_type, {})
 
-        if not changed_records and not existing_records:
-            return iter([])
+        if plan.access == AccessPath.SCAN:
+            for key, timestamp, r in self._store._scan_versions(record_type,
+                                                                snapshot):
+                if key in changed_records:
+                    continue
+
+                if residual is None or residual.matches(r):
+                    if read_at is not None:
+                        read_at[(record_type, key)] = snapshot
+                    yield key, timestamp, r
+
+            for key, changed in list(changed_records.items()):
+                if changed is None:
+                    continue
+                if residual is None or residual.matches(changed):
+                    yield key, None, changed
+            return
+
+        field, values = plan.field, plan.values
+        assert field is not None
+        version = self._store._version
+        for key in self._candidate_keys(plan):
+            committed_at: Optional[int] = None
+            try:
+                if changed_records and key in changed_records:
+                    record = self._current(record_type, key, snapshot)
+                else:
+                    committed_at, record = version(record_type, key,
+                                                   snapshot)
+            except NotFound:
+                continue
+
+            # The index may hold keys for older versions of records, or for
+            # committed versions which this session has since changed, so
+            # check the version this session can see.
+            if record[field] not in values:
+                continue
+
+            if residual is None or residual.matches(record):
+                if read_at is not None and committed_at is not None:
+                    read_at[(record_type, key)] = snapshot
+                yield key, committed_at, record
+
+    def _execute(self, plan: Plan, snapshot: int) -> Iterator[StorageRecord]:
+        hand_out = self._store._hand_out
+        for _, _, record in self._matching(plan, snapshot):
+            yield hand_out(record)
+
+    def find_keys(self,
+                  record_type: str,
+                  query: Search,
+                  field: Optional[str] = None) -> List[Tuple[UUID, Any]]:
+        """Find the keys of the records in a table which satisfy a query,
+        without copying the records, e.g. to choose which of them to read.
+
+        Takes two arguments, and one optional argument:
+        - record_type: The table to search.
+        - query: A Query, or a predicate function.
+        - field: A field of the records to find the value of.
+
+        Returns a list of (key, value) tuples, where the value is that of
+        the field or, if there is no field, the timestamp of the commit
+        which wrote the record as returned by committed_at.
+
+        """
+
+        plan = self.explain(record_type, query)
+
+        with self._reading() as snapshot:
+            if field is not None:
+                return [(key, r[field])
+                        for key, _, r in self._matching(plan, snapshot)]
+
+            return [(key, committed_at)
+                    for key, committed_at, _ in self._matching(plan,
+                                                               snapshot)]
+
+    def find_columns(self,
+                     record_type: str,
+                     fields: Sequence[str],
+                     query: Optional[Search] = None) -> List[List[Any]]:
+        """Find the values of some fields of the records in a table which
+        satisfy a query, without copying the records, e.g. to export a table
+        for analysis.
+
+        Takes two arguments, and one optional argument:
+        - record_type: The table to search.
+        - fields: The fields to find the values of.
+        - query: A Query, or a predicate function. If None, every record in
+          the table is read.
+
+        Returns a list of values for each field, in the order of the fields,
+        with a value for each matching record in the same order.
+
+        """
+
+        if query is None:
+            plan = Plan(record_type, AccessPath.SCAN,
+                        estimate=self._table_size(record_type))
+        else:
+            plan = self.explain(record_type, query)
+
+        with self._reading() as snapshot:
+            records = [r for _, _, r in self._matching(plan, snapshot)]
+
+        # Versions are never changed once written, so the records can be
+        # read after the snapshot is released.
+        return [[r[field] for r in records] for field in fields]
+
+    def find(self,
+             record_type: str,
+             query: Search) -> Iterator[StorageRecord]:
+        """Find the records in a table which satisfy a query.
+
+        Takes two arguments:
+        - record_type: The table to search.
+        - query: A Query, or a predicate function. Predicate functions can
+          only be answered by scanning the table.
+
+        Returns an iterator of matching records.
+
+        """
+
+        plan = self.explain(record_type, query)
+
+        if self._snapshot is not None:
+            return self._execute(plan, self._snapshot)
+
+        # Without a transaction there is no snapshot to keep the versions
+        # being read alive, so read everything while holding one.
+        with self._reading() as snapshot:
+            return iter(list(self._execute(plan, snapshot)))
+
+    def find_ordered(self,
+                     record_type: str,
+                     field: str,
+                     value: Any,
+                     order: str,
+                     before: Optional[OrderedEntry] = None,
+                     limit: Optional[int] = None,
+                     query: Optional[Search] = None) -> List[OrderedEntry]:
+        """Find the records in a table with a particular value for a field,
+        in descending order of another field and then of their keys, using
+        an ordered index on the two fields. Only the entries of the index
+        which are needed are read, so this is suited to paging through the
+        records from where the last page ended.
+
+        Takes four arguments, and three optional arguments:
+        - record_type: The table to search.
+        - field: The field to match the value of.
+        - value: The value.
+        - order: The field to order the records by.
+        - before: The (order, key) entry to start below, e.g. the last one
+          found by a previous call. If None, start from the highest.
+        - limit: The most records to find, or None for no limit.
+        - query: A Query, or a predicate function, which the records must
+          also satisfy. The records are read in order until enough of them
+          do.
+
+        Returns a list of (order, key) entries.
 
-        return (copy.deepcopy(r)
-                for r in {**existing_records, **changed_records}.values()
-                if predicate(r))
+        """
+
+        residual: Optional[Query] = None
+        if query is not None:
+            residual = query if isinstance(query, Query) else \
+                Predicate(query)
+
+        # The session's own writes are few, so they are searched directly.
+        changed: Table = {}
+        if self._changed is not None:
+            changed = self._changed.get(record_type, {})
+        own = sorted(
+            (entry for entry in ((r[order], key)
+                                 for key, r in changed.items()
+                                 if r is not None and r[field] == value)
+             if before is None or entry < before),
+            reverse=True,
+        )
+
+        found: List[OrderedEntry] = []
+        with self._reading() as snapshot:
+            entries = heapq.merge(
+                own,
+                self._store._ordered_entries(record_type, field, value,
+                                             order, before),
+                reverse=True,
+            )
+
+            previous = None
+            for entry in entries:
+                if limit is not None and len(found) >= limit:
+                    break
+
+                # The same entry may be in the session, the store and the
+                # base.
+                if entry == previous:
+                    continue
+                previous = entry
+
+                try:
+                    record = self._current(record_type, entry[1], snapshot)
+                except NotFound:
+                    continue
+
+                # The entry may be for another version of the record.
+                if record[field] != value or record[order] != entry[0]:
+                    continue
+                if residual is not None and not residual.matches(record):
+                    continue
+
+                found.append(entry)
+
+        return found
+
+    def lookup(self,
+               record_type: str,
+               field: str,
+               value: Any) -> Iterator[StorageRecord]:
+        """Find the records in a table with a particular value for a field.
+        This is a shortcut for finding with an Eq query.
+
+        """
+
+        return self.find(record_type, Eq(field, value))
+
+    def _write(self,
+               record_type: str,
+               key: UUID,
+               record: StorageRecord) -> None:
+        self.writes += 1
+
+        record = self._store._take(record)
+        if self._changed is not None:
+            _put(self._changed, self._changed_indexes, record_type, key,
+                 record)
+        else:
+            self._store._commit({record_type: {key: record}}, None)
 
     def add(self,
             record_type: str,
             key: UUID,
             record: StorageRecord) -> None:
-        record = copy.deepcopy(record)
-        if self._changed is not None:
-            self._changed.setdefault(record_type, {})[key] = record
-        else:
-            self._records.setdefault(record_type, {})[key] = record
+        self._write(record_type, key, record)
 
     def update(self,
                record_type: str,
                key: UUID,
                record: StorageRecord) -> None:
-        record = copy.deepcopy(record)
+        self._write(record_type, key, record)
+
+    def delete(self, record_type: str, key: UUID) -> None:
+        """Delete a record. Snapshots taken before the deletion is committed
+        can still read it. Deleting a record which does not exist does
+        nothing.
+
+        """
+
+        self.writes += 1
+
         if self._changed is not None:
-            self._changed.setdefault(record_type, {})[key] = record
+            _put(self._changed, self._changed_indexes, record_type, key,
+                 None)
         else:
-            self._records.setdefault(record_type, {})[key] = record
+            self._store._commit({record_type: {key: None}}, None)
+
+    @contextmanager
+    def bulk_load(self, batch_size: int = 100000) -> Iterator[BulkLoad]:
+        """Write a large number of records as a single commit, for loading
+        data into the store. Records are added to the BulkLoad this yields:
+
+        >>> with store.bulk_load() as load:
+        ...     load.add_many('transaction', records)
+        >>> load.report
+        LoadReport(rows=..., seconds=...)
+
+        The records are taken as they are, without being copied, so the
+        caller must not keep references to them. The records are staged
+        until the load finishes, and are then written into the tables and
+        secondary indexes at once, only becoming visible then. Other commits
+        and new snapshots only wait for that last step, so the records may
+        be produced by reading the store, e.g. to resolve foreign keys. If
+        the load raises an exception, nothing is committed. It cannot be
+        used during a transaction.
+
+        In RecordMode.FROZEN the records are frozen like any others, so a
+        record holding a mutable value raises TypeError.
+
+        Takes one optional argument:
+        - batch_size: The number of records to write to the log in each
+          entry, if the store has one.
+
+        """
+
+        if self._changed is not None:
+            raise RuntimeError('Cannot bulk load during a transaction.')
+
+        with self._store._bulk_load(batch_size) as load:
+            yield load
+
+        self.writes += load.rows
+
+    def lock(self, keys: Iterable[Hashable]) -> None:
+        """Lock a number of keys until the transaction ends, before reading
+        the records they cover. Does nothing outside of a transaction, or if
+        the session has no LockTable.
+
+        Once new keys are locked, the session's snapshot moves forward to
+        the latest commit, so it reads the latest versions of the locked
+        records and no other session can change them before this one
+        commits. Sessions must lock all of the keys they need together
+        wherever they can, as a key which has to be locked after a later one
+        may raise WouldDeadlock, a kind of WriteConflict.
+
+        Moving the snapshot does not give up first-committer-wins: each
+        record the session writes is checked for conflicts against the
+        snapshot it last read the record at, or the one the transaction
+        began with if it has not read it since the snapshot moved. So a
+        record read before it was locked, which another session has since
+        changed, still makes the commit raise WriteConflict, and it should
+        be retried.
+
+        """
+
+        if self._locks is None or self._snapshot is None:
+            return
+
+        if self._locks.acquire(keys):
+            previous = self._snapshot
+            self._snapshot = self._store._open_snapshot()
+            self._store._close_snapshot(previous)
+            if self._read_at is None:
+                self._read_at = {}
+
+    def _release(self) -> None:
+        if self._locks is not None:
+            self._locks.release()
+
+    def _end(self) -> Optional[Store]:
+        changes = self._changed
+
+        if self._snapshot is not None:
+            self._store._close_snapshot(self._snapshot)
+
+        self._snapshot = None
+        self._began = None
+        self._read_at = None
+        self._changed = None
+        self._changed_indexes = {}
+
+        return changes
 
     def begin(self) -> None:
+        self._end()
+        self._release()
+        self._snapshot = self._store._open_snapshot()
+        self._began = self._snapshot
         self._changed = {}
 
     def rollback(self) -> None:
-        self._changed = None
+        self._end()
+        self._release()
 
     def commit(self) -> None:
-        if self._changed is not None:
-            for k, v in self._changed.items():
-                self._records.setdefault(k, {}).update(v)
+        began, read_at = self._began, self._read_at
+        changes = self._end()
 
-        self._changed = None
+        # The locks are only released once the changes are visible, so the
+        # next session to take them sees the changes.
+        try:
+            if changes:
+                self._store._commit(changes, began, read_at)
+        finally:
+            self._release()
+
+
+class LoadReport:
+    """The number of records written by a bulk load, and how long it took."""
+
+    def __init__(self, rows: int, seconds: float) -> None:
+        self.rows = rows
+        self.seconds = seconds
+
+    def __repr__(self) -> str:
+        return 'LoadReport(rows={}, seconds={:.3f})'.format(self.rows,
+                                                            self.seconds)
+
+    def __str__(self) -> str:
+        return '{} rows in {:.2f}s ({:.0f} rows/sec)'.format(
+            self.rows, self.seconds, self.rows_per_second)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+class BulkLoad:
+    """A single commit of a large number of records, created by
+    MemoryStore.bulk_load. The records are staged as they are added, without
+    holding the store's lock, and written into the store's tables all at
+    once when the load finishes.
+
+    """
+
+    def __init__(self, store: MemoryStore) -> None:
+        self._store = store
+        self._staged: Dict[str, Dict[UUID, StorageRecord]] = {}
+        # The records are taken without copying them, but in
+        # RecordMode.FROZEN their values must still be immutable.
+        self._frozen = store._record_mode == RecordMode.FROZEN
+
+        # The number of records added, and once the load has finished, how
+        # long it took.
+        self.rows = 0
+        self.report: Optional[LoadReport] = None
+
+    def add(self, record_type: str, key: UUID, record: StorageRecord) -> None:
+        if self.report is not None:
+            raise RuntimeError('The load has already finished.')
+
+        if self._frozen:
+            _check_frozen(record)
+            if type(record) is not dict:
+                record = dict(record)
+
+        staged = self._staged.get(record_type)
+        if staged is None:
+            staged = self._staged[record_type] = {}
+        # A record added again by the load replaces the earlier one.
+        staged[key] = record
+
+        self.rows += 1
+
+    def add_many(self,
+                 record_type: str,
+                 records: Iterable[StorageRecord]) -> None:
+        """Add a number of records to a table, taking their keys from the
+        store's key field.
+
+        """
+
+        key_field = self._store._key_field
+        for record in records:
+            self.add(record_type, record[key_field], record)
+
+    def _finish(self,
+                timestamp: int,
+                horizon: int,
+                batch_size: int) -> Optional[int]:
+        """Write the staged records into the store's tables, index them and
+        write them to the log in batches. The store's lock must be held.
+
+        Takes three arguments:
+        - timestamp: The timestamp of the commit.
+        - horizon: The oldest timestamp which an open snapshot may read at.
+        - batch_size: The number of records in each log entry.
+
+        Returns the LSN of the last log entry, if any were written.
+
+        """
+
+        store = self._store
+        log = store._log
+        batch: Store = {}
+        batched = 0
+        lsn = None
+        # The entries of the ordered indexes which have been added to out of
+        # order, by their IDs. They are sorted once at the end, rather than
+        # each record being inserted in order.
+        unsorted: Dict[int, List[OrderedEntry]] = {}
+
+        for record_type, records in self._staged.items():
+            table = store._tables.setdefault(record_type, {})
+            table_indexes = store._indexes.get(record_type, {})
+            table_ordered = store._ordered.get(record_type, {})
+
+            for key, record in records.items():
+                chain = table.get(key)
+                if chain is None:
+                    chain = table[key] = [(timestamp, record)]
+                else:
+                    chain.append((timestamp, record))
+                    store._prune(table, table_indexes, table_ordered, key,
+                                 horizon)
+                    chain = table[key]
+
+                _index_record(table_indexes, key, record)
+
+                for (field, order), index in table_ordered.items():
+                    value, entry = record[field], (record[order], key)
+                    # An older version may already have the entry.
+                    if len(chain) > 1 and any(
+                            r is not None and r[field] == value and
+                            r[order] == entry[0] for _, r in chain[:-1]):
+                        continue
+
+                    entries = index.setdefault(value, [])
+                    if entries and entries[-1] > entry:
+                        unsorted[id(entries)] = entries
+                    entries.append(entry)
+
+                if log is not None:
+                    batch.setdefault(record_type, {})[key] = record
+                    batched += 1
+                    if batched >= batch_size:
+                        lsn = log.append(batch)
+                        batch = {}
+                        batched = 0
+
+        if log is not None and batch:
+            lsn = log.append(batch)
+
+        for entries in unsorted.values():
+            entries.sort()
+
+        self._staged = {}
+        return lsn
+
+    def _discard(self) -> None:
+        """Drop the records which have been staged."""
+
+        self._staged = {}
+
+
+# Repositories may be given either a store or a session on one.
+Storage = Union[MemoryStore, StoreSession]
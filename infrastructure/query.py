@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+from abc import ABCMeta, abstractmethod
+from enum import auto, Enum
+from typing import Any, Callable, Iterable, List, Mapping, Optional, Tuple
+
+
+StorageRecord = Mapping[str, Any]
+
+
+class Query(metaclass=ABCMeta):
+    """A declarative description of the records to find in a table. Unlike a
+    predicate function, a query can be inspected by the store to choose an
+    index to answer it with.
+
+    Queries may be combined with & to build a conjunction.
+
+    """
+
+    @abstractmethod
+    def matches(self, record: StorageRecord) -> bool:
+        """Check whether a record satisfies this query."""
+        pass
+
+    def __and__(self, other: Query) -> And:
+        if not isinstance(other, Query):
+            return NotImplemented
+
+        return And(self, other)
+
+
+class Eq(Query):
+    """Matches records where a field is equal to a value."""
+
+    def __init__(self, field: str, value: Any) -> None:
+        self.field = field
+        self.value = value
+
+    def __repr__(self) -> str:
+        return "{} = {!r}".format(self.field, self.value)
+
+    def matches(self, record: StorageRecord) -> bool:
+        return record[self.field] == self.value
+
+
+class In(Query):
+    """Matches records where a field is equal to any of a set of values."""
+
+    def __init__(self, field: str, values: Iterable[Any]) -> None:
+        self.field = field
+        self.values = frozenset(values)
+
+    def __repr__(self) -> str:
+        return "{} IN ({} values)".format(self.field, len(self.values))
+
+    def matches(self, record: StorageRecord) -> bool:
+        return record[self.field] in self.values
+
+
+class Range(Query):
+    """Matches records where a field lies between two bounds. Both bounds are
+    inclusive and either may be omitted.
+
+    Ordered indexes group records by one field before sorting them by
+    another, so a range can only be found with one when it is on the field
+    an ordered index sorts by, and in a conjunction with an Eq or In on the
+    field it groups by. Otherwise it is applied as a filter.
+
+    """
+
+    def __init__(self, field: str, lower: Any = None,
+                 upper: Any = None) -> None:
+        if lower is None and upper is None:
+            raise ValueError('A range needs at least one bound.')
+
+        self.field = field
+        self.lower = lower
+        self.upper = upper
+
+    def __repr__(self) -> str:
+        if self.upper is None:
+            return "{} >= {!r}".format(self.field, self.lower)
+        if self.lower is None:
+            return "{} <= {!r}".format(self.field, self.upper)
+        return "{!r} <= {} <= {!r}".format(self.lower, self.field,
+                                           self.upper)
+
+    def matches(self, record: StorageRecord) -> bool:
+        value = record[self.field]
+        if self.lower is not None and value < self.lower:
+            return False
+        if self.upper is not None and value > self.upper:
+            return False
+        return True
+
+
+class And(Query):
+    """Matches records which satisfy all of a number of queries."""
+
+    def __init__(self, *queries: Query) -> None:
+        if not queries:
+            raise ValueError('A conjunction needs at least one query.')
+
+        # Flatten nested conjunctions so the planner sees every term.
+        flattened: List[Query] = []
+        for q in queries:
+            if isinstance(q, And):
+                flattened.extend(q.queries)
+            else:
+                flattened.append(q)
+
+        self.queries: Tuple[Query, ...] = tuple(flattened)
+
+    def __repr__(self) -> str:
+        return " AND ".join("({!r})".format(q) for q in self.queries)
+
+    def matches(self, record: StorageRecord) -> bool:
+        return all(q.matches(record) for q in self.queries)
+
+
+class Predicate(Query):
+    """Wraps an opaque predicate function. The store can only ever answer
+    these by scanning.
+
+    """
+
+    def __init__(self, function: Callable[[StorageRecord], bool]) -> None:
+        self.function = function
+
+    def __repr__(self) -> str:
+        return "{}(...)".format(getattr(self.function, '__name__',
+                                        'predicate'))
+
+    def matches(self, record: StorageRecord) -> bool:
+        return self.function(record)
+
+
+class AccessPath(Enum):
+    """An enum representing the ways a store can find records."""
+
+    # Look at every record in the table.
+    SCAN = auto()
+    # Fetch records directly by their keys.
+    KEY_LOOKUP = auto()
+    # Find the keys of the records using a secondary index.
+    INDEX_LOOKUP = auto()
+    # Find the keys of the records in a range using an ordered index.
+    RANGE_LOOKUP = auto()
+
+
+class Plan:
+    """The access path chosen by the store to answer a query. Its string form
+    is intended for humans.
+
+    """
+
+    def __init__(self,
+                 record_type: str,
+                 access: AccessPath,
+                 field: Optional[str] = None,
+                 values: Iterable[Any] = (),
+                 residual: Optional[Query] = None,
+                 estimate: int = 0,
+                 bounds: Optional[Range] = None) -> None:
+        self.record_type = record_type
+        self.access = access
+        self.field = field
+        self.values = frozenset(values)
+        self.residual = residual
+        self.estimate = estimate
+        # For a range lookup, the range of the field the ordered index sorts
+        # by. It is also kept in the residual, as the index covers older
+        # versions of the records.
+        self.bounds = bounds
+
+    def __repr__(self) -> str:
+        if self.access == AccessPath.SCAN:
+            description = "Scan {}".format(self.record_type)
+        else:
+            description = "{} {}.{} ({} values)".format(
+                ''.join(w.capitalize() for w in self.access.name.split('_')),
+                self.record_type, self.field, len(self.values),
+            )
+            if self.bounds is not None:
+                description += " by {!r}".format(self.bounds)
+
+        description += " ~{} rows".format(self.estimate)
+
+        if self.residual is not None:
+            description += " -> Filter {!r}".format(self.residual)
+
+        return description
@@ -0,0 +1,323 @@
+from __future__ import annotations
+
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    FrozenSet,
+    List,
+    Optional,
+    Set,
+)
+from uuid import UUID
+
+from account import (
+    AccountTransferService,
+    AUD,
+    CardNumber,
+    CardPurchaseService,
+)
+
+from .memory_repository import InMemoryRepository
+from .unit_of_work import RepositoryFactory, UnitOfWork, WorkManager
+
+
+class _Operation:
+    """An operation waiting to be run, with the accounts it changes."""
+
+    __slots__ = ('accounts', 'work', 'future', 'submitted')
+
+    def __init__(self, accounts: FrozenSet[UUID],
+                 work: Callable[[UnitOfWork], None]) -> None:
+        self.accounts = accounts
+        self.work = work
+        self.future: Future = Future()
+        self.submitted = time.perf_counter()
+
+
+class SchedulerStats:
+    """A snapshot of how a TransferScheduler has been doing, to tune it with.
+    The wave sizes and latencies are those of the most recent waves and
+    operations, up to the scheduler's history.
+
+    """
+
+    def __init__(self, queue_depth: int, operations: int, waves: int,
+                 wave_sizes: List[int], latencies: List[float]) -> None:
+        # The number of operations waiting to be run.
+        self.queue_depth = queue_depth
+        # The number of operations and waves run.
+        self.operations = operations
+        self.waves = waves
+        # The number of operations in each wave.
+        self.wave_sizes = wave_sizes
+        # The seconds from submitting each operation to it finishing.
+        self.latencies = latencies
+
+    def __repr__(self) -> str:
+        return ('SchedulerStats(queue_depth={}, operations={}, waves={}, '
+                'mean_wave_size={:.1f}, p50={:.3f}s, p99={:.3f}s)'
+                .format(self.queue_depth, self.operations, self.waves,
+                        self.mean_wave_size, self.latency(50),
+                        self.latency(99)))
+
+    @property
+    def mean_wave_size(self) -> float:
+        return statistics.mean(self.wave_sizes) if self.wave_sizes else 0.0
+
+    @property
+    def max_wave_size(self) -> int:
+        return max(self.wave_sizes, default=0)
+
+    def latency(self, percentile: float) -> float:
+        """Find a percentile of the latencies, in seconds."""
+
+        if not self.latencies:
+            return 0.0
+
+        ordered = sorted(self.latencies)
+        i = round(percentile / 100 * (len(ordered) - 1))
+        return ordered[min(max(i, 0), len(ordered) - 1)]
+
+
+class TransferScheduler:
+    """A queue in front of AccountTransferService and CardPurchaseService
+    which runs operations that do not touch the same accounts at the same
+    time.
+
+    Operations are submitted with transfer and purchase, which return a
+    Future for the outcome. A dispatcher thread takes waves of operations
+    from the queue, in the order they were submitted, which do not share any
+    accounts with each other. The operations in a wave each run in their own
+    unit of work on a pool of threads, so they cannot conflict, and the next
+    wave starts once they have all finished. An operation is not put in a
+    wave ahead of an earlier operation on one of the same accounts, so the
+    operations on each account run in the order they were submitted.
+
+    The scheduler can be used as a context manager, which drains the queue
+    and stops the threads on exit.
+
+    Takes one argument, and four optional arguments:
+    - work_manager: The WorkManager to run the operations with.
+    - repository_factory: The repository for the services to use.
+    - workers: The number of threads to run each wave with.
+    - max_wave: The most operations to put in one wave.
+    - history: The number of wave sizes and latencies to keep for stats.
+
+    """
+
+    def __init__(self, work_manager: WorkManager,
+                 repository_factory: RepositoryFactory = InMemoryRepository,
+                 workers: int = 8,
+                 max_wave: int = 1000,
+                 history: int = 10000) -> None:
+        self._work_manager = work_manager
+        self._repository_factory = repository_factory
+        self.max_wave = max_wave
+
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._queue: Deque[_Operation] = deque()
+        # Guards the queue and the stats, and is notified when operations are
+        # submitted or a wave finishes.
+        self._condition = threading.Condition()
+        self._running = False
+        self._stopping = False
+
+        # The IDs of the accounts of each card number seen so far, which
+        # never change.
+        self._card_accounts: Dict[CardNumber, UUID] = {}
+
+        self._operations = 0
+        self._waves = 0
+        self._wave_sizes: Deque[int] = deque(maxlen=history)
+        self._latencies: Deque[float] = deque(maxlen=history)
+
+        self._dispatcher = threading.Thread(target=self._dispatch,
+                                            daemon=True)
+        self._dispatcher.start()
+
+    def __enter__(self) -> TransferScheduler:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _submit(self, accounts: FrozenSet[UUID],
+                work: Callable[[UnitOfWork], None]) -> Future:
+        operation = _Operation(accounts, work)
+        with self._condition:
+            if self._stopping:
+                raise RuntimeError('The scheduler has been closed.')
+
+            self._queue.append(operation)
+            self._condition.notify_all()
+
+        return operation.future
+
+    def transfer(self, source: UUID, destination: UUID,
+                 amount: AUD) -> Future:
+        """Queue a transfer. See AccountTransferService.transfer.
+
+        Returns a Future which is done once the transfer has been made.
+
+        """
+
+        def work(unit: UnitOfWork) -> None:
+            service = AccountTransferService(
+                unit.get(self._repository_factory),
+            )
+            service.transfer(source, destination, amount)
+
+        return self._submit(frozenset((source, destination)), work)
+
+    def purchase(self, card_number: CardNumber, merchant: UUID,
+                 amount: AUD, reference: UUID) -> Future:
+        """Queue a purchase. See CardPurchaseService.make_purchase.
+
+        Returns a Future which is done once the purchase has been recorded,
+        or has failed, e.g. because the card could not be found.
+
+        """
+
+        try:
+            account = self._card_account(card_number)
+        except Exception as e:
+            # The card is looked up to find the account to schedule the
+            # purchase by, but a failure is still reported through the
+            # Future, like any other failure of the purchase.
+            future: Future = Future()
+            future.set_exception(e)
+            return future
+
+        def work(unit: UnitOfWork) -> None:
+            service = CardPurchaseService(unit.get(self._repository_factory))
+            service.make_purchase(card_number, merchant, amount, reference)
+
+        return self._submit(frozenset((account, merchant)), work)
+
+    def _card_account(self, card_number: CardNumber) -> UUID:
+        try:
+            return self._card_accounts[card_number]
+        except KeyError:
+            pass
+
+        with self._work_manager.scope() as unit:
+            repository: Any = unit.get(self._repository_factory)
+            account = repository.find_id_by_card_number(card_number)
+
+        self._card_accounts[card_number] = account
+        return account
+
+    def _next_wave(self) -> List[_Operation]:
+        """Take the next wave of operations from the queue. Must be called
+        holding the condition.
+
+        """
+
+        wave: List[_Operation] = []
+        waiting: Deque[_Operation] = deque()
+        # The accounts of the operations in the wave, and of those left in
+        # the queue, which later operations must not overtake.
+        taken: Set[UUID] = set()
+        blocked: Set[UUID] = set()
+
+        queue = self._queue
+        while queue and len(wave) < self.max_wave:
+            operation = queue.popleft()
+            if operation.accounts.isdisjoint(taken) and \
+                    operation.accounts.isdisjoint(blocked):
+                wave.append(operation)
+                taken.update(operation.accounts)
+            else:
+                waiting.append(operation)
+                blocked.update(operation.accounts)
+
+        waiting.extend(queue)
+        self._queue = waiting
+
+        return wave
+
+    def _run(self, operation: _Operation) -> None:
+        try:
+            self._work_manager.run(operation.work)
+        except Exception as e:
+            operation.future.set_exception(e)
+        else:
+            operation.future.set_result(None)
+
+        latency = time.perf_counter() - operation.submitted
+        with self._condition:
+            self._latencies.append(latency)
+
+    def _run_wave(self) -> int:
+        """Run the next wave of operations, waiting for it to finish.
+
+        Returns the number of operations in the wave.
+
+        """
+
+        with self._condition:
+            wave = self._next_wave()
+            self._running = bool(wave)
+
+        try:
+            wait([self._executor.submit(self._run, o) for o in wave])
+        finally:
+            with self._condition:
+                self._running = False
+                if wave:
+                    self._operations += len(wave)
+                    self._waves += 1
+                    self._wave_sizes.append(len(wave))
+                self._condition.notify_all()
+
+        return len(wave)
+
+    def _dispatch(self) -> None:
+        while True:
+            with self._condition:
+                while not self._queue and not self._stopping:
+                    self._condition.wait()
+
+                if not self._queue:
+                    return
+
+            self._run_wave()
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every operation submitted so far has finished.
+
+        Returns False if the timeout expired first.
+
+        """
+
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._queue and not self._running, timeout,
+            )
+
+    def close(self) -> None:
+        """Run the operations left in the queue, then stop the threads."""
+
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+
+        self._dispatcher.join()
+        self._executor.shutdown()
+
+    def stats(self) -> SchedulerStats:
+        with self._condition:
+            return SchedulerStats(
+                queue_depth=len(self._queue),
+                operations=self._operations,
+                waves=self._waves,
+                wave_sizes=list(self._wave_sizes),
+                latencies=list(self._latencies),
+            )
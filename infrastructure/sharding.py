@@ -0,0 +1,557 @@
+from __future__ import annotations
+
+import itertools
+import multiprocessing
+from multiprocessing.connection import Connection
+from typing import (
+    Any,
+    cast,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+from uuid import UUID, uuid4
+
+from account import Account, AUD, CardNumber
+from account.services import (
+    _check_transfer,
+    TransferLeg,
+    TransferResults,
+)
+
+from .memory_repository import (
+    ACCOUNT_MODEL,
+    InMemoryRepository,
+    SUBACCOUNT_MODEL,
+)
+from .memory_store import MemoryStore, RecordMode, WriteConflict
+from .query import Eq
+from .unit_of_work import UnitOfWork, WorkManager
+
+
+# A command for a shard, and its arguments.
+Request = Tuple[str, Tuple[Any, ...]]
+
+# The part of a transfer done on one shard: the index of the leg, the
+# account, the amount and the reference.
+Debit = Tuple[int, UUID, AUD, UUID]
+Credit = Tuple[UUID, AUD, UUID]
+
+
+def _repository(unit: UnitOfWork) -> InMemoryRepository:
+    return cast(InMemoryRepository, unit.get(InMemoryRepository))
+
+
+class _Transaction:
+    """The part of a distributed transaction being done by a shard."""
+
+    def __init__(self, unit: UnitOfWork) -> None:
+        # The unit of work, or None if committing it failed, which discards
+        # it.
+        self.unit: Optional[UnitOfWork] = unit
+        self.repository = _repository(unit)
+        # The accounts which have changed, by their IDs.
+        self.changed: Dict[UUID, Account] = {}
+
+
+class _Shard:
+    """The commands which a worker process carries out on its store. Each
+    command is carried out before the next is received, so a shard only
+    ever has the one distributed transaction of the coordinator open.
+
+    """
+
+    def __init__(self, record_mode: RecordMode) -> None:
+        self._store = MemoryStore(record_mode=record_mode)
+        self._work_manager = WorkManager(self._store)
+        self._transactions: Dict[int, _Transaction] = {}
+
+    def add_many(self, accounts: List[Account]) -> int:
+        return InMemoryRepository(self._store).add_many(accounts).rows
+
+    def get_many(self, ids: List[UUID]) -> Tuple[List[Account], int]:
+        """Find a number of accounts by their IDs.
+
+        Returns the accounts, and the timestamp of the snapshot they were
+        read at.
+
+        """
+
+        with self._work_manager.scope() as unit:
+            return _repository(unit).get_many(ids), self._store.timestamp
+
+    def update(self, account: Account, read_at: Optional[int]) -> int:
+        """Write the whole of an account in a unit of work.
+
+        Takes two arguments:
+        - account: The account.
+        - read_at: The timestamp of the snapshot the account was read at.
+          If its records have been committed since then, e.g. by a
+          transfer, WriteConflict is raised rather than overwriting them.
+          If None, the account is written regardless.
+
+        Returns the timestamp of the snapshot which the account is now
+        current at.
+
+        """
+
+        if read_at is not None:
+            changed = [
+                committed_at
+                for record_type, field in ((ACCOUNT_MODEL, 'id'),
+                                           (SUBACCOUNT_MODEL, 'account'))
+                for _, committed_at in self._store.find_keys(
+                    record_type, Eq(field, account.id))
+                if committed_at > read_at
+            ]
+            if changed:
+                raise WriteConflict('Account {} has been changed since it '
+                                    'was read.'.format(account.id))
+
+        with self._work_manager.scope() as unit:
+            _repository(unit).update(account)
+
+        return self._store.timestamp
+
+    def find_by_card_number(self,
+                            card_number: CardNumber) -> Tuple[Account, int]:
+        with self._work_manager.scope() as unit:
+            return (_repository(unit).find_by_card_number(card_number),
+                    self._store.timestamp)
+
+    def _transaction(self, transaction_id: int) -> _Transaction:
+        try:
+            return self._transactions[transaction_id]
+        except KeyError:
+            unit = self._work_manager.unit()
+            unit.begin()
+            self._transactions[transaction_id] = transaction = \
+                _Transaction(unit)
+            return transaction
+
+    def debit(self, transaction_id: int,
+              debits: List[Debit]) -> Dict[int, Account.InsufficientBalance]:
+        """Debit and settle the source accounts of a number of transfers,
+        skipping those without enough money.
+
+        Returns the InsufficientBalance exceptions by the index of the leg.
+
+        """
+
+        transaction = self._transaction(transaction_id)
+        accounts = dict(zip(
+            (d[1] for d in debits),
+            transaction.repository.get_many(d[1] for d in debits),
+        ))
+
+        failed: Dict[int, Account.InsufficientBalance] = {}
+        for i, source, amount, reference in debits:
+            account = accounts[source]
+            try:
+                account.debit(amount, reference)
+            except Account.InsufficientBalance as e:
+                failed[i] = e
+                continue
+
+            account.settle(reference)
+            transaction.changed[source] = account
+
+        return failed
+
+    def prepare(self, transaction_id: int, credits: List[Credit]) -> bool:
+        """Credit and settle the destination accounts of a number of
+        transfers, then write every changed account to the unit of work. This
+        is the first phase of the commit: once it returns, commit cannot
+        fail, as nothing else writes to the store until the transaction
+        ends.
+
+        """
+
+        transaction = self._transaction(transaction_id)
+        accounts = transaction.repository.get_many(c[0] for c in credits)
+
+        for account, (destination, amount, reference) in zip(accounts,
+                                                             credits):
+            account.credit(amount, reference)
+            account.settle(reference)
+            transaction.changed[destination] = account
+
+        for account in transaction.changed.values():
+            transaction.repository.update(account)
+
+        return True
+
+    def commit(self, transaction_id: int) -> None:
+        """Commit the unit of work of a transaction which every shard has
+        voted for. Committing a transaction again does nothing, so the
+        coordinator can retry commits it is not sure have been done.
+
+        If the commit fails, the transaction is kept, and retrying it writes
+        the changed accounts again in a new unit of work.
+
+        """
+
+        transaction = self._transactions.get(transaction_id)
+        if transaction is None:
+            return
+
+        unit = transaction.unit
+        if unit is None:
+            unit = self._work_manager.unit()
+            unit.begin()
+            repository = _repository(unit)
+            for account in transaction.changed.values():
+                repository.update(account)
+
+        try:
+            unit.commit()
+        except Exception:
+            transaction.unit = None
+            raise
+
+        del self._transactions[transaction_id]
+
+    def rollback(self, transaction_id: int) -> None:
+        transaction = self._transactions.pop(transaction_id, None)
+        if transaction is not None and transaction.unit is not None:
+            transaction.unit.rollback()
+
+
+def _serve(connection: Connection, record_mode: RecordMode) -> None:
+    """Carry out the commands sent to a worker process until it is told to
+    stop. Each result is sent back as (True, result), or (False, exception)
+    if the command raised one.
+
+    """
+
+    shard = _Shard(record_mode)
+    while True:
+        command, arguments = connection.recv()
+        if command == 'stop':
+            break
+
+        try:
+            result = getattr(shard, command)(*arguments)
+        except Exception as e:
+            connection.send((False, e))
+        else:
+            connection.send((True, result))
+
+    connection.close()
+
+
+class AccountShards:
+    """A set of worker processes which each own a MemoryStore, so that work
+    on accounts can use more than one core. Accounts are partitioned across
+    the shards by their IDs, along with their subaccounts, transactions and
+    cards, and each call is sent to the shards which own the accounts
+    involved. The shard which owns each card number is kept in a directory.
+
+    Reading and updating single accounts is done in a unit of work on the
+    owning shard. Transfers may involve two shards, so are made in a
+    distributed transaction with a two-phase commit: each shard involved
+    does its part in a unit of work, writes its changes and votes, and only
+    once every shard has voted are the units of work committed. If any
+    shard fails to vote, every unit of work is rolled back.
+
+    Once every shard has voted, the transaction is recorded as committed
+    until each shard has confirmed its commit. A shard which fails to commit
+    is sent the commit again before the next command sent to it, so it never
+    answers from before the commit. If it still fails, that command raises
+    the error, and the commit is retried again next time. Committing is
+    idempotent on the shards, so a commit is never done twice. The shards
+    keep their stores in memory and stop with this process, so the record
+    lasts exactly as long as they do.
+
+    The shards work on a call in parallel wherever it involves more than
+    one, so batches of transfers made with transfer_many scale with the
+    number of workers. An AccountShards is not itself thread-safe.
+
+    It can be used as a context manager, which stops the workers on exit.
+
+    Takes one argument, and one optional argument:
+    - workers: The number of worker processes, and so of shards.
+    - record_mode: The RecordMode of each shard's store.
+
+    """
+
+    def __init__(self, workers: int,
+                 record_mode: RecordMode = RecordMode.COPY) -> None:
+        if workers < 1:
+            raise ValueError('Cannot shard accounts across less than one '
+                             'worker.')
+
+        context = multiprocessing.get_context()
+        self._connections: List[Connection] = []
+        self._processes: List[Any] = []
+        for _ in range(workers):
+            connection, child = context.Pipe()
+            process = context.Process(target=_serve,
+                                      args=(child, record_mode),
+                                      daemon=True)
+            process.start()
+            child.close()
+
+            self._connections.append(connection)
+            self._processes.append(process)
+
+        # The shard which owns each card number.
+        self._cards: Dict[CardNumber, int] = {}
+        # The timestamp of the snapshot each account was last read at on its
+        # shard, by its ID, so that update can tell whether it has changed.
+        self._read_at: Dict[UUID, int] = {}
+        self._transaction_ids = itertools.count(1)
+        # The transactions which have been committed but which a shard has
+        # not yet confirmed, in order, by the index of the shard.
+        self._unconfirmed: Dict[int, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._connections)
+
+    def __enter__(self) -> AccountShards:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def shard(self, account_id: UUID) -> int:
+        """Find the index of the shard which owns an account."""
+
+        return account_id.int % len(self._connections)
+
+    def _exchange(self, requests: Dict[int, Request]
+                  ) -> Tuple[Dict[int, Any], Dict[int, Exception]]:
+        """Send a command to each of a number of shards, so that they carry
+        them out in parallel, then wait for all of the results.
+
+        Returns the results, and the exceptions raised, by the indexes of the
+        shards.
+
+        """
+
+        for shard, request in requests.items():
+            self._connections[shard].send(request)
+
+        results: Dict[int, Any] = {}
+        errors: Dict[int, Exception] = {}
+        for shard in requests:
+            ok, result = self._connections[shard].recv()
+            if ok:
+                results[shard] = result
+            else:
+                errors[shard] = result
+
+        return results, errors
+
+    def _confirm(self, shards: Iterable[int]) -> None:
+        """Retry the commits which a number of shards have not confirmed.
+        Raises the first exception if any of them fail again.
+
+        """
+
+        pending = {s: self._unconfirmed[s] for s in shards
+                   if self._unconfirmed.get(s)}
+        while pending:
+            _, errors = self._exchange({
+                s: ('commit', (transaction_ids[0],))
+                for s, transaction_ids in pending.items()
+            })
+            if errors:
+                raise next(iter(errors.values()))
+
+            for transaction_ids in pending.values():
+                transaction_ids.pop(0)
+            pending = {s: t for s, t in pending.items() if t}
+
+    def _call(self, requests: Dict[int, Request]) -> Dict[int, Any]:
+        """Send a command to each of a number of shards, so that they carry
+        them out in parallel, then wait for all of the results. Commits which
+        the shards have not confirmed are retried first. If any of the
+        commands raised an exception, the first is raised once every result
+        has arrived.
+
+        """
+
+        self._confirm(requests)
+
+        results, errors = self._exchange(requests)
+        if errors:
+            raise next(iter(errors.values()))
+
+        return results
+
+    def add_many(self, accounts: Iterable[Account]) -> None:
+        """Add a number of new accounts, bulk loading them into their
+        shards.
+
+        """
+
+        partitions: Dict[int, List[Account]] = {}
+        for account in accounts:
+            shard = self.shard(account.id)
+            partitions.setdefault(shard, []).append(account)
+            for number in account.card_numbers:
+                self._cards[number] = shard
+
+        self._call({s: ('add_many', (a,)) for s, a in partitions.items()})
+
+    def get(self, account_id: UUID) -> Account:
+        return self.get_many([account_id])[0]
+
+    def get_many(self, ids: Iterable[UUID]) -> List[Account]:
+        """Find a number of accounts by their IDs, loading them from each
+        shard in parallel.
+
+        Returns a list of Account instances, in the same order as the IDs.
+
+        """
+
+        ids = list(ids)
+        partitions: Dict[int, List[UUID]] = {}
+        for i in ids:
+            partitions.setdefault(self.shard(i), []).append(i)
+
+        accounts: Dict[UUID, Account] = {}
+        for shard, (found, read_at) in self._call({
+                s: ('get_many', (p,)) for s, p in partitions.items()
+        }).items():
+            accounts.update(zip(partitions[shard], found))
+            for account_id in partitions[shard]:
+                self._read_at[account_id] = read_at
+
+        return [accounts[i] for i in ids]
+
+    def update(self, account: Account) -> None:
+        """Write an account to its shard. The whole account is written, as
+        the shard has not seen this instance of it before.
+
+        If the account was read through these shards, and has changed on its
+        shard since it was last read, e.g. by a transfer, WriteConflict is
+        raised, as writing it would undo the change. It must be read again
+        and the update made to that.
+
+        """
+
+        shard = self.shard(account.id)
+        self._read_at[account.id] = self._call({
+            shard: ('update', (account, self._read_at.get(account.id))),
+        })[shard]
+
+        # The account may have been given new cards.
+        for number in account.card_numbers:
+            self._cards[number] = shard
+
+    def find_by_card_number(self, card_number: CardNumber) -> Account:
+        try:
+            shard = self._cards[card_number]
+        except KeyError:
+            raise ValueError('Could not find a card record for card number {}'
+                             .format(card_number))
+
+        account, read_at = self._call({
+            shard: ('find_by_card_number', (card_number,)),
+        })[shard]
+        self._read_at[account.id] = read_at
+        return account
+
+    def transfer(self, source: UUID = None, destination: UUID = None,
+                 amount: AUD = None) -> None:
+        """Transfer money from a source account to a destination account.
+        See AccountTransferService.transfer.
+
+        """
+
+        _check_transfer(source, destination, amount)
+
+        # These have just been checked. This is for the type checker.
+        assert source is not None
+        assert destination is not None
+        assert amount is not None
+
+        error = self.transfer_many([(source, destination, amount)])[0]
+        if error is not None:
+            raise error
+
+    def transfer_many(self, legs: Iterable[TransferLeg]) -> TransferResults:
+        """Make a number of transfers at once, in a single distributed
+        transaction. See AccountTransferService.transfer_many.
+
+        The source accounts are debited on their shards first. The shards of
+        the destination accounts then credit those which were debited, and
+        every shard involved writes its changes and votes. Once all of them
+        have voted, every shard commits. As every debit is made before any
+        credit, a transfer cannot spend money credited by an earlier one in
+        the same call.
+
+        Once every shard has voted, the transfers are made, even if a shard
+        then fails to commit: its commit is retried before anything else is
+        sent to it.
+
+        """
+
+        legs = list(legs)
+        for source, destination, amount in legs:
+            _check_transfer(source, destination, amount)
+
+        transaction_id = next(self._transaction_ids)
+        references = [uuid4() for _ in legs]
+
+        debits: Dict[int, List[Debit]] = {}
+        for i, (source, _, amount) in enumerate(legs):
+            debits.setdefault(self.shard(source), []).append(
+                (i, source, amount, references[i]))
+
+        participants: Set[int] = set(debits)
+        failed: Dict[int, Account.InsufficientBalance] = {}
+        try:
+            for shard_failed in self._call({
+                    s: ('debit', (transaction_id, d))
+                    for s, d in debits.items()
+            }).values():
+                failed.update(shard_failed)
+
+            credits: Dict[int, List[Credit]] = {}
+            for i, (_, destination, amount) in enumerate(legs):
+                if i not in failed:
+                    credits.setdefault(self.shard(destination), []).append(
+                        (destination, amount, references[i]))
+            participants.update(credits)
+
+            # The first phase. A shard which raises votes to abort.
+            self._call({
+                s: ('prepare', (transaction_id, credits.get(s, [])))
+                for s in participants
+            })
+        except Exception:
+            # The rollbacks are sent even to shards with commits to retry,
+            # which may be why this failed.
+            self._exchange({s: ('rollback', (transaction_id,))
+                            for s in participants})
+            raise
+
+        # The second phase. The decision is recorded first, so that shards
+        # which fail to commit are sent it again later.
+        for s in participants:
+            self._unconfirmed.setdefault(s, []).append(transaction_id)
+        committed, _ = self._exchange({s: ('commit', (transaction_id,))
+                                       for s in participants})
+        for s in committed:
+            self._unconfirmed[s].remove(transaction_id)
+
+        return [failed.get(i) for i in range(len(legs))]
+
+    def close(self) -> None:
+        """Stop the worker processes. Their stores are discarded."""
+
+        for connection in self._connections:
+            connection.send(('stop', ()))
+            connection.close()
+
+        for process in self._processes:
+            process.join()
+
+        self._connections = []
+        self._processes = []
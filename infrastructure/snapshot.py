@@ -0,0 +1,452 @@
+import mmap
+import os
+import struct
+from enum import Enum
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+from uuid import UUID
+
+from account import CardNumber
+from account.transaction import TransactionStatus, TransactionType
+
+from .memory_repository import (
+    ACCOUNT_MODEL,
+    AccountType,
+    ARCHIVE_MODEL,
+    CARD_MODEL,
+    CHECKPOINT_MODEL,
+    INDEXES,
+    ORDERED_INDEXES,
+    SUBACCOUNT_MODEL,
+    SubAccountType,
+    TRANSACTION_MODEL,
+)
+from .memory_store import (
+    BaseRecords,
+    MemoryStore,
+    OrderedEntry,
+    StorageRecord,
+)
+
+
+# A snapshot file consists of a header, a directory of sections and then the
+# sections themselves. Every table has a section of fixed-width rows sorted by
+# their key, and every field in INDEXES has a section of (value, row number)
+# entries sorted by value. Both are binary searched in place, so only the
+# pages which are touched are ever read from disk. Every pair of fields in
+# ORDERED_INDEXES has a section named "field:order" of (value, order, key)
+# entries, sorted so that the records with a value are in order.
+MAGIC = b'BANKSNAP'
+# Version 3 added the checkpoint and archive tables written by compaction,
+# and the sequence of each transaction and its ordered index.
+VERSION = 3
+
+HEADER = struct.Struct('<8sHI')
+# Table name, field name (empty for the rows), offset and number of entries.
+DIRECTORY_ENTRY = struct.Struct('<32s16sQQ')
+ROW_NUMBER = 'I'
+# The order of an entry of an ordered index, big-endian and offset so that
+# its bytes sort in the same order as the signed integer.
+ORDER = struct.Struct('>Q')
+ORDER_OFFSET = 2 ** 63
+
+NULL_UUID = bytes(16)
+
+
+class InvalidSnapshot(Exception):
+    """Raised when opening a file which is not a snapshot."""
+    pass
+
+
+class Column:
+    """A fixed-width column of a table in a snapshot."""
+
+    def __init__(self,
+                 name: str,
+                 format: str,
+                 encode: Callable[[Any], Any],
+                 decode: Callable[[Any], Any]) -> None:
+        self.name = name
+        self.format = format
+        self.encode = encode
+        self.decode = decode
+
+
+def _uuid_column(name: str) -> Column:
+    return Column(name, '16s', lambda v: v.bytes, lambda b: UUID(bytes=b))
+
+
+def _optional_uuid_column(name: str) -> Column:
+    # None is stored as the nil UUID.
+    return Column(name, '16s',
+                  lambda v: NULL_UUID if v is None else v.bytes,
+                  lambda b: None if b == NULL_UUID else UUID(bytes=b))
+
+
+def _enum_column(name: str, enum_type: Type[Enum]) -> Column:
+    return Column(name, 'B', lambda v: v.value, enum_type)
+
+
+def _integer_column(name: str) -> Column:
+    return Column(name, 'q', lambda v: v, lambda v: v)
+
+
+def _cents_column(name: str) -> Column:
+    # Amounts are already stored as whole numbers of cents.
+    return _integer_column(name)
+
+
+def _card_number_column(name: str) -> Column:
+    # Card numbers are stored as ASCII digits, padded with NUL bytes.
+    return Column(name, '20s',
+                  lambda v: v.value.encode('ascii'),
+                  lambda b: CardNumber(b.rstrip(b'\0').decode('ascii')))
+
+
+class Layout:
+    """The layout of the rows of a table in a snapshot. The first column must
+    be the key.
+
+    """
+
+    def __init__(self, columns: Sequence[Column]) -> None:
+        self.columns = tuple(columns)
+        self.row = struct.Struct('<' + ''.join(c.format for c in columns))
+        self._columns = {c.name: c for c in columns}
+
+    def encode(self, record: StorageRecord) -> bytes:
+        return self.row.pack(*(c.encode(record[c.name])
+                               for c in self.columns))
+
+    def decode(self, buffer: Any, offset: int) -> StorageRecord:
+        values = self.row.unpack_from(buffer, offset)
+        return {c.name: c.decode(v) for c, v in zip(self.columns, values)}
+
+    def index_entry(self, field: str) -> struct.Struct:
+        return struct.Struct('<' + self._columns[field].format + ROW_NUMBER)
+
+    def index_value(self, field: str, value: Any) -> bytes:
+        """Encode a value the same way as it is stored in an index entry."""
+
+        column = self._columns[field]
+        return struct.pack('<' + column.format, column.encode(value))
+
+
+LAYOUTS: Dict[str, Layout] = {
+    ACCOUNT_MODEL: Layout((
+        _uuid_column('id'),
+        _optional_uuid_column('owner'),
+        _enum_column('type', AccountType),
+    )),
+    SUBACCOUNT_MODEL: Layout((
+        _uuid_column('id'),
+        _uuid_column('account'),
+        _enum_column('type', SubAccountType),
+        _cents_column('available'),
+        _cents_column('pending'),
+    )),
+    TRANSACTION_MODEL: Layout((
+        _uuid_column('id'),
+        _uuid_column('reference'),
+        _cents_column('amount'),
+        _enum_column('type', TransactionType),
+        _uuid_column('account'),
+        _enum_column('status', TransactionStatus),
+        _integer_column('sequence'),
+    )),
+    CARD_MODEL: Layout((
+        _uuid_column('id'),
+        _card_number_column('number'),
+        _uuid_column('account'),
+    )),
+    CHECKPOINT_MODEL: Layout((
+        _uuid_column('id'),
+        _cents_column('available'),
+        _cents_column('pending'),
+        _integer_column('count'),
+        _uuid_column('last'),
+    )),
+    ARCHIVE_MODEL: Layout((
+        _uuid_column('id'),
+        _uuid_column('reference'),
+        _cents_column('amount'),
+        _enum_column('type', TransactionType),
+        _uuid_column('account'),
+        _enum_column('status', TransactionStatus),
+        _integer_column('sequence'),
+    )),
+}
+
+
+def _name(value: str, width: int = 16) -> bytes:
+    encoded = value.encode('ascii')
+    if len(encoded) > width:
+        raise ValueError('Name {!r} is too long for a snapshot.'
+                         .format(value))
+    return encoded
+
+
+def write_snapshot(store: MemoryStore, path: str) -> None:
+    """Write the committed records of the tables in LAYOUTS, i.e. the
+    accounts, subaccounts, transactions and cards, and the checkpoints and
+    archive written by compaction, to a snapshot file. The records are all read
+    from the same snapshot of the store.
+
+    Takes two arguments:
+    - store: The store to write.
+    - path: Where to write the snapshot. The file is replaced atomically.
+
+    """
+
+    session = store.session()
+    session.begin()
+    try:
+        # Each section is its table and field names, its data and the number
+        # of entries in it.
+        sections: List[Tuple[bytes, bytes, bytes, int]] = []
+        for record_type, layout in LAYOUTS.items():
+            records = list(session.find(record_type, lambda r: True))
+            records.sort(key=lambda r: r['id'].bytes)
+
+            sections.append((
+                _name(record_type, 32), b'',
+                b''.join(layout.encode(r) for r in records),
+                len(records),
+            ))
+
+            for index_type, field in INDEXES:
+                if index_type != record_type:
+                    continue
+
+                entry = layout.index_entry(field)
+                entries = sorted(
+                    (layout.index_value(field, r[field]), i)
+                    for i, r in enumerate(records)
+                )
+                sections.append((
+                    _name(record_type, 32), _name(field),
+                    b''.join(entry.pack(v, i) for v, i in entries),
+                    len(entries),
+                ))
+
+            for index_type, field, order in ORDERED_INDEXES:
+                if index_type != record_type:
+                    continue
+
+                ordered = sorted(
+                    layout.index_value(field, r[field]) +
+                    ORDER.pack(r[order] + ORDER_OFFSET) + r['id'].bytes
+                    for r in records
+                )
+                sections.append((
+                    _name(record_type, 32),
+                    _name('{}:{}'.format(field, order)),
+                    b''.join(ordered),
+                    len(ordered),
+                ))
+    finally:
+        session.rollback()
+
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(sections)))
+
+        offset = HEADER.size + DIRECTORY_ENTRY.size * len(sections)
+        for record_type_name, field_name, data, count in sections:
+            f.write(DIRECTORY_ENTRY.pack(record_type_name, field_name, offset,
+                                         count))
+            offset += len(data)
+
+        for _, _, data, _ in sections:
+            f.write(data)
+
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(temporary_path, path)
+
+
+class MappedSnapshot(BaseRecords):
+    """A snapshot file, memory-mapped so that records are only read from disk
+    when they are asked for. It can be used as the base of a MemoryStore:
+
+    >>> store = MemoryStore(base=MappedSnapshot(path))
+
+    Takes one argument:
+    - path: The path of a file written by write_snapshot.
+
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(path, 'rb') as f:
+            # An empty file cannot be mapped, but is not a snapshot anyway.
+            if os.fstat(f.fileno()).st_size < HEADER.size:
+                raise InvalidSnapshot('{} is too short to be a snapshot.'
+                                      .format(path))
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise InvalidSnapshot('{} is not a snapshot.'.format(path))
+        # Older snapshots have no checkpoints, so the accounts in them would
+        # be missing the transactions which were compacted.
+        if version != VERSION:
+            raise InvalidSnapshot('{} is a version {} snapshot, but only '
+                                  'version {} can be read.'
+                                  .format(path, version, VERSION))
+
+        # The offset and number of rows of each table, and of each index.
+        self._rows: Dict[str, Tuple[int, int]] = {}
+        self._indexes: Dict[Tuple[str, str], Tuple[int, int]] = {}
+        self._ordered: Dict[Tuple[str, str, str], Tuple[int, int]] = {}
+
+        for i in range(count):
+            record_type_name, field_name, offset, entries = \
+                DIRECTORY_ENTRY.unpack_from(self._map,
+                                            HEADER.size +
+                                            i * DIRECTORY_ENTRY.size)
+            record_type = record_type_name.rstrip(b'\0').decode('ascii')
+            field = field_name.rstrip(b'\0').decode('ascii')
+
+            if ':' in field:
+                field, order = field.split(':')
+                self._ordered[(record_type, field, order)] = (offset,
+                                                              entries)
+            elif field:
+                self._indexes[(record_type, field)] = (offset, entries)
+            else:
+                self._rows[record_type] = (offset, entries)
+
+    def close(self) -> None:
+        self._map.close()
+
+    def record_types(self) -> Iterable[str]:
+        return list(self._rows)
+
+    def size(self, record_type: str) -> int:
+        return self._rows.get(record_type, (0, 0))[1]
+
+    def _row(self, record_type: str, row: int) -> StorageRecord:
+        layout = LAYOUTS[record_type]
+        offset = self._rows[record_type][0]
+        return layout.decode(self._map, offset + row * layout.row.size)
+
+    def _search(self,
+                offset: int,
+                count: int,
+                width: int,
+                value: bytes) -> int:
+        """Find the first entry in a sorted section which starts with a value
+        no smaller than the one given.
+
+        """
+
+        length = len(value)
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            start = offset + middle * width
+            if self._map[start:start + length] < value:
+                low = middle + 1
+            else:
+                high = middle
+
+        return low
+
+    def get(self, record_type: str, key: UUID) -> Optional[StorageRecord]:
+        try:
+            offset, count = self._rows[record_type]
+        except KeyError:
+            return None
+
+        width = LAYOUTS[record_type].row.size
+        value = key.bytes
+        row = self._search(offset, count, width, value)
+
+        start = offset + row * width
+        if row == count or self._map[start:start + len(value)] != value:
+            return None
+
+        return self._row(record_type, row)
+
+    def scan(self, record_type: str) -> Iterator[Tuple[UUID, StorageRecord]]:
+        for row in range(self.size(record_type)):
+            record = self._row(record_type, row)
+            yield record['id'], record
+
+    def has_index(self, record_type: str, field: str) -> bool:
+        return (record_type, field) in self._indexes
+
+    def _rows_for(self,
+                  record_type: str,
+                  field: str,
+                  value: Any) -> Iterator[int]:
+        offset, count = self._indexes[(record_type, field)]
+        layout = LAYOUTS[record_type]
+        entry = layout.index_entry(field)
+        encoded = layout.index_value(field, value)
+
+        position = self._search(offset, count, entry.size, encoded)
+        while position < count:
+            found, row = entry.unpack_from(self._map,
+                                           offset + position * entry.size)
+            if found != encoded:
+                return
+            yield row
+            position += 1
+
+    def keys(self, record_type: str, field: str, value: Any) -> List[UUID]:
+        offset = self._rows[record_type][0]
+        width = LAYOUTS[record_type].row.size
+
+        return [UUID(bytes=self._map[offset + row * width:
+                                     offset + row * width + 16])
+                for row in self._rows_for(record_type, field, value)]
+
+    def ordered(self,
+                record_type: str,
+                field: str,
+                value: Any,
+                order: str,
+                before: Optional[OrderedEntry] = None
+                ) -> Iterator[OrderedEntry]:
+        try:
+            offset, count = self._ordered[(record_type, field, order)]
+        except KeyError:
+            yield from super().ordered(record_type, field, value, order,
+                                       before)
+            return
+
+        group = LAYOUTS[record_type].index_value(field, value)
+        width = len(group) + ORDER.size + 16
+
+        # Walk backwards from the first entry at or after the one to start
+        # below, or after the last entry for the value.
+        if before is None:
+            start = group + b'\xff' * (ORDER.size + 16)
+        else:
+            start = group + ORDER.pack(before[0] + ORDER_OFFSET) + \
+                before[1].bytes
+        position = self._search(offset, count, width, start)
+
+        while position > 0:
+            position -= 1
+            entry = offset + position * width
+            if self._map[entry:entry + len(group)] != group:
+                return
+
+            entry += len(group)
+            order_value, = ORDER.unpack_from(self._map, entry)
+            yield (order_value - ORDER_OFFSET,
+                   UUID(bytes=self._map[entry + ORDER.size:
+                                        entry + ORDER.size + 16]))
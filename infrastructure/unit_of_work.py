@@ -1,13 +1,26 @@
 
-from contextlib import contextmanager
-from typing import Callable, Dict, Iterator
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    Optional,
+    TypeVar,
+)
 
-from account import Repository
+from account import AsyncRepository, Repository
 
-from .memory_store import MemoryStore
+from .locking import LockTable
+from .memory_store import MemoryStore, StoreSession, WriteConflict
 
 
-RepositoryFactory = Callable[[MemoryStore], Repository]
+RepositoryFactory = Callable[[StoreSession], Repository]
+AsyncRepositoryFactory = Callable[[StoreSession], AsyncRepository]
+
+T = TypeVar('T')
 
 
 class UnitOfWork:
@@ -18,11 +31,20 @@ class UnitOfWork:
     A UnitOfWork instance is only intended to be used for the duration of a
     single unit of work. Generally it will be used via the WorkManager class.
 
+    Each unit of work has its own session on the store, so any number of them
+    may be in progress at once. If another unit of work commits changes to
+    the same records first, commit raises WriteConflict.
+
+    If it is given a LockTable, the repositories lock the aggregates they
+    load until the unit of work ends, so units of work which change the same
+    aggregates take turns instead.
+
     """
 
-    def __init__(self, store):
+    def __init__(self, store: MemoryStore,
+                 locks: Optional[LockTable] = None):
         self._factories: Dict[RepositoryFactory, Repository] = {}
-        self._store: MemoryStore = store
+        self._store: StoreSession = store.session(locks)
 
     def get(self, factory: RepositoryFactory) -> Repository:
         try:
@@ -31,6 +53,15 @@ class UnitOfWork:
             self._factories[factory] = repo = factory(self._store)
             return repo
 
+    @property
+    def writes(self) -> int:
+        """The number of records written to the store by this unit of
+        work.
+
+        """
+
+        return self._store.writes
+
     def begin(self) -> None:
         self._store.begin()
 
@@ -56,17 +87,51 @@ class WorkManager:
     >>> with manager.scope() as SCOPE:
     >>>     ...
 
+    To run units of work from several threads, give every manager which
+    works on the store the same LockTable. Units of work which load the same
+    aggregates then run one after the other, while the rest run in
+    parallel. A unit of work which has to lock an aggregate out of order, or
+    which changes records it read before another unit of work changed them,
+    may still raise WriteConflict, so should be retried, e.g. with run.
+
+    Takes one optional argument:
+    - locks: A LockTable to lock the aggregates each unit of work loads.
+
     """
 
-    def __init__(self, store):
+    def __init__(self, store, locks: Optional[LockTable] = None):
         self._store = store
+        self._locks = locks
 
     def unit(self) -> UnitOfWork:
-        return UnitOfWork(self._store)
+        return UnitOfWork(self._store, self._locks)
+
+    def run(self, work: Callable[[UnitOfWork], T], attempts: int = 10) -> T:
+        """Do some work in a scope, trying it again in a new scope if it
+        raises WriteConflict.
+
+        Takes two arguments:
+        - work: A function which takes the unit of work to do the work in.
+        - attempts: The number of times to try before giving up and raising
+          the last WriteConflict.
+
+        Returns the result of the work.
+
+        """
+
+        for attempt in range(1, attempts + 1):
+            try:
+                with self.scope() as unit:
+                    return work(unit)
+            except WriteConflict:
+                if attempt == attempts:
+                    raise
+
+        raise ValueError('Cannot do work in less than one attempt.')
 
     @contextmanager
     def scope(self) -> Iterator[UnitOfWork]:
-        current_unit = UnitOfWork(self._store)
+        current_unit = UnitOfWork(self._store, self._locks)
 
         current_unit.begin()
         try:
@@ -76,3 +141,106 @@ class WorkManager:
             raise
         else:
             current_unit.commit()
+
+
+class AsyncUnitOfWork:
+    """The asynchronous counterpart of UnitOfWork, which constructs
+    asynchronous repositories, e.g. AsyncInMemoryRepository. Generally it
+    will be used via the AsyncWorkManager class.
+
+    Its session has no LockTable, so it never waits for other units of work
+    and always reads from the snapshot it began with. One which changes
+    records that another has committed since raises WriteConflict.
+
+    If the store has a WriteAheadLog, commit waits for the log in another
+    thread, so the event loop carries on with other units of work in the
+    meantime and their commits can share a sync of the log.
+
+    """
+
+    def __init__(self, store: MemoryStore):
+        self._factories: Dict[AsyncRepositoryFactory, AsyncRepository] = {}
+        self._store: StoreSession = store.session()
+        self._durable = store.durable
+
+    def get(self, factory: AsyncRepositoryFactory) -> AsyncRepository:
+        try:
+            return self._factories[factory]
+        except KeyError:
+            self._factories[factory] = repo = factory(self._store)
+            return repo
+
+    @property
+    def writes(self) -> int:
+        """The number of records written to the store by this unit of
+        work.
+
+        """
+
+        return self._store.writes
+
+    async def begin(self) -> None:
+        self._store.begin()
+
+    async def commit(self) -> None:
+        if self._durable:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._store.commit)
+        else:
+            self._store.commit()
+
+    async def rollback(self) -> None:
+        self._store.rollback()
+
+
+class AsyncWorkManager:
+    """The asynchronous counterpart of WorkManager, for running units of work
+    on an event loop:
+
+    >>> manager = AsyncWorkManager(store)
+    >>> async with manager.scope() as SCOPE:
+    >>>     ...
+
+    Any number of units of work may be in progress at once. Units of work
+    which change the same records are not locked against each other, as
+    waiting for a lock would block the event loop, so the one to commit
+    second raises WriteConflict and should be retried, e.g. with run.
+
+    """
+
+    def __init__(self, store):
+        self._store = store
+
+    def unit(self) -> AsyncUnitOfWork:
+        return AsyncUnitOfWork(self._store)
+
+    async def run(self,
+                  work: Callable[[AsyncUnitOfWork], Awaitable[T]],
+                  attempts: int = 10) -> T:
+        """Do some work in a scope, trying it again in a new scope if it
+        raises WriteConflict. See WorkManager.run.
+
+        """
+
+        for attempt in range(1, attempts + 1):
+            try:
+                async with self.scope() as unit:
+                    return await work(unit)
+            except WriteConflict:
+                if attempt == attempts:
+                    raise
+
+        raise ValueError('Cannot do work in less than one attempt.')
+
+    @asynccontextmanager
+    async def scope(self) -> AsyncIterator[AsyncUnitOfWork]:
+        current_unit = AsyncUnitOfWork(self._store)
+
+        await current_unit.begin()
+        try:
+            yield current_unit
+        except Exception:
+            await current_unit.rollback()
+            raise
+        else:
+            await current_unit.commit()
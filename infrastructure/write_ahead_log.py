@@ -0,0 +1,263 @@
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+from enum import auto, Enum
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
+
+
+# The changes made by a commit, by table and then by key. A record of None
+# marks a deleted record.
+Changes = Dict[str, Dict[Any, Any]]
+
+# Every entry in the log is framed by the length and CRC-32 of its payload.
+FRAME_HEADER = struct.Struct('>II')
+
+LOG_FILENAME = 'wal.log'
+CHECKPOINT_FILENAME = 'checkpoint'
+
+
+class SyncPolicy(Enum):
+    """An enum representing when the log is forced to disk."""
+
+    # Every commit calls fsync before it returns, one at a time, unless an
+    # fsync which began after it was appended has already covered it.
+    ALWAYS = auto()
+    # Commits wait for an fsync, but one fsync covers every commit which was
+    # waiting for it.
+    GROUP = auto()
+    # Commits are handed to the operating system but never forced to disk, so
+    # they survive the process crashing but not the machine.
+    NEVER = auto()
+
+
+def _frame(payload: bytes) -> bytes:
+    return FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def _read_frames(stream: BinaryIO) -> Iterator[Tuple[int, bytes]]:
+    """Read the entries from a log, yielding the offset after each entry and
+    its payload. Stops at the first incomplete or damaged entry.
+
+    """
+
+    offset = 0
+    while True:
+        header = stream.read(FRAME_HEADER.size)
+        if len(header) < FRAME_HEADER.size:
+            return
+
+        length, checksum = FRAME_HEADER.unpack(header)
+        payload = stream.read(length)
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            return
+
+        offset += FRAME_HEADER.size + length
+        yield offset, payload
+
+
+class WriteAheadLog:
+    """An append-only log of the changes committed to a MemoryStore, kept in
+    a directory along with the most recent checkpoint of the store.
+
+    Each commit is appended as one framed entry, numbered by a log sequence
+    number (LSN). A checkpoint is a copy of every committed record as of a
+    particular LSN. Once one is written, the log is truncated, so recovery
+    only has to replay the entries made since.
+
+    The log is written with pickle, so must only ever be read from a trusted
+    location.
+
+    Takes the following arguments:
+    - directory: The directory to keep the log and checkpoint in. It is
+      created if it does not exist.
+    - sync: A SyncPolicy describing when the log is forced to disk.
+    - group_delay: With SyncPolicy.GROUP, the number of seconds a commit waits
+      before calling fsync, to let others join it.
+    - checkpoint_interval: The number of entries after which the store should
+      write a checkpoint. If None, checkpoints are only written when asked
+      for.
+
+    """
+
+    def __init__(self,
+                 directory: str,
+                 sync: SyncPolicy = SyncPolicy.GROUP,
+                 group_delay: float = 0.0,
+                 checkpoint_interval: Optional[int] = None) -> None:
+        os.makedirs(directory, exist_ok=True)
+
+        self._directory = directory
+        self._log_path = os.path.join(directory, LOG_FILENAME)
+        self._checkpoint_path = os.path.join(directory, CHECKPOINT_FILENAME)
+        self._sync = sync
+        self._group_delay = group_delay
+        self._checkpoint_interval = checkpoint_interval
+
+        # The LSN of the last entry appended, of the last entry known to be on
+        # disk, and of the last checkpoint.
+        self._appended = 0
+        self._durable = 0
+        self._checkpointed = 0
+
+        # Guards appending to the file. The sync lock is held by whichever
+        # commit is calling fsync on behalf of the others.
+        self._append_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+        self._file: Optional[BinaryIO] = None
+
+    def recover(self) -> Iterator[Changes]:
+        """Read back the checkpoint and the entries logged after it, then
+        open the log for appending. Must be called once, before anything is
+        appended.
+
+        Yields the checkpoint, if there is one, as a single set of changes
+        followed by the changes of each entry in order.
+
+        """
+
+        if self._file is not None:
+            raise RuntimeError('The log has already been opened.')
+
+        try:
+            with open(self._checkpoint_path, 'rb') as f:
+                self._checkpointed, records = pickle.load(f)
+        except FileNotFoundError:
+            pass
+        else:
+            yield records
+
+        lsn = self._checkpointed
+        end = 0
+        try:
+            with open(self._log_path, 'rb') as f:
+                for end, payload in _read_frames(f):
+                    lsn, changes = pickle.loads(payload)
+                    # Entries from before the checkpoint are left behind if
+                    # the process stopped between writing the checkpoint and
+                    # truncating the log.
+                    if lsn > self._checkpointed:
+                        yield changes
+        except FileNotFoundError:
+            pass
+
+        self._appended = self._durable = max(lsn, self._checkpointed)
+
+        # Anything after the last intact entry was torn by a crash, and is
+        # dropped so that new entries follow on from the intact ones.
+        self._file = open(self._log_path, 'ab')
+        self._file.truncate(end)
+        self._fsync_directory()
+
+    def _fsync_directory(self) -> None:
+        descriptor = os.open(self._directory, os.O_RDONLY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+    def _open_file(self) -> BinaryIO:
+        if self._file is None:
+            raise RuntimeError('The log must be recovered before it is '
+                               'used.')
+
+        return self._file
+
+    def append(self, changes: Changes) -> int:
+        """Append the changes made by a commit to the log. The entry is not
+        necessarily on disk until sync is called, so the store can append
+        while it holds its lock and sync once it has released it.
+
+        Returns the LSN of the entry.
+
+        """
+
+        f = self._open_file()
+        with self._append_lock:
+            lsn = self._appended + 1
+            f.write(_frame(pickle.dumps((lsn, changes),
+                                        pickle.HIGHEST_PROTOCOL)))
+            self._appended = lsn
+
+            if self._sync != SyncPolicy.GROUP:
+                f.flush()
+
+        return lsn
+
+    def sync(self, lsn: int) -> None:
+        """Wait until the entry with a particular LSN is on disk. Whichever
+        waiting commit gets here first calls fsync for all of them, after
+        waiting for others to join it with SyncPolicy.GROUP.
+
+        """
+
+        if self._sync == SyncPolicy.NEVER or self._durable >= lsn:
+            return
+
+        with self._sync_lock:
+            # Another commit may have synced this entry while we waited.
+            if self._durable >= lsn:
+                return
+
+            if self._sync == SyncPolicy.GROUP and self._group_delay:
+                time.sleep(self._group_delay)
+
+            f = self._open_file()
+            with self._append_lock:
+                f.flush()
+                target = self._appended
+
+            os.fsync(f.fileno())
+            self._durable = target
+
+    def needs_checkpoint(self) -> bool:
+        return (self._checkpoint_interval is not None and
+                self._appended - self._checkpointed >=
+                self._checkpoint_interval)
+
+    def checkpoint(self, records: Changes) -> None:
+        """Write a checkpoint and truncate the log. The caller must make sure
+        nothing is appended while this happens.
+
+        Takes one argument:
+        - records: Every committed record in the store, by table and then by
+          key.
+
+        """
+
+        f = self._open_file()
+        temporary_path = self._checkpoint_path + '.tmp'
+
+        with self._sync_lock, self._append_lock:
+            lsn = self._appended
+
+            with open(temporary_path, 'wb') as checkpoint:
+                pickle.dump((lsn, records), checkpoint,
+                            pickle.HIGHEST_PROTOCOL)
+                checkpoint.flush()
+                os.fsync(checkpoint.fileno())
+
+            os.replace(temporary_path, self._checkpoint_path)
+            self._fsync_directory()
+
+            # Everything in the log is now covered by the checkpoint.
+            f.truncate(0)
+            f.seek(0)
+            os.fsync(f.fileno())
+
+            self._checkpointed = self._durable = lsn
+
+    def close(self) -> None:
+        if self._file is None:
+            return
+
+        with self._sync_lock, self._append_lock:
+            self._file.flush()
+            if self._sync != SyncPolicy.NEVER:
+                os.fsync(self._file.fileno())
+            self._durable = self._appended
+            self._file.close()
+            self._file = None
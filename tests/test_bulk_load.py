@@ -0,0 +1,99 @@
+import gc
+import threading
+import unittest
+import uuid
+
+from infrastructure import MemoryStore, RecordMode
+from infrastructure.memory_store import NotFound
+from infrastructure.query import Eq
+
+
+class FrozenBulkLoadTests(unittest.TestCase):
+
+    def setUp(self):
+        self.store = MemoryStore(record_mode=RecordMode.FROZEN)
+        self.key = uuid.uuid4()
+
+    def test_mutable_values_are_refused(self):
+        with self.assertRaises(TypeError):
+            with self.store.bulk_load() as load:
+                load.add('thing', self.key, {'id': self.key, 'tags': ['a']})
+
+        with self.assertRaises(NotFound):
+            self.store.get('thing', self.key)
+
+    def test_records_are_handed_out_copy_on_write(self):
+        with self.store.bulk_load() as load:
+            load.add('thing', self.key, {'id': self.key, 'count': 1})
+
+        record = self.store.get('thing', self.key)
+        record['count'] = 2
+
+        self.assertEqual(self.store.get('thing', self.key)['count'], 1)
+
+
+class BulkLoadTests(unittest.TestCase):
+
+    def setUp(self):
+        self.store = MemoryStore()
+        self.store.create_index('child', 'parent')
+        self.parents = [uuid.uuid4() for _ in range(10)]
+        with self.store.bulk_load() as load:
+            for key in self.parents:
+                load.add('parent', key, {'id': key, 'name': str(key)})
+
+    def children(self, collecting):
+        """Make a child record for each parent, reading the parent from
+        the store as a loader resolving a foreign key would.
+
+        """
+
+        for key in self.parents:
+            collecting.append(gc.isenabled())
+            parent = self.store.get('parent', key)
+            child = uuid.uuid4()
+            yield {'id': child, 'parent': parent['id']}
+
+    def test_records_can_be_made_by_reading_the_store(self):
+        collecting = []
+
+        def load_children():
+            with self.store.bulk_load() as load:
+                load.add_many('child', self.children(collecting))
+
+        # A load which held the store's lock while reading would never
+        # finish.
+        loader = threading.Thread(target=load_children, daemon=True)
+        loader.start()
+        loader.join(10)
+        self.assertFalse(loader.is_alive())
+
+        self.assertEqual(collecting, [gc.isenabled()] * len(self.parents))
+        for key in self.parents:
+            self.assertEqual(
+                len(list(self.store.find_keys('child',
+                                              Eq('parent', key)))),
+                1,
+            )
+
+    def test_records_are_only_visible_once_the_load_finishes(self):
+        key = uuid.uuid4()
+        with self.store.bulk_load() as load:
+            load.add('parent', key, {'id': key, 'name': 'new'})
+            with self.assertRaises(NotFound):
+                self.store.get('parent', key)
+
+        self.assertEqual(self.store.get('parent', key)['name'], 'new')
+
+    def test_gc_is_left_off_if_it_was_off(self):
+        gc.disable()
+        try:
+            with self.store.bulk_load() as load:
+                load.add('parent', uuid.uuid4(), {'name': 'new'})
+            self.assertFalse(gc.isenabled())
+        finally:
+            gc.enable()
+
+
+if __name__ == '__main__':
+    unittest.main()
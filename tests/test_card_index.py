@@ -0,0 +1,90 @@
+import unittest
+import uuid
+
+from account import (
+    AUD,
+    Card,
+    CardNumber,
+    CardSubAccount,
+    RegularAccount,
+)
+from infrastructure import InMemoryRepository, MemoryStore
+
+
+class CardIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.first = CardNumber('4000000000000001')
+        self.second = CardNumber('4000000000000002')
+        self.account = RegularAccount(owner=uuid.uuid4(), cards=[
+            Card(number=self.first), Card(number=self.second),
+        ])
+        self.account.credit(AUD(100), uuid.uuid4())
+        self.account.settle_many({t.reference for t in
+                                  self.account.default_subaccount
+                                  .transactions})
+
+    def test_card_numbers_are_hashable_values(self):
+        numbers = {self.first: 'first'}
+
+        self.assertEqual(numbers[CardNumber(self.first.value)], 'first')
+        self.assertNotIn(self.second, numbers)
+
+    def test_debits_go_to_the_subaccount_of_the_card(self):
+        self.account.debit_card(CardNumber(self.second.value), AUD(30),
+                                uuid.uuid4())
+
+        subaccount = self.account.card_subaccount(self.second)
+        self.assertEqual(subaccount.card.number, self.second)
+        self.assertEqual(subaccount.balance.pending, AUD(-30))
+        self.assertEqual(
+            self.account.card_subaccount(self.first).balance.pending,
+            AUD(0),
+        )
+
+    def test_unknown_cards_are_reported(self):
+        with self.assertRaises(ValueError):
+            self.account.debit_card(CardNumber('4000000000000003'), AUD(30),
+                                    uuid.uuid4())
+
+    def test_added_subaccounts_are_indexed(self):
+        third = CardNumber('4000000000000003')
+        self.account.add_subaccount(CardSubAccount(card=Card(number=third)))
+
+        self.assertCountEqual(self.account.card_numbers,
+                              [self.first, self.second, third])
+        self.account.debit_card(third, AUD(30), uuid.uuid4())
+        self.assertEqual(
+            self.account.card_subaccount(third).balance.pending, AUD(-30),
+        )
+
+    def test_subaccounts_with_bad_cards_are_not_added(self):
+        subaccounts = list(self.account.subaccounts)
+
+        for card in (Card(number=CardNumber(self.first.value)), Card()):
+            with self.subTest(number=card.number):
+                with self.assertRaises(ValueError):
+                    self.account.add_subaccount(CardSubAccount(card=card))
+                self.assertEqual(self.account.subaccounts, subaccounts)
+
+        self.assertCountEqual(self.account.card_numbers,
+                              [self.first, self.second])
+
+    def test_repository_finds_accounts_by_added_cards(self):
+        store = MemoryStore()
+        repository = InMemoryRepository(store)
+        repository.add(self.account)
+
+        third = CardNumber('4000000000000003')
+        account = repository.get(self.account.id)
+        account.add_subaccount(CardSubAccount(card=Card(number=third)))
+        repository.update(account)
+
+        self.assertIs(repository.find_by_card_number(third), account)
+        found = InMemoryRepository(store).find_by_card_number(third)
+        self.assertEqual(found.id, self.account.id)
+        self.assertEqual(found.card_subaccount(third).card.number, third)
+
+
+if __name__ == '__main__':
+    unittest.main()
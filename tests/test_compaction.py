@@ -0,0 +1,143 @@
+import unittest
+import uuid
+
+from account import (
+    AUD,
+    ExternalCounterparty,
+    RegularAccount,
+    TransactionSettlementService,
+)
+from infrastructure import (
+    compact_history,
+    In,
+    InMemoryRepository,
+    MemoryStore,
+    WorkManager,
+)
+from infrastructure.memory_repository import (
+    ARCHIVE_MODEL,
+    CHECKPOINT_MODEL,
+    TRANSACTION_MODEL,
+)
+
+
+class LazyRepository(InMemoryRepository):
+    lazy_transactions = True
+
+
+class CompactionTests(unittest.TestCase):
+
+    repository_class = InMemoryRepository
+
+    def setUp(self):
+        self.store = MemoryStore()
+        self.work_manager = WorkManager(self.store)
+        self.merchant = ExternalCounterparty(owner=uuid.uuid4())
+        self.customers = [RegularAccount(owner=uuid.uuid4())
+                          for _ in range(3)]
+        self.ids = [self.merchant.id] + [c.id for c in self.customers]
+
+        # Each customer has four payments from the merchant, of which the
+        # first three are settled.
+        self.pending = []
+        for i, customer in enumerate(self.customers):
+            for j in range(4):
+                reference = uuid.uuid4()
+                self.merchant.debit(AUD(i + 1), reference)
+                customer.credit(AUD(10 * j + 10), reference)
+                if j < 3:
+                    self.merchant.settle(reference)
+                    customer.settle(reference)
+                else:
+                    self.pending.append(reference)
+
+        self.repository().add_many([self.merchant] + self.customers)
+        self.balances = self.read_balances()
+
+    def compact(self, **options):
+        return compact_history(self.work_manager, self.ids,
+                               repository_factory=self.repository_class,
+                               **options)
+
+    def repository(self):
+        return self.repository_class(self.store)
+
+    def read_balances(self):
+        repository = self.repository()
+        accounts = repository.get_many(self.ids)
+        for account in accounts:
+            for subaccount in account.subaccounts:
+                self.assertEqual(subaccount.calculate_balance(),
+                                 subaccount.balance)
+        return {a.id: a.balance for a in accounts}
+
+    def subaccount_ids(self):
+        return [s.id for a in self.repository().get_many(self.ids)
+                for s in a.subaccounts]
+
+    def count(self, record_type):
+        return len(list(self.store.find(
+            record_type, In('account', self.subaccount_ids()),
+        )))
+
+    def test_balances_are_unchanged(self):
+        compacted = self.compact(batch_size=2)
+
+        self.assertEqual(compacted, 18)
+        self.assertEqual(self.read_balances(), self.balances)
+        self.assertEqual(self.count(TRANSACTION_MODEL), 6)
+        self.assertEqual(self.count(ARCHIVE_MODEL), 18)
+
+        checkpoint = self.store.get(CHECKPOINT_MODEL,
+                                    self.customers[0].default_subaccount.id)
+        self.assertEqual(checkpoint['count'], 3)
+        self.assertEqual(checkpoint['available'], AUD(60).cents)
+
+    def test_pending_transactions_still_settle(self):
+        self.compact()
+        TransactionSettlementService(self.repository()).settle_many(
+            self.pending,
+        )
+
+        balances = self.read_balances()
+        self.assertEqual(balances[self.customers[0].id].available, AUD(100))
+        self.assertEqual(balances[self.customers[0].id].pending, AUD(0))
+        self.assertEqual(balances[self.merchant.id].available, AUD(-24))
+        self.assertEqual(balances[self.merchant.id].pending, AUD(0))
+
+        # Compacting again adds the newly settled transactions to the
+        # checkpoints.
+        self.assertEqual(self.compact(), 6)
+        self.assertEqual(self.read_balances(), balances)
+        self.assertEqual(self.count(TRANSACTION_MODEL), 0)
+
+    def test_only_transactions_settled_before_the_cutoff_are_compacted(self):
+        cutoff = self.store.timestamp
+        TransactionSettlementService(self.repository()).settle_many(
+            self.pending,
+        )
+        balances = self.read_balances()
+
+        self.assertEqual(
+            self.compact(before=cutoff), 18,
+        )
+        self.assertEqual(self.read_balances(), balances)
+        self.assertEqual(self.count(TRANSACTION_MODEL), 6)
+
+    def test_history_includes_compacted_transactions(self):
+        account_id = self.customers[0].id
+        before = [t.id for t in self.repository().history(account_id)]
+        self.compact()
+
+        after = [t.id for t in self.repository().history(account_id)]
+        self.assertEqual(after, before)
+        self.assertEqual(len(after), 4)
+
+
+class LazyCompactionTests(CompactionTests):
+
+    repository_class = LazyRepository
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import os
+import tempfile
+import unittest
+import uuid
+
+from account import AUD, RegularAccount
+from account.transaction import (
+    Transaction,
+    TransactionStatus,
+    TransactionType,
+)
+from infrastructure import (
+    InMemoryRepository,
+    MappedSnapshot,
+    MemoryStore,
+    write_snapshot,
+)
+
+
+TRANSACTIONS = 100
+PAGE = 7
+
+
+def add_account(store):
+    """Add an account with pending transactions to a store, oldest first.
+
+    Returns the account and the IDs of its transactions, newest first.
+
+    """
+
+    account = RegularAccount(owner=uuid.uuid4())
+    for _ in range(TRANSACTIONS):
+        account.default_subaccount.add_transaction(Transaction(
+            reference=uuid.uuid4(),
+            amount=AUD(10),
+            type=TransactionType.CREDIT,
+            status=TransactionStatus.PENDING,
+        ))
+
+    repository = InMemoryRepository(store)
+    repository.add(account)
+
+    ids = [t.id for t in account.default_subaccount.transactions]
+    return account, ids[::-1]
+
+
+def read_history(repository, account_id, between_pages=None):
+    """Read every page of the history of an account, calling a function
+    with the number of pages read so far between them.
+
+    Returns the IDs of the transactions found, in order.
+
+    """
+
+    found = []
+    pages = 0
+    cursor = None
+    while True:
+        page = repository.history(account_id, cursor=cursor, limit=PAGE)
+        found.extend(t.id for t in page)
+        pages += 1
+
+        cursor = page.cursor
+        if cursor is None:
+            return found
+
+        if between_pages is not None:
+            between_pages(pages)
+
+
+class HistoryTests(unittest.TestCase):
+
+    def test_pages_are_in_the_order_transactions_were_added(self):
+        store = MemoryStore()
+        account, ids = add_account(store)
+
+        found = read_history(InMemoryRepository(store), account.id)
+
+        self.assertEqual(found, ids)
+
+    def test_settling_during_pagination_keeps_the_order(self):
+        store = MemoryStore()
+        account, ids = add_account(store)
+        repository = InMemoryRepository(store)
+        transactions = account.default_subaccount.transactions
+
+        def settle(pages):
+            # Settle a transaction which has already been read, one on the
+            # next page and the oldest.
+            for position in (pages * PAGE - 1, pages * PAGE,
+                             TRANSACTIONS - pages):
+                t = transactions[TRANSACTIONS - 1 - position]
+                if t.status == TransactionStatus.PENDING:
+                    account.default_subaccount.settle(t.reference)
+            repository.update(account)
+
+        found = read_history(repository, account.id, settle)
+
+        self.assertEqual(found, ids)
+        self.assertTrue(any(t.status == TransactionStatus.SETTLED
+                            for t in transactions))
+
+    def test_compacting_during_pagination_keeps_the_order(self):
+        store = MemoryStore()
+        account, ids = add_account(store)
+        repository = InMemoryRepository(store)
+        subaccount = account.default_subaccount
+        for t in subaccount.transactions[:TRANSACTIONS // 2]:
+            subaccount.settle(t.reference)
+        repository.update(account)
+
+        def compact(pages):
+            if pages == 2:
+                repository.compact([account.id])
+
+        found = read_history(repository, account.id, compact)
+
+        self.assertEqual(found, ids)
+
+    def test_pages_of_a_snapshot_are_in_order(self):
+        store = MemoryStore()
+        account, ids = add_account(store)
+        repository = InMemoryRepository(store)
+        subaccount = account.default_subaccount
+        for t in subaccount.transactions[::3]:
+            subaccount.settle(t.reference)
+        repository.update(account)
+        repository.compact([account.id])
+
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'snapshot')
+        write_snapshot(store, path)
+
+        snapshot = MappedSnapshot(path)
+        try:
+            store = MemoryStore(base=snapshot)
+            found = read_history(InMemoryRepository(store), account.id)
+        finally:
+            snapshot.close()
+            os.remove(path)
+            os.rmdir(directory)
+
+        self.assertEqual(found, ids)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import uuid
+
+from infrastructure import Eq, In, MemoryStore
+from infrastructure.query import AccessPath
+
+
+class SecondaryIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.store = MemoryStore()
+        self.store.create_index('card', 'number')
+        self.key = uuid.uuid4()
+        self.store.add('card', self.key, {'id': self.key, 'number': '1'})
+
+    def keys(self, storage, number):
+        return [key for key, _ in storage.find_keys('card',
+                                                    Eq('number', number))]
+
+    def test_lookups_use_the_index(self):
+        plan = self.store.explain('card', Eq('number', '1'))
+
+        self.assertEqual(plan.access, AccessPath.INDEX_LOOKUP)
+        self.assertEqual(plan.estimate, 1)
+        self.assertEqual(self.keys(self.store, '1'), [self.key])
+
+    def test_indexes_created_later_cover_existing_records(self):
+        key = uuid.uuid4()
+        self.store.add('account', key, {'id': key, 'colour': 'red'})
+        self.store.create_index('account', 'colour')
+
+        self.assertEqual(
+            [k for k, _ in self.store.find_keys('account',
+                                                Eq('colour', 'red'))],
+            [key],
+        )
+
+    def test_indexes_follow_updates_and_deletes(self):
+        self.store.update('card', self.key, {'id': self.key, 'number': '2'})
+
+        self.assertEqual(self.keys(self.store, '1'), [])
+        self.assertEqual(self.keys(self.store, '2'), [self.key])
+
+        self.store.delete('card', self.key)
+
+        self.assertEqual(self.keys(self.store, '2'), [])
+        self.assertEqual(
+            list(self.store.find('card', In('number', ['1', '2']))), [],
+        )
+
+    def test_sessions_find_their_own_writes_until_rollback(self):
+        session = self.store.session()
+        session.begin()
+        key = uuid.uuid4()
+        session.add('card', key, {'id': key, 'number': '1'})
+        session.update('card', self.key, {'id': self.key, 'number': '3'})
+
+        self.assertEqual(self.keys(session, '1'), [key])
+        self.assertEqual(self.keys(session, '3'), [self.key])
+        self.assertEqual(self.keys(self.store, '1'), [self.key])
+
+        session.rollback()
+
+        self.assertEqual(self.keys(self.store, '1'), [self.key])
+        self.assertEqual(self.keys(self.store, '3'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
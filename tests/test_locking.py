@@ -0,0 +1,121 @@
+import functools
+import unittest
+import uuid
+
+from account import AUD, RegularAccount
+from infrastructure import (
+    AggregateCache,
+    InMemoryRepository,
+    LockTable,
+    MemoryStore,
+    WorkManager,
+    WriteConflict,
+)
+
+
+class LockingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.store = MemoryStore()
+        self.locks = LockTable()
+        self.first, self.second = uuid.uuid4(), uuid.uuid4()
+        for key in (self.first, self.second):
+            self.store.add('thing', key, {'id': key, 'count': 0})
+
+    def increment(self, key):
+        """Commit a change to a record from another session."""
+
+        session = self.store.session(self.locks)
+        session.begin()
+        record = session.get('thing', key)
+        record['count'] += 1
+        session.update('thing', key, record)
+        session.commit()
+
+    def test_records_read_before_locking_are_checked(self):
+        session = self.store.session(self.locks)
+        session.begin()
+        record = session.get('thing', self.first)
+
+        # Another unit of work changes the record, and then locking moves
+        # the snapshot past that change.
+        self.increment(self.first)
+        session.lock([self.second])
+
+        record['count'] += 1
+        session.update('thing', self.first, record)
+        with self.assertRaises(WriteConflict):
+            session.commit()
+
+        self.assertEqual(self.store.get('thing', self.first)['count'], 1)
+
+    def test_records_read_after_locking_are_current(self):
+        session = self.store.session(self.locks)
+        session.begin()
+
+        self.increment(self.first)
+        session.lock([self.first])
+
+        record = session.get('thing', self.first)
+        self.assertEqual(record['count'], 1)
+        record['count'] += 1
+        session.update('thing', self.first, record)
+        session.commit()
+
+        self.assertEqual(self.store.get('thing', self.first)['count'], 2)
+
+    def test_records_written_without_reading_are_checked(self):
+        session = self.store.session(self.locks)
+        session.begin()
+
+        self.increment(self.first)
+        session.lock([self.second])
+
+        session.update('thing', self.first, {'id': self.first, 'count': 5})
+        with self.assertRaises(WriteConflict):
+            session.commit()
+
+
+class CachedAggregateLockingTests(unittest.TestCase):
+
+    def test_cached_aggregates_read_after_locking_commit(self):
+        store = MemoryStore()
+        cache = AggregateCache(store)
+        repository = functools.partial(InMemoryRepository, cache=cache)
+        work_manager = WorkManager(store, LockTable())
+
+        account = RegularAccount(owner=uuid.uuid4())
+        InMemoryRepository(store).add(account)
+
+        # This unit of work begins before the account changes.
+        unit = work_manager.unit()
+        unit.begin()
+
+        with work_manager.scope() as other:
+            changed = other.get(repository).get(account.id)
+            changed.credit(AUD(10), uuid.uuid4())
+            other.get(repository).update(changed)
+
+        # Another unit of work caches the changed account.
+        with work_manager.scope() as other:
+            other.get(repository).get(account.id)
+        hits = cache.stats().hits
+
+        # Loading the account locks it, moving the snapshot past the
+        # change, and it is then found in the cache.
+        loaded = unit.get(repository).get(account.id)
+        self.assertEqual(cache.stats().hits, hits + 1)
+        self.assertEqual(loaded.balance.pending, AUD(10))
+
+        loaded.credit(AUD(5), uuid.uuid4())
+        unit.get(repository).update(loaded)
+        unit.commit()
+
+        self.assertEqual(
+            InMemoryRepository(store).get(account.id).balance.pending,
+            AUD(15),
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
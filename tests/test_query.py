@@ -0,0 +1,88 @@
+import unittest
+import uuid
+
+from infrastructure import And, Eq, In, MemoryStore, Range
+from infrastructure.query import AccessPath
+
+
+class QueryPlanningTests(unittest.TestCase):
+
+    def setUp(self):
+        self.store = MemoryStore()
+        self.store.create_index('thing', 'group')
+        self.groups = [uuid.uuid4(), uuid.uuid4()]
+        self.keys = {}
+        for order in range(50):
+            for group in self.groups:
+                key = uuid.uuid4()
+                self.keys[(group, order)] = key
+                self.store.add('thing', key, {'id': key, 'group': group,
+                                              'order': order})
+
+    def orders(self, query):
+        return sorted(r['order'] for r in self.store.find('thing', query))
+
+    def test_eq_uses_the_index(self):
+        plan = self.store.explain('thing', Eq('group', self.groups[0]))
+
+        self.assertEqual(plan.access, AccessPath.INDEX_LOOKUP)
+        self.assertEqual(plan.estimate, 50)
+
+    def test_ranges_without_an_ordered_index_are_filters(self):
+        query = And(Eq('group', self.groups[0]), Range('order', 10, 14))
+        plan = self.store.explain('thing', query)
+
+        self.assertEqual(plan.access, AccessPath.INDEX_LOOKUP)
+        self.assertEqual(self.orders(query), [10, 11, 12, 13, 14])
+
+        plan = self.store.explain('thing', Range('order', 10, 14))
+        self.assertEqual(plan.access, AccessPath.SCAN)
+
+    def test_ranges_use_an_ordered_index(self):
+        self.store.create_ordered_index('thing', 'group', 'order')
+        query = And(Eq('group', self.groups[0]), Range('order', 10, 14))
+
+        plan = self.store.explain('thing', query)
+
+        self.assertEqual(plan.access, AccessPath.RANGE_LOOKUP)
+        self.assertEqual(plan.estimate, 5)
+        self.assertEqual(self.orders(query), [10, 11, 12, 13, 14])
+
+        query = And(In('group', self.groups), Range('order', upper=2))
+        self.assertEqual(self.store.explain('thing', query).access,
+                         AccessPath.RANGE_LOOKUP)
+        self.assertEqual(self.orders(query), [0, 0, 1, 1, 2, 2])
+
+    def test_range_lookups_see_the_versions_the_session_reads(self):
+        self.store.create_ordered_index('thing', 'group', 'order')
+        group = self.groups[0]
+        query = And(Eq('group', group), Range('order', 10, 14))
+
+        # Moving a record out of the range leaves its old entry in the
+        # index while a snapshot can still see it.
+        reader = self.store.session()
+        reader.begin()
+        moved = self.keys[(group, 12)]
+        self.store.update('thing', moved, {'id': moved, 'group': group,
+                                           'order': 100})
+        self.assertEqual(self.orders(query), [10, 11, 13, 14])
+        self.assertEqual(
+            sorted(r['order'] for r in reader.find('thing', query)),
+            [10, 11, 12, 13, 14],
+        )
+        reader.rollback()
+
+        # A session's own writes are found too.
+        writer = self.store.session()
+        writer.begin()
+        key = uuid.uuid4()
+        writer.add('thing', key, {'id': key, 'group': group, 'order': 12})
+        self.assertEqual(
+            sorted(r['order'] for r in writer.find('thing', query)),
+            [10, 11, 12, 13, 14],
+        )
+        writer.rollback()
+
+
+if __name__ == '__main__':
+    unittest.main()
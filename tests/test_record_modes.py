@@ -0,0 +1,79 @@
+import unittest
+import uuid
+
+from infrastructure import MemoryStore, RecordMode
+from infrastructure.memory_store import CopyOnWriteRecord, register_immutable
+
+
+class Colour:
+    """A value type which cannot be modified once made."""
+
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        object.__setattr__(self, 'name', name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Colours cannot be changed.')
+
+
+register_immutable(Colour)
+
+
+class FrozenRecordTests(unittest.TestCase):
+
+    def setUp(self):
+        self.store = MemoryStore(record_mode=RecordMode.FROZEN)
+        self.key = uuid.uuid4()
+        self.written = {'id': self.key, 'count': 1}
+        self.store.add('thing', self.key, self.written)
+
+    def test_records_are_handed_out_copy_on_write(self):
+        first = self.store.get('thing', self.key)
+        second = self.store.get('thing', self.key)
+
+        self.assertIsInstance(first, CopyOnWriteRecord)
+        first['count'] = 2
+        del first['id']
+
+        self.assertEqual(dict(first), {'count': 2})
+        self.assertEqual(second['count'], 1)
+        self.assertEqual(self.store.get('thing', self.key)['count'], 1)
+
+    def test_records_are_frozen_when_written(self):
+        self.written['count'] = 5
+
+        self.assertEqual(self.store.get('thing', self.key)['count'], 1)
+
+    def test_mutable_values_are_refused(self):
+        key = uuid.uuid4()
+        with self.assertRaises(TypeError):
+            self.store.add('thing', key, {'id': key, 'tags': ['a']})
+        with self.assertRaises(TypeError):
+            self.store.add('thing', key, {'id': key, 'tags': ('a', [])})
+
+    def test_registered_types_are_immutable(self):
+        key = uuid.uuid4()
+        self.store.add('thing', key, {'id': key, 'colour': Colour('red'),
+                                      'tags': ('a', 'b')})
+
+        self.assertEqual(self.store.get('thing', key)['colour'].name, 'red')
+
+
+class CopiedRecordTests(unittest.TestCase):
+
+    def test_mutable_values_are_copied(self):
+        store = MemoryStore()
+        key = uuid.uuid4()
+        written = {'id': key, 'tags': ['a']}
+        store.add('thing', key, written)
+        written['tags'].append('b')
+
+        read = store.get('thing', key)
+        read['tags'].append('c')
+
+        self.assertEqual(store.get('thing', key)['tags'], ['a'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+import uuid
+
+from account import AUD, RegularAccount
+from account.transaction import (
+    Transaction,
+    TransactionStatus,
+    TransactionType,
+)
+from infrastructure import InMemoryRepository, MemoryStore, report_balances
+
+try:
+    import numpy
+except ImportError:
+    numpy = None  # type: ignore
+
+
+@unittest.skipIf(numpy is None, 'Reporting needs NumPy.')
+class ReportingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.store = MemoryStore()
+        self.accounts = []
+        for cents in (100, 200, 300):
+            account = RegularAccount(owner=uuid.uuid4())
+            account.default_subaccount.add_transaction(Transaction(
+                reference=uuid.uuid4(),
+                amount=AUD.from_cents(cents),
+                type=TransactionType.CREDIT,
+                status=TransactionStatus.SETTLED,
+            ))
+            self.accounts.append(account)
+        InMemoryRepository(self.store).add_many(self.accounts)
+
+    def test_balances(self):
+        report = report_balances(self.store)
+
+        self.assertEqual(
+            dict(report.items()),
+            {a.id: a.default_subaccount.calculate_balance()
+             for a in self.accounts},
+        )
+        self.assertEqual(len(report.orphans), 0)
+
+    def test_subaccounts_without_accounts_are_reported_separately(self):
+        missing = self.accounts[1]
+        self.store.delete('account', missing.id)
+
+        report = report_balances(self.store)
+
+        self.assertNotIn(missing.id, report)
+        self.assertEqual(len(report), 2)
+        self.assertEqual(
+            dict(report.orphans.items()),
+            {missing.default_subaccount.id:
+             missing.default_subaccount.calculate_balance()},
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+import uuid
+
+from account import AUD, Card, CardNumber, ExternalCounterparty, RegularAccount
+from account.transaction import (
+    Transaction,
+    TransactionStatus,
+    TransactionType,
+)
+from infrastructure import (
+    InMemoryRepository,
+    MemoryStore,
+    TransferScheduler,
+    WorkManager,
+)
+
+
+def account_with(amount, cards=()):
+    account = RegularAccount(owner=uuid.uuid4(), cards=list(cards))
+    if amount:
+        account.default_subaccount.add_transaction(Transaction(
+            reference=uuid.uuid4(),
+            amount=amount,
+            type=TransactionType.CREDIT,
+            status=TransactionStatus.SETTLED,
+        ))
+    return account
+
+
+class TransferSchedulerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.store = MemoryStore()
+        self.work_manager = WorkManager(self.store)
+
+    def add(self, *accounts):
+        InMemoryRepository(self.store).add_many(accounts)
+
+    def balance(self, account_id):
+        return InMemoryRepository(self.store).get(account_id) \
+            .balance.available
+
+    def test_operations_on_an_account_run_in_order(self):
+        # Only the first account has money, which each transfer passes on
+        # to the next, so every transfer fails unless the one before it
+        # has already run, in an earlier wave.
+        chain = [account_with(AUD(10))] + [account_with(None)
+                                           for _ in range(20)]
+        self.add(*chain)
+
+        with TransferScheduler(self.work_manager, workers=4) as scheduler:
+            futures = [scheduler.transfer(a.id, b.id, AUD(10))
+                       for a, b in zip(chain, chain[1:])]
+
+        for future in futures:
+            self.assertIsNone(future.result())
+        self.assertEqual(self.balance(chain[-1].id), AUD(10))
+        self.assertEqual(self.balance(chain[0].id), AUD(0))
+
+    def test_operations_on_an_account_never_share_a_wave(self):
+        source = account_with(AUD(100))
+        destinations = [account_with(None) for _ in range(10)]
+        self.add(source, *destinations)
+
+        with TransferScheduler(self.work_manager, workers=4) as scheduler:
+            for destination in destinations:
+                scheduler.transfer(source.id, destination.id, AUD(1))
+            self.assertTrue(scheduler.drain(10))
+            stats = scheduler.stats()
+
+        self.assertEqual(stats.operations, 10)
+        self.assertEqual(stats.waves, 10)
+        self.assertEqual(stats.max_wave_size, 1)
+        self.assertEqual(self.balance(source.id), AUD(90))
+
+    def test_drain_and_close_run_the_queued_operations(self):
+        source = account_with(AUD(100))
+        destination = account_with(None)
+        self.add(source, destination)
+
+        scheduler = TransferScheduler(self.work_manager)
+        first = [scheduler.transfer(source.id, destination.id, AUD(1))
+                 for _ in range(5)]
+        self.assertTrue(scheduler.drain(10))
+        self.assertTrue(all(f.done() for f in first))
+        self.assertEqual(scheduler.stats().queue_depth, 0)
+
+        second = [scheduler.transfer(source.id, destination.id, AUD(1))
+                  for _ in range(5)]
+        scheduler.close()
+        self.assertTrue(all(f.done() for f in second))
+        self.assertEqual(self.balance(destination.id), AUD(10))
+
+        with self.assertRaises(RuntimeError):
+            scheduler.transfer(source.id, destination.id, AUD(1))
+
+    def test_failures_reach_the_future(self):
+        number = CardNumber('4000000000000002')
+        customer = account_with(AUD(5), cards=[Card(number=number)])
+        merchant = ExternalCounterparty(owner=uuid.uuid4())
+        self.add(customer, merchant)
+
+        with TransferScheduler(self.work_manager) as scheduler:
+            unknown = scheduler.purchase(CardNumber('4000000000000010'),
+                                         merchant.id, AUD(1), uuid.uuid4())
+            overdrawn = scheduler.transfer(customer.id, merchant.id,
+                                           AUD(50))
+            bought = scheduler.purchase(number, merchant.id, AUD(1),
+                                        uuid.uuid4())
+
+        self.assertIsInstance(unknown.exception(), ValueError)
+        self.assertIsInstance(overdrawn.exception(),
+                              RegularAccount.InsufficientBalance)
+        self.assertIsNone(bought.result())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+import uuid
+
+from account import (
+    AUD,
+    ExternalCounterparty,
+    RegularAccount,
+    TransactionSettlementService,
+)
+from infrastructure import InMemoryRepository, MemoryStore
+
+
+class LazyRepository(InMemoryRepository):
+    lazy_transactions = True
+
+
+class SettleManyTests(unittest.TestCase):
+
+    repository_class = InMemoryRepository
+
+    def setUp(self):
+        self.store = MemoryStore()
+        self.merchant = ExternalCounterparty(owner=uuid.uuid4())
+        self.customers = [RegularAccount(owner=uuid.uuid4())
+                          for _ in range(3)]
+
+        # Each customer has three pending payments from the merchant.
+        self.references = {}
+        for customer in self.customers:
+            self.references[customer.id] = []
+            for _ in range(3):
+                reference = uuid.uuid4()
+                self.merchant.debit(AUD(10), reference)
+                customer.credit(AUD(10), reference)
+                self.references[customer.id].append(reference)
+
+        self.repository_class(self.store).add_many(
+            [self.merchant] + self.customers,
+        )
+
+    def service(self):
+        return TransactionSettlementService(self.repository_class(self.store))
+
+    def balance(self, account_id):
+        return self.repository_class(self.store).get(account_id).balance
+
+    def test_transactions_are_settled(self):
+        first, second, third = (self.references[c.id]
+                                for c in self.customers)
+        self.service().settle_many(first + second[:1])
+
+        self.assertEqual(self.balance(self.customers[0].id).available,
+                         AUD(30))
+        self.assertEqual(self.balance(self.customers[0].id).pending, AUD(0))
+        self.assertEqual(self.balance(self.customers[1].id).available,
+                         AUD(10))
+        self.assertEqual(self.balance(self.customers[1].id).pending, AUD(20))
+        self.assertEqual(self.balance(self.customers[2].id).available,
+                         AUD(0))
+        self.assertEqual(self.balance(self.merchant.id).available, AUD(-40))
+        self.assertEqual(self.balance(self.merchant.id).pending, AUD(-50))
+
+        # The rest can still be settled one at a time.
+        service = self.service()
+        for reference in second[1:] + third:
+            service.settle_transaction(reference)
+        self.assertEqual(self.balance(self.merchant.id).available, AUD(-90))
+        self.assertEqual(self.balance(self.merchant.id).pending, AUD(0))
+
+    def test_settled_transactions_are_stored(self):
+        references = set(self.references[self.customers[0].id])
+        self.service().settle_many(references)
+
+        account = self.repository_class(self.store).get(
+            self.customers[0].id,
+        )
+        self.assertEqual(account.default_subaccount.calculate_balance(),
+                         account.balance)
+
+    def test_unknown_references_are_refused(self):
+        known = self.references[self.customers[0].id]
+        for references in ([uuid.uuid4()] + known, [None] + known):
+            with self.subTest(references=references[0]):
+                with self.assertRaises(ValueError):
+                    self.service().settle_many(references)
+
+        # Nothing was settled.
+        self.assertEqual(self.balance(self.customers[0].id).pending, AUD(30))
+
+    def test_settling_twice_is_refused(self):
+        references = self.references[self.customers[0].id]
+        self.service().settle_many(references)
+
+        with self.assertRaises(RuntimeError):
+            self.service().settle_many(references)
+
+
+class LazySettleManyTests(SettleManyTests):
+
+    repository_class = LazyRepository
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import multiprocessing
+import unittest
+import uuid
+
+from account import AUD, Card, CardNumber, CardSubAccount, RegularAccount
+from account.transaction import (
+    Transaction,
+    TransactionStatus,
+    TransactionType,
+)
+from infrastructure import AccountShards, MemoryStore, WriteConflict
+
+
+def funded_account(shards, shard):
+    """Create an account with $1000 which belongs to a particular shard."""
+
+    while True:
+        account = RegularAccount(owner=uuid.uuid4())
+        if shards.shard(account.id) == shard:
+            break
+
+    account.default_subaccount.add_transaction(Transaction(
+        reference=uuid.uuid4(),
+        amount=AUD(1000),
+        type=TransactionType.CREDIT,
+        status=TransactionStatus.SETTLED,
+    ))
+    return account
+
+
+class ShardingTests(unittest.TestCase):
+
+    def test_cards_added_by_update_can_be_found(self):
+        with AccountShards(2) as shards:
+            account = funded_account(shards, 1)
+            shards.add_many([account])
+
+            number = CardNumber('4000000000000002')
+            account = shards.get(account.id)
+            account.add_subaccount(CardSubAccount(card=Card(number=number)))
+            shards.update(account)
+
+            self.assertEqual(shards.find_by_card_number(number).id,
+                             account.id)
+
+    def test_update_refuses_to_undo_a_transfer(self):
+        with AccountShards(2) as shards:
+            source = funded_account(shards, 0)
+            destination = funded_account(shards, 1)
+            shards.add_many([source, destination])
+
+            stale = shards.get(destination.id)
+            shards.transfer_many([(source.id, destination.id, AUD(100))])
+
+            stale.add_subaccount(CardSubAccount(
+                card=Card(number=CardNumber('4000000000000002')),
+            ))
+            with self.assertRaises(WriteConflict):
+                shards.update(stale)
+
+            current = shards.get(destination.id)
+            self.assertEqual(current.balance.available, AUD(1100))
+            self.assertEqual(
+                current.default_subaccount.calculate_balance(),
+                current.default_subaccount.balance,
+            )
+
+            # Once read again, the account can be updated.
+            current.add_subaccount(CardSubAccount(
+                card=Card(number=CardNumber('4000000000000002')),
+            ))
+            shards.update(current)
+            self.assertEqual(shards.get(destination.id).balance.available,
+                             AUD(1100))
+
+    @unittest.skipUnless(multiprocessing.get_start_method() == 'fork',
+                         'The failure is injected into forked workers.')
+    def test_failed_commits_are_retried_once(self):
+        # Each worker fails the first commit with changes that it makes.
+        original = MemoryStore._commit
+        failures = [RuntimeError('The commit failed.')]
+
+        def failing_commit(store, *args):
+            if failures:
+                raise failures.pop()
+            return original(store, *args)
+
+        MemoryStore._commit = failing_commit
+        try:
+            shards = AccountShards(2)
+        finally:
+            MemoryStore._commit = original
+
+        with shards:
+            source = funded_account(shards, 0)
+            destination = funded_account(shards, 1)
+            shards.add_many([source, destination])
+
+            results = shards.transfer_many([
+                (source.id, destination.id, AUD(100)),
+            ])
+            self.assertEqual(results, [None])
+
+            # Reading the accounts retries the commits first, and reading
+            # them again does not commit them twice.
+            for _ in range(2):
+                source, destination = shards.get_many([source.id,
+                                                       destination.id])
+                self.assertEqual(source.balance.available, AUD(900))
+                self.assertEqual(destination.balance.available, AUD(1100))
+
+            shards.transfer(destination.id, source.id, AUD(50))
+            source, destination = shards.get_many([source.id,
+                                                   destination.id])
+            self.assertEqual(source.balance.available, AUD(950))
+            self.assertEqual(destination.balance.available, AUD(1050))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+import uuid
+
+from infrastructure import Eq, MemoryStore, WriteConflict
+from infrastructure.memory_store import NotFound
+
+
+class SnapshotIsolationTests(unittest.TestCase):
+
+    def setUp(self):
+        self.store = MemoryStore()
+        self.store.create_index('thing', 'group')
+        self.key = uuid.uuid4()
+        self.store.add('thing', self.key, {'id': self.key, 'group': 'a',
+                                           'count': 0})
+
+    def session(self):
+        session = self.store.session()
+        session.begin()
+        return session
+
+    def test_sessions_read_their_snapshot(self):
+        session = self.session()
+        self.store.update('thing', self.key, {'id': self.key, 'group': 'b',
+                                              'count': 1})
+        added = uuid.uuid4()
+        self.store.add('thing', added, {'id': added, 'group': 'a',
+                                        'count': 0})
+
+        self.assertEqual(session.get('thing', self.key)['count'], 0)
+        self.assertEqual(
+            [k for k, _ in session.find_keys('thing', Eq('group', 'a'))],
+            [self.key],
+        )
+        with self.assertRaises(NotFound):
+            session.get('thing', added)
+
+        session.rollback()
+        self.assertEqual(self.store.get('thing', self.key)['count'], 1)
+
+    def test_first_committer_wins(self):
+        first, second = self.session(), self.session()
+        for session, count in ((first, 1), (second, 2)):
+            record = session.get('thing', self.key)
+            record['count'] = count
+            session.update('thing', self.key, record)
+
+        first.commit()
+        with self.assertRaises(WriteConflict):
+            second.commit()
+
+        self.assertEqual(self.store.get('thing', self.key)['count'], 1)
+
+    def test_writes_to_other_records_do_not_conflict(self):
+        other = uuid.uuid4()
+        self.store.add('thing', other, {'id': other, 'group': 'a',
+                                        'count': 0})
+        first, second = self.session(), self.session()
+        first.update('thing', self.key, {'id': self.key, 'group': 'a',
+                                         'count': 1})
+        second.update('thing', other, {'id': other, 'group': 'a',
+                                       'count': 1})
+
+        first.commit()
+        second.commit()
+
+        self.assertEqual(self.store.get('thing', other)['count'], 1)
+
+    def test_deletes_conflict_and_stay_visible_to_older_snapshots(self):
+        reader, writer = self.session(), self.session()
+        self.store.delete('thing', self.key)
+
+        self.assertEqual(reader.get('thing', self.key)['count'], 0)
+        with self.assertRaises(NotFound):
+            self.store.get('thing', self.key)
+
+        writer.update('thing', self.key, {'id': self.key, 'group': 'a',
+                                          'count': 1})
+        with self.assertRaises(WriteConflict):
+            writer.commit()
+        reader.rollback()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import copy
+import unittest
+import uuid
+from unittest import mock
+
+from account import (
+    AUD,
+    RegularAccount,
+    RegularSubAccount,
+    Transaction,
+    TransactionColumns,
+)
+from account.transaction import TransactionStatus, TransactionType
+from infrastructure import InMemoryRepository, MemoryStore
+
+
+def make_transactions(count):
+    """Make transactions with a mix of types and statuses."""
+
+    return [
+        Transaction(
+            reference=uuid.uuid4(),
+            amount=AUD.from_cents(100 + i),
+            type=TransactionType.DEBIT if i % 3 else TransactionType.CREDIT,
+            status=(TransactionStatus.SETTLED if i % 2
+                    else TransactionStatus.PENDING),
+        )
+        for i in range(count)
+    ]
+
+
+def attributes(transaction):
+    return (transaction.id, transaction.reference, transaction.amount,
+            transaction.type, transaction.status)
+
+
+class TransactionColumnsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.transactions = make_transactions(10)
+        self.columns = TransactionColumns(self.transactions)
+
+    def test_rows_match_the_transactions(self):
+        self.assertEqual(len(self.columns), len(self.transactions))
+        self.assertEqual([attributes(t) for t in self.columns],
+                         [attributes(t) for t in self.transactions])
+        self.assertEqual(attributes(self.columns[-1]),
+                         attributes(self.transactions[-1]))
+        self.assertEqual([attributes(t) for t in self.columns[2:8:3]],
+                         [attributes(t) for t in self.transactions[2:8:3]])
+
+        with self.assertRaises(IndexError):
+            self.columns[len(self.transactions)]
+
+    def test_balance_matches_the_transactions(self):
+        subaccount = RegularSubAccount(transactions=self.transactions)
+
+        self.assertEqual(self.columns.balance(),
+                         subaccount.calculate_balance())
+
+    def test_settling_a_view_settles_the_row(self):
+        pending = self.transactions[0]
+        view = self.columns[0]
+        view.settle()
+
+        self.assertEqual(self.columns[0].status, TransactionStatus.SETTLED)
+        self.assertEqual(self.columns.balance().pending,
+                         RegularSubAccount(transactions=self.transactions)
+                         .calculate_balance().pending - pending.amount)
+
+    def test_copies_are_detached(self):
+        transaction = copy.copy(self.columns[0])
+        columns = copy.deepcopy(self.columns)
+        self.columns[0].settle()
+
+        self.assertNotIsInstance(transaction, type(self.columns[0]))
+        self.assertEqual(transaction.status, TransactionStatus.PENDING)
+        self.assertEqual(columns[0].status, TransactionStatus.PENDING)
+
+    def test_references_are_found(self):
+        reference = self.transactions[4].reference
+        self.columns.append(Transaction(
+            reference=reference, amount=AUD(1), type=TransactionType.CREDIT,
+        ))
+
+        self.assertEqual(list(self.columns.rows_with_reference(reference)),
+                         [4, len(self.transactions)])
+        self.assertEqual(list(self.columns.rows_with_reference(uuid.uuid4())),
+                         [])
+
+    def test_unaligned_matches_are_not_references(self):
+        # The second half of one reference and the first half of the next
+        # make up a reference which no transaction has.
+        first, second = (t.reference.bytes for t in self.transactions[:2])
+        straddling = uuid.UUID(bytes=first[8:] + second[:8])
+
+        self.assertEqual(list(self.columns.rows_with_reference(straddling)),
+                         [])
+
+    def test_many_references_are_found(self):
+        transactions = make_transactions(200)
+        columns = TransactionColumns(transactions)
+        wanted = {t.reference for t in transactions[::2]}
+
+        for references in (wanted, set(list(wanted)[:5])):
+            with self.subTest(references=len(references)):
+                found = {t.reference
+                         for t in columns.with_references(references)}
+                self.assertEqual(found, references)
+
+
+class CompactSubAccountTests(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(RegularSubAccount,
+                                    'compact_transactions', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.store = MemoryStore()
+        self.account = RegularAccount(owner=uuid.uuid4())
+        self.references = [uuid.uuid4() for _ in range(5)]
+        for reference in self.references:
+            self.account.credit(AUD(10), reference)
+        InMemoryRepository(self.store).add(self.account)
+
+    def test_columns_are_loaded_from_the_store(self):
+        account = InMemoryRepository(self.store).get(self.account.id)
+        transactions = account.default_subaccount.transactions
+
+        self.assertIsInstance(transactions, TransactionColumns)
+        self.assertEqual(
+            sorted(attributes(t) for t in transactions),
+            sorted(attributes(t)
+                   for t in self.account.default_subaccount.transactions),
+        )
+        self.assertEqual(account.balance, self.account.balance)
+
+    def test_settled_rows_are_saved(self):
+        repository = InMemoryRepository(self.store)
+        account = repository.get(self.account.id)
+        account.settle(self.references[0])
+        account.settle_many(set(self.references[3:]))
+        repository.update(account)
+
+        account = InMemoryRepository(self.store).get(self.account.id)
+        self.assertEqual(account.balance.available, AUD(30))
+        self.assertEqual(account.balance.pending, AUD(20))
+        self.assertEqual(
+            account.default_subaccount.calculate_balance(), account.balance,
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+import unittest
+import uuid
+
+from infrastructure import MemoryStore, SyncPolicy, WriteAheadLog
+from infrastructure.memory_store import NotFound
+from infrastructure.write_ahead_log import CHECKPOINT_FILENAME, LOG_FILENAME
+
+
+class WriteAheadLogTests(unittest.TestCase):
+
+    def setUp(self):
+        temporary = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary.cleanup)
+        self.directory = os.path.join(temporary.name, 'store')
+        self.copies = 0
+
+    def crash(self):
+        """Copy the log as it is on disk, as if the process had stopped
+        without closing it, and recover a store from the copy.
+
+        """
+
+        self.copies += 1
+        copy = '{}-{}'.format(self.directory, self.copies)
+        shutil.copytree(self.directory, copy)
+        return MemoryStore(log=WriteAheadLog(copy)), copy
+
+    def write(self, store):
+        """Make some commits, returning the keys of the records left and of
+        the one deleted.
+
+        """
+
+        kept, deleted = uuid.uuid4(), uuid.uuid4()
+        store.add('thing', kept, {'id': kept, 'count': 1})
+        store.add('thing', deleted, {'id': deleted, 'count': 1})
+
+        session = store.session()
+        session.begin()
+        session.update('thing', kept, {'id': kept, 'count': 2})
+        session.delete('thing', deleted)
+        session.commit()
+
+        return kept, deleted
+
+    def assertRecovered(self, store, kept, deleted):
+        self.assertEqual(store.get('thing', kept)['count'], 2)
+        with self.assertRaises(NotFound):
+            store.get('thing', deleted)
+
+    def test_commits_are_replayed_after_a_crash(self):
+        for policy in SyncPolicy:
+            with self.subTest(policy=policy):
+                shutil.rmtree(self.directory, ignore_errors=True)
+                store = MemoryStore(log=WriteAheadLog(self.directory,
+                                                      policy))
+                kept, deleted = self.write(store)
+
+                recovered, _ = self.crash()
+                self.assertRecovered(recovered, kept, deleted)
+
+    def test_torn_entries_are_dropped(self):
+        store = MemoryStore(log=WriteAheadLog(self.directory))
+        kept, deleted = self.write(store)
+
+        # Half of an entry, as left by a crash part way through a write.
+        with open(os.path.join(self.directory, LOG_FILENAME), 'ab') as f:
+            f.write(b'\x00\x00\x01\x00\xde\xad')
+
+        recovered, copy = self.crash()
+        self.assertRecovered(recovered, kept, deleted)
+
+        # New commits follow on from the intact entries.
+        added = uuid.uuid4()
+        recovered.add('thing', added, {'id': added, 'count': 3})
+        recovered = MemoryStore(log=WriteAheadLog(copy))
+        self.assertEqual(recovered.get('thing', added)['count'], 3)
+        self.assertRecovered(recovered, kept, deleted)
+
+    def test_checkpoints_truncate_the_log(self):
+        store = MemoryStore(log=WriteAheadLog(self.directory))
+        kept, deleted = self.write(store)
+        store.checkpoint()
+
+        self.assertEqual(
+            os.path.getsize(os.path.join(self.directory, LOG_FILENAME)), 0,
+        )
+        self.assertTrue(
+            os.path.exists(os.path.join(self.directory, CHECKPOINT_FILENAME)),
+        )
+
+        later = uuid.uuid4()
+        store.add('thing', later, {'id': later, 'count': 4})
+
+        recovered, _ = self.crash()
+        self.assertRecovered(recovered, kept, deleted)
+        self.assertEqual(recovered.get('thing', later)['count'], 4)
+
+    def test_checkpoints_are_written_every_interval(self):
+        store = MemoryStore(log=WriteAheadLog(self.directory,
+                                              checkpoint_interval=3))
+        kept, deleted = self.write(store)
+
+        # The third commit wrote a checkpoint.
+        self.assertTrue(
+            os.path.exists(os.path.join(self.directory, CHECKPOINT_FILENAME)),
+        )
+        recovered, _ = self.crash()
+        self.assertRecovered(recovered, kept, deleted)
+
+
+if __name__ == '__main__':
+    unittest.main()